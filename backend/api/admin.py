@@ -1,41 +1,98 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+import json
+import os
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, status
+from fastapi.responses import ORJSONResponse
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Optional
 
-from core import get_db
+from core import get_db, profiling
 from models.user import User
-from schemas.user import UserAdminView, UserRoleUpdate
+from schemas.image import PurgeJobResponse, RetentionPurgeRequest
+from schemas.user import AdminDashboard, UserAdminPage, UserAdminView, UserRoleUpdate
 from dependencies import require_role
+from repositories import StatsRepository, UserRepository
+from repositories import stats_repository as stats_keys
+from services import purge_service
+from services.purge_service import PurgeService
 
-router = APIRouter()
+router = APIRouter(route_class=profiling.ProfiledRoute)
 
 ALLOWED_ROLES = {'free_user', 'pro_user', 'admin'}
 
 require_admin = require_role(['admin'])
 
 
-@router.get("/users", response_model=List[UserAdminView])
-async def list_users(
+def _admin_row(user: User, aggregates: Optional[dict] = None) -> dict:
+    return {
+        "id": user.id,
+        "email": user.email,
+        "username": user.username,
+        "name": user.name,
+        "role": user.role,
+        "upload_count": user.upload_count,
+        "created_at": user.created_at.isoformat(),
+        "image_count": 0,
+        "detections_total": 0,
+        "storage_bytes": 0,
+        **(aggregates or {}),
+    }
+
+
+def _admin_view(user: User, aggregates: Optional[dict] = None) -> UserAdminView:
+    return UserAdminView(**_admin_row(user, aggregates))
+
+
+@router.get("/users", response_model=UserAdminPage)
+def list_users(
+        after_id: Optional[int] = Query(None, ge=0, description="Курсор: next_cursor предыдущей страницы"),
+        limit: int = Query(50, ge=1, le=200, description="Пользователей на странице (макс. 200)"),
+        search: Optional[str] = Query(None, description="Поиск по email или username"),
+        role: Optional[str] = Query(None, description="Фильтр по роли"),
         db: Session = Depends(get_db),
         current_user=Depends(require_admin)
 ):
-    """Список всех пользователей (только admin)."""
-    users = db.query(User).order_by(User.id).all()
-    return [
-        UserAdminView(
-            id=u.id,
-            email=u.email,
-            username=u.username,
-            name=u.name,
-            role=u.role,
-            created_at=u.created_at.isoformat()
-        )
-        for u in users
-    ]
+    """
+    Список пользователей с keyset-пагинацией и статистикой по изображениям (только admin).
+    Агрегаты страницы считаются одним GROUP BY по индексу images.user_id.
+    """
+    users = UserRepository(db).list_page(after_id=after_id, limit=limit + 1, search=search, role=role)
+    has_more = len(users) > limit
+    users = users[:limit]
+    aggregates = StatsRepository(db).user_aggregates([u.id for u in users])
+    # Словари страницы отдаются orjson без повторной валидации через UserAdminPage
+    return ORJSONResponse({
+        "items": [_admin_row(u, aggregates.get(u.id)) for u in users],
+        "limit": limit,
+        "next_cursor": users[-1].id if has_more else None,
+    })
+
+
+@router.get("/dashboard", response_model=AdminDashboard)
+def dashboard(
+        db: Session = Depends(get_db),
+        current_user=Depends(require_admin)
+):
+    """Системные счётчики из таблицы system_stats, без сканирования users и images (только admin)."""
+    repo = StatsRepository(db)
+    stats = repo.get_all()
+    updated_at = repo.last_updated()
+    return AdminDashboard(
+        users_total=stats.get(stats_keys.USERS_TOTAL, 0),
+        users_by_role={
+            key[len(stats_keys.ROLE_PREFIX):]: value
+            for key, value in stats.items() if key.startswith(stats_keys.ROLE_PREFIX) and value
+        },
+        images_total=stats.get(stats_keys.IMAGES_TOTAL, 0),
+        images_processed=stats.get(stats_keys.IMAGES_PROCESSED, 0),
+        detections_total=stats.get(stats_keys.DETECTIONS_TOTAL, 0),
+        storage_bytes=stats.get(stats_keys.STORAGE_BYTES, 0),
+        updated_at=updated_at.isoformat() if updated_at else None,
+    )
 
 
 @router.put("/users/{user_id}/role", response_model=UserAdminView)
-async def update_user_role(
+def update_user_role(
         user_id: int,
         role_data: UserRoleUpdate,
         db: Session = Depends(get_db),
@@ -55,15 +112,132 @@ async def update_user_role(
             detail="User not found"
         )
 
+    StatsRepository(db).record_role_change(user.role, role_data.role)
     user.role = role_data.role
     db.commit()
     db.refresh(user)
 
-    return UserAdminView(
-        id=user.id,
-        email=user.email,
-        username=user.username,
-        name=user.name,
-        role=user.role,
-        created_at=user.created_at.isoformat()
+    return _admin_view(user, StatsRepository(db).user_aggregates([user.id]).get(user.id))
+
+
+@router.delete("/users/{user_id}", status_code=status.HTTP_202_ACCEPTED, response_model=PurgeJobResponse)
+def delete_user(
+        user_id: int,
+        db: Session = Depends(get_db),
+        current_user=Depends(require_admin)
+):
+    """
+    Удалить пользователя со всеми изображениями, объектами S3 и refresh tokens (только admin).
+    Выполняется фоновой задачей — прогресс: GET /admin/jobs/{job_id}.
+    """
+    if user_id == current_user.id:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Cannot delete yourself"
+        )
+    if not db.query(User.id).filter(User.id == user_id).first():
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="User not found"
+        )
+
+    job = purge_service.start_job(
+        "delete_user", current_user.id, {"user_id": user_id},
+        lambda job_db, job: PurgeService.delete_user(job_db, user_id, job),
+    )
+    return job.to_dict()
+
+
+@router.post("/retention/purge", status_code=status.HTTP_202_ACCEPTED, response_model=PurgeJobResponse)
+def purge_retention(
+        payload: RetentionPurgeRequest,
+        current_user=Depends(require_admin)
+):
+    """
+    Удалить изображения старше N дней по ролям (только admin), например
+    {"days": {"free_user": 30, "pro_user": 365}}. Без days — политика из RETENTION_DAYS_<ROLE>.
+    """
+    policy = payload.days if payload.days is not None else purge_service.default_retention_days()
+    unknown = set(policy) - ALLOWED_ROLES
+    if unknown:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Invalid role. Allowed: {', '.join(ALLOWED_ROLES)}"
+        )
+    if not any(days > 0 for days in policy.values()):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Retention policy is empty"
+        )
+
+    job = purge_service.start_job(
+        "retention", current_user.id, {"days": policy},
+        lambda job_db, job: PurgeService.purge_retention(job_db, policy, job),
+    )
+    return job.to_dict()
+
+
+@router.get("/jobs", response_model=List[PurgeJobResponse])
+async def list_jobs(current_user=Depends(require_admin)):
+    """Фоновые задачи удаления этого воркера (только admin)."""
+    return [job.to_dict() for job in purge_service.list_jobs()]
+
+
+@router.get("/jobs/{job_id}", response_model=PurgeJobResponse)
+async def get_job(job_id: str, current_user=Depends(require_admin)):
+    """Прогресс фоновой задачи удаления (только admin)."""
+    job = purge_service.get_job(job_id)
+    if job is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Job not found"
+        )
+    return job.to_dict()
+
+
+@router.get("/profiles")
+async def list_profiles(current_user=Depends(require_admin)):
+    """Список сохранённых профилей медленных запросов (только admin)."""
+    return {
+        "enabled": profiling.PROFILING_ENABLED,
+        "sample_rate": profiling.PROFILING_SAMPLE_RATE,
+        "slow_ms": profiling.PROFILING_SLOW_MS,
+        "items": [profiling.summary(entry) for entry in profiling.get_profiles()],
+    }
+
+
+@router.get("/profiles/download")
+async def download_profiles(
+        clear: bool = False,
+        current_user=Depends(require_admin)
+):
+    """Скачать все профили (этапы и топ кадров стека) одним JSON-файлом (только admin)."""
+    profiles = profiling.get_profiles()
+    if clear:
+        profiling.clear_profiles()
+    return Response(
+        content=json.dumps(profiles, ensure_ascii=False, indent=2),
+        media_type="application/json",
+        headers={"Content-Disposition": 'attachment; filename="profiles.json"'},
     )
+
+
+@router.get("/runtime")
+def runtime_info(current_user=Depends(require_admin)):
+    """
+    Профиль этого воркера: потоки и оптимизации OpenCV, возможности CPU,
+    состояние хранилища — бэкенд, circuit breaker, записи только на диске (только admin).
+    """
+    from services.ai_service import ai_service
+    from services.inference_pool import inference_pool
+    from services.storage_replicator import storage_replicator
+    from services.storage_service import StorageService
+
+    ai_service.ensure_loaded()
+    return {
+        **ai_service.runtime_info(),
+        "pid": os.getpid(),
+        "inference_workers": inference_pool.workers,
+        "inference_opencv_threads": inference_pool.opencv_threads if inference_pool.enabled else None,
+        "storage": {**StorageService.status(), "local_only": storage_replicator.pending()},
+    }
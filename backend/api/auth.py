@@ -1,15 +1,18 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Request, status
 from sqlalchemy.orm import Session
 
 from core import get_db
+from core.http_cache import conditional_json
+from core.profiling import ProfiledRoute
 from services import AuthService
 from schemas.user import UserCreate, UserLogin, TokenResponse, RefreshTokenRequest
-from dependencies import get_current_user
+from dependencies import get_current_user, rate_limit_by_ip
 
-router = APIRouter()
+router = APIRouter(route_class=ProfiledRoute)
 
 
-@router.post("/register", response_model=TokenResponse, status_code=status.HTTP_201_CREATED)
+@router.post("/register", response_model=TokenResponse, status_code=status.HTTP_201_CREATED,
+             dependencies=[Depends(rate_limit_by_ip("auth"))])
 async def register(user_data: UserCreate, db: Session = Depends(get_db)):
     try:
         user = AuthService.create_user(db, user_data)
@@ -31,7 +34,7 @@ async def register(user_data: UserCreate, db: Session = Depends(get_db)):
         )
 
 
-@router.post("/login", response_model=TokenResponse)
+@router.post("/login", response_model=TokenResponse, dependencies=[Depends(rate_limit_by_ip("auth"))])
 async def login(credentials: UserLogin, db: Session = Depends(get_db)):
     user = AuthService.authenticate_user(db, credentials.email, credentials.password)
     if not user:
@@ -81,6 +84,6 @@ async def logout(data: RefreshTokenRequest, db: Session = Depends(get_db)):
 
 
 @router.get("/me")
-async def get_me(current_user=Depends(get_current_user)):
-    """Получить данные текущего пользователя."""
-    return current_user
+async def get_me(request: Request, current_user=Depends(get_current_user)):
+    """Получить данные текущего пользователя (ETag по телу, 304 при совпадении)."""
+    return conditional_json(request, current_user.model_dump())
@@ -13,12 +13,13 @@ import logging
 
 from fastapi import APIRouter, Depends, Request
 
+from core.profiling import ProfiledRoute
 from dependencies import get_current_user
 from services.geo_service import get_geo_info
 
 logger = logging.getLogger(__name__)
 
-router = APIRouter(tags=["geo"])
+router = APIRouter(tags=["geo"], route_class=ProfiledRoute)
 
 
 @router.get(
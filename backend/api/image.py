@@ -1,36 +1,80 @@
+import asyncio
 import json
 import logging
 from datetime import date
 from typing import Optional
 
-from fastapi import APIRouter, Depends, HTTPException, Query, File, UploadFile, status
+import anyio
+import orjson
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, File, Request, Response, UploadFile, status
+from fastapi.responses import ORJSONResponse, StreamingResponse
 from sqlalchemy.orm import Session
 
-from core import get_db
-from dependencies import get_current_user
-from schemas.image import ImageResponse, PaginatedImageResponse
-from schemas.user import UserResponse
-from services import ImageService
+from core import STREAM_TOKEN_EXPIRE_SECONDS, get_db
+from core.http_cache import PRIVATE_REVALIDATE, etag_matches, not_modified
+from core.profiling import ProfiledRoute
+from dependencies import get_current_user, get_stream_user, rate_limit, sparse_fields
+from schemas.image import (ImageResponse, PaginatedImageResponse, BulkDeleteRequest,
+                           BulkDeleteResponse, PurgeJobResponse, ReprocessRequest,
+                           UploadSessionCreate, UploadSessionResponse, UsageStatsResponse)
+from schemas.user import StreamTokenResponse, UserResponse
+from services import AuthService, ImageService, purge_service
+from services.idempotency import REPLAYED_HEADER, IdempotencyService, request_fingerprint
+from services.progress import PROGRESS_KEEPALIVE, Subscription, progress_broker
+from services.purge_service import PurgeService
 from services.storage_service import StorageService
+from services.upload_session_service import OFFSET_HEADER, UPLOAD_CHUNK_MAX_BYTES, UploadSessionService
 
 logger = logging.getLogger(__name__)
-router = APIRouter()
+router = APIRouter(route_class=ProfiledRoute)
 
 
 @router.post("/", response_model=ImageResponse, status_code=status.HTTP_201_CREATED)
-async def upload_image(
+def upload_image(
+        request: Request,
         file: UploadFile = File(...),
         process_type: str = Query("blur", description="Тип обработки: blur, pixelate, none"),
-        current_user: UserResponse = Depends(get_current_user),
+        upload_id: Optional[str] = Query(
+            None, max_length=64, pattern=r"^[A-Za-z0-9_-]+$",
+            description="Идентификатор загрузки для событий прогресса (GET /image/events)",
+        ),
+        idempotency_key: Optional[str] = Header(
+            None, alias="Idempotency-Key", max_length=255,
+            description="Ключ повтора: запрос с тем же ключом возвращает сохранённый результат",
+        ),
+        current_user: UserResponse = Depends(rate_limit("upload")),
         db: Session = Depends(get_db),
 ):
-    """Загрузка изображения с AI-обработкой и сохранением в S3."""
+    """
+    Загрузка изображения с AI-обработкой и сохранением в S3.
+    Синхронный обработчик: FastAPI выполняет его в пуле потоков,
+    CPU-bound обработка не блокирует event loop.
+
+    С заголовком **Idempotency-Key** повтор запроса (обрыв связи, таймаут
+    клиента) возвращает результат первого без повторной обработки и квоты —
+    с заголовком Idempotent-Replayed: true. Пока первый запрос выполняется — 409.
+    """
+    def client_disconnected() -> bool:
+        # Обработчик выполняется в пуле потоков — проверку делаем в event loop
+        return anyio.from_thread.run(request.is_disconnected)
+
+    claim = None
+    if idempotency_key:
+        claim, replay = IdempotencyService.begin(
+            db, current_user.id, idempotency_key, request_fingerprint(file.file, process_type),
+        )
+        if replay is not None:
+            return ORJSONResponse(replay, status_code=status.HTTP_201_CREATED, headers={REPLAYED_HEADER: "true"})
+
     try:
         result = ImageService.upload_image(
             file=file,
             current_user=current_user,
             db=db,
             process_type=process_type,
+            is_cancelled=client_disconnected,
+            upload_id=upload_id,
+            idempotency=claim,
         )
         return result
     except HTTPException:
@@ -43,8 +87,98 @@ async def upload_image(
         )
 
 
+@router.post("/uploads", response_model=UploadSessionResponse, status_code=status.HTTP_201_CREATED)
+def create_upload_session(
+        data: UploadSessionCreate,
+        current_user: UserResponse = Depends(rate_limit("upload")),
+        db: Session = Depends(get_db),
+):
+    """
+    Возобновляемая загрузка большого файла: создаёт сессию, части передаются
+    PUT /image/uploads/{id}?offset=N, обработка — POST /image/uploads/{id}/complete.
+    Тип, размер и квота проверяются до передачи файла.
+    """
+    return UploadSessionService.create(
+        db, current_user, data.filename, data.size, data.content_type, data.process_type,
+    )
+
+
+@router.put("/uploads/{session_id}", response_model=UploadSessionResponse)
+async def upload_chunk(
+        session_id: str,
+        request: Request,
+        offset: int = Query(..., ge=0, description="Смещение части в файле (offset из ответа сессии)"),
+        current_user: UserResponse = Depends(get_current_user),
+        db: Session = Depends(get_db),
+):
+    """
+    Очередная часть файла (тело запроса — байты, до UPLOAD_CHUNK_MAX_BYTES).
+    При offset, не совпадающем с принятым, — 409 и заголовок Upload-Offset.
+    """
+    chunk = bytearray()
+    async for data in request.stream():
+        chunk += data
+        if len(chunk) > UPLOAD_CHUNK_MAX_BYTES:
+            raise HTTPException(
+                status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                detail=f"Часть больше {UPLOAD_CHUNK_MAX_BYTES} байт",
+            )
+    # Запись с fsync и обновление сессии — в пуле потоков, не в event loop
+    result = await anyio.to_thread.run_sync(
+        UploadSessionService.append, db, session_id, current_user, offset, bytes(chunk),
+    )
+    return ORJSONResponse(result, headers={OFFSET_HEADER: str(result["offset"])})
+
+
+@router.get("/uploads/{session_id}", response_model=UploadSessionResponse)
+def get_upload_session(
+        session_id: str,
+        current_user: UserResponse = Depends(get_current_user),
+        db: Session = Depends(get_db),
+):
+    """Состояние сессии: offset — с какого байта продолжать после обрыва."""
+    result = UploadSessionService.status(db, session_id, current_user)
+    return ORJSONResponse(result, headers={OFFSET_HEADER: str(result["offset"])})
+
+
+@router.post("/uploads/{session_id}/complete", response_model=ImageResponse, status_code=status.HTTP_201_CREATED)
+def complete_upload_session(
+        session_id: str,
+        request: Request,
+        upload_id: Optional[str] = Query(
+            None, max_length=64, pattern=r"^[A-Za-z0-9_-]+$",
+            description="Идентификатор загрузки для событий прогресса (GET /image/events)",
+        ),
+        current_user: UserResponse = Depends(get_current_user),
+        db: Session = Depends(get_db),
+):
+    """
+    Обработка собранного файла — как POST /image/. Повтор после обрыва
+    возвращает то же изображение (Idempotent-Replayed: true).
+    """
+    def client_disconnected() -> bool:
+        return anyio.from_thread.run(request.is_disconnected)
+
+    try:
+        result, replayed = UploadSessionService.complete(
+            db, session_id, current_user, is_cancelled=client_disconnected, upload_id=upload_id,
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Ошибка завершения загрузки {session_id}: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Ошибка обработки изображения: {str(e)}",
+        )
+    if replayed:
+        return ORJSONResponse(result, status_code=status.HTTP_201_CREATED, headers={REPLAYED_HEADER: "true"})
+    return result
+
+
 @router.get("/", response_model=PaginatedImageResponse)
 async def get_user_images(
+        request: Request,
         search: Optional[str] = Query(None, description="Поиск по названию файла"),
         processed: Optional[bool] = Query(None, description="Фильтр: обработано (true/false)"),
         date_from: Optional[date] = Query(None, description="Дата загрузки от (YYYY-MM-DD)"),
@@ -53,11 +187,14 @@ async def get_user_images(
         sort_order: str = Query("desc", description="Направление: asc / desc"),
         page: int = Query(1, ge=1, description="Номер страницы (с 1)"),
         limit: int = Query(10, ge=1, le=100, description="Записей на странице (макс. 100)"),
+        fields: Optional[tuple] = Depends(sparse_fields(ImageResponse)),
         current_user: UserResponse = Depends(get_current_user),
         db: Session = Depends(get_db),
 ):
     """
     Список изображений с фильтрацией, поиском, сортировкой и пагинацией.
+    Ответ сериализуется orjson напрямую, без повторной валидации через response_model.
+    Weak ETag по состоянию выборки: при совпадении If-None-Match — 304 без тела.
 
     - **search**: подстрока в оригинальном имени файла
     - **processed**: true — только обработанные, false — только необработанные
@@ -65,6 +202,8 @@ async def get_user_images(
     - **sort_by**: поле сортировки
     - **sort_order**: asc или desc
     - **page / limit**: пагинация
+    - **fields**: только перечисленные поля элементов, например `fields=id,url,original_name`
+      (без `url` не подписываются ссылки S3, без `detected_objects` JSON не читается из БД)
     """
     valid_sort_fields = {"created_at", "original_name", "detected_count"}
     if sort_by not in valid_sort_fields:
@@ -83,7 +222,7 @@ async def get_user_images(
             detail="date_from не может быть позже date_to",
         )
 
-    return ImageService.get_user_images(
+    etag, content = ImageService.get_user_images(
         current_user=current_user,
         db=db,
         search=search,
@@ -94,7 +233,195 @@ async def get_user_images(
         sort_order=sort_order,
         page=page,
         limit=limit,
+        fields=fields,
+        if_none_match=request.headers.get("if-none-match"),
     )
+    if content is None:
+        return not_modified(etag)
+    return ORJSONResponse(content, headers={"ETag": etag, "Cache-Control": PRIVATE_REVALIDATE})
+
+
+@router.delete("/", response_model=BulkDeleteResponse)
+def bulk_delete_images(
+        payload: BulkDeleteRequest,
+        response: Response,
+        current_user: UserResponse = Depends(get_current_user),
+        db: Session = Depends(get_db),
+):
+    """
+    Массовое удаление изображений: по списку **ids** или по фильтрам списка
+    (**search**, **processed**, **date_from**, **date_to**; пустой фильтр — только с **all=true**).
+
+    До BULK_DELETE_SYNC_LIMIT записей удаляются сразу, иначе запускается фоновая
+    задача (202) — прогресс: GET /image/jobs/{job_id}.
+    """
+    if payload.ids is not None:
+        if len(payload.ids) > purge_service.BULK_DELETE_SYNC_LIMIT:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Не больше {purge_service.BULK_DELETE_SYNC_LIMIT} id за запрос, используйте фильтры",
+            )
+        return BulkDeleteResponse(deleted=PurgeService.delete_by_ids(db, current_user, payload.ids))
+
+    filters = payload.model_dump(include={"search", "processed", "date_from", "date_to"}, exclude_none=True)
+    if not filters and not payload.all:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Укажите ids, фильтры или all=true для удаления всех изображений",
+        )
+
+    query = ImageService.filtered_query(db, current_user, **filters)
+    if query.order_by(None).count() <= purge_service.BULK_DELETE_SYNC_LIMIT:
+        return BulkDeleteResponse(deleted=PurgeService.delete_matching(db, query))
+
+    def run(job_db: Session, job: purge_service.PurgeJob) -> None:
+        PurgeService.delete_matching(job_db, ImageService.filtered_query(job_db, current_user, **filters), job)
+
+    job = purge_service.start_job(
+        "bulk_delete", current_user.id, {key: str(value) for key, value in filters.items()}, run
+    )
+    response.status_code = status.HTTP_202_ACCEPTED
+    return BulkDeleteResponse(job=PurgeJobResponse(**job.to_dict()))
+
+
+@router.post("/events/token", response_model=StreamTokenResponse)
+def create_events_token(current_user: UserResponse = Depends(get_current_user)):
+    """
+    Токен для GET /image/events?token= (EventSource не передаёт заголовки).
+    Действует STREAM_TOKEN_EXPIRE_SECONDS и только для подписки на события.
+    """
+    return StreamTokenResponse(
+        token=AuthService.create_stream_token(current_user.email),
+        expires_in=STREAM_TOKEN_EXPIRE_SECONDS,
+    )
+
+
+@router.get("/events")
+async def progress_events(
+        request: Request,
+        current_user: UserResponse = Depends(get_stream_user),
+):
+    """
+    Server-sent events с этапами обработки загрузок пользователя:
+    stored, detecting, blurring, uploaded, done, failed.
+
+    Событие `progress` — JSON с upload_id (передаётся в POST /image/?upload_id=),
+    image_id (после done), stage и elapsed_ms. Одно соединение на пользователя:
+    новое закрывает предыдущее событием `replaced` (клиенту не нужно
+    переподключаться). Токен — заголовок Authorization или ?token= с токеном
+    из POST /image/events/token для EventSource.
+    """
+    async def stream():
+        subscription = progress_broker.subscribe(current_user.id)
+        try:
+            yield "retry: 3000\n\n"
+            while True:
+                try:
+                    event = await asyncio.wait_for(subscription.queue.get(), timeout=PROGRESS_KEEPALIVE)
+                except asyncio.TimeoutError:
+                    if await request.is_disconnected():
+                        return
+                    yield ": keep-alive\n\n"
+                    continue
+                if event is Subscription.REPLACED:
+                    yield "event: replaced\ndata: {}\n\n"
+                    return
+                yield f"event: progress\ndata: {orjson.dumps(event).decode()}\n\n"
+        finally:
+            progress_broker.unsubscribe(subscription)
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        # X-Accel-Buffering: nginx не буферизует поток
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.get("/stats", response_model=UsageStatsResponse)
+def get_usage_stats(
+        bucket: str = Query("day", description="Группировка: day, week, month"),
+        date_from: Optional[date] = Query(None, description="Начало периода (YYYY-MM-DD)"),
+        date_to: Optional[date] = Query(None, description="Конец периода (YYYY-MM-DD), по умолчанию сегодня"),
+        user_id: Optional[int] = Query(None, description="Пользователь (только admin)"),
+        all_users: bool = Query(False, description="Сводка по всем пользователям (только admin)"),
+        current_user: UserResponse = Depends(get_current_user),
+        db: Session = Depends(get_db),
+):
+    """
+    Статистика использования: загрузки, найденные объекты, объём и время
+    обработки по дням, неделям или месяцам. Читается из дневной сводки
+    usage_daily, а не из таблицы images.
+    """
+    if (user_id is not None and user_id != current_user.id) or all_users:
+        if current_user.role != "admin":
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="Статистика других пользователей доступна только администратору",
+            )
+    target_user_id = None if all_users else (user_id if user_id is not None else current_user.id)
+
+    return ImageService.get_usage_stats(
+        db=db,
+        user_id=target_user_id,
+        bucket=bucket,
+        date_from=date_from,
+        date_to=date_to,
+    )
+
+
+@router.get("/jobs/{job_id}", response_model=PurgeJobResponse)
+async def get_delete_job(
+        job_id: str,
+        current_user: UserResponse = Depends(get_current_user),
+):
+    """Прогресс фоновой задачи удаления (своей; admin — любой)."""
+    job = purge_service.get_job(job_id)
+    if job is None or (current_user.role != "admin" and job.owner_id != current_user.id):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Задача не найдена")
+    return job.to_dict()
+
+
+@router.post("/{image_id}/reprocess", response_model=ImageResponse)
+def reprocess_image(
+        image_id: int,
+        data: ReprocessRequest,
+        request: Request,
+        upload_id: Optional[str] = Query(
+            None, max_length=64, pattern=r"^[A-Za-z0-9_-]+$",
+            description="Идентификатор для событий прогресса (GET /image/events)",
+        ),
+        current_user: UserResponse = Depends(rate_limit("upload")),
+        db: Session = Depends(get_db),
+):
+    """
+    Повторная обработка без повторной загрузки: другой метод (blur, pixelate,
+    none) и/или рамки пользователя [x1, y1, x2, y2]. Сохранённые детекции
+    переиспользуются, с boxes детекция не выполняется; replace_boxes=true
+    оставляет только рамки пользователя. Квота загрузок не расходуется.
+    """
+    def client_disconnected() -> bool:
+        return anyio.from_thread.run(request.is_disconnected)
+
+    try:
+        return ImageService.reprocess_image(
+            image_id=image_id,
+            current_user=current_user,
+            db=db,
+            method=data.method,
+            boxes=data.boxes,
+            replace_boxes=data.replace_boxes,
+            is_cancelled=client_disconnected,
+            upload_id=upload_id,
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Ошибка повторной обработки изображения {image_id}: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Ошибка обработки изображения: {str(e)}",
+        )
 
 
 @router.get("/{image_id}/presigned-url")
@@ -134,10 +461,11 @@ async def get_presigned_url(
 @router.get("/{image_id}", response_model=ImageResponse)
 async def get_image(
         image_id: int,
+        request: Request,
         current_user: UserResponse = Depends(get_current_user),
         db: Session = Depends(get_db),
 ):
-    """Получение конкретного изображения по ID."""
+    """Получение конкретного изображения по ID (weak ETag по id и updated_at, 304 при совпадении)."""
     from models.image import Image
 
     query = db.query(Image).filter(Image.id == image_id)
@@ -148,8 +476,14 @@ async def get_image(
     if not image:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Изображение не найдено")
 
-    from services.image_service import _build_image_response
-    return _build_image_response(image)
+    from services.image_service import _build_image_response, image_etag
+    etag = image_etag(image)
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return not_modified(etag)
+    return ORJSONResponse(
+        _build_image_response(image),
+        headers={"ETag": etag, "Cache-Control": PRIVATE_REVALIDATE},
+    )
 
 
 @router.delete("/{image_id}")
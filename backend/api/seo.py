@@ -1,11 +1,24 @@
 
+"""
+SEO-ресурсы: robots.txt, sitemap.xml, JSON-LD.
+
+Содержимое не зависит от запроса, поэтому тела собираются один раз при
+импорте модуля (старте воркера) и отдаются из памяти с ETag и
+Cache-Control: public, max-age=SEO_CACHE_MAX_AGE.
+"""
 import os
 from datetime import date
 
-from fastapi import APIRouter
-from fastapi.responses import PlainTextResponse, Response, JSONResponse
+import orjson
+from fastapi import APIRouter, Request
+from fastapi.responses import Response
+
+from core.http_cache import CachedPayload
+from core.profiling import ProfiledRoute
+
+router = APIRouter(tags=["seo"], route_class=ProfiledRoute)
 
-router = APIRouter(tags=["seo"])
+SEO_CACHE_MAX_AGE = int(os.getenv("SEO_CACHE_MAX_AGE", "86400"))
 
 SITE_URL: str = os.getenv("SITE_URL", "http://localhost:3000")
 SITE_NAME: str = "DataCleaner"
@@ -16,8 +29,7 @@ SITE_DESCRIPTION: str = (
 
 
 # ── robots.txt (задание 3.2) ──────────────────────────────────────────────────
-@router.get("/robots.txt", response_class=PlainTextResponse, include_in_schema=False)
-async def robots_txt() -> PlainTextResponse:
+def build_robots_txt() -> str:
     """
     Правила индексации для поисковых роботов.
 
@@ -56,12 +68,11 @@ async def robots_txt() -> PlainTextResponse:
         f"# Карта сайта\n"
         f"Sitemap: {SITE_URL}/sitemap.xml\n"
     )
-    return PlainTextResponse(content=content, media_type="text/plain; charset=utf-8")
+    return content
 
 
 # ── sitemap.xml (задание 3.1) ─────────────────────────────────────────────────
-@router.get("/sitemap.xml", include_in_schema=False)
-async def sitemap_xml() -> Response:
+def build_sitemap_xml() -> str:
     """
     Карта сайта для поисковых систем.
     Включает только публичные, доступные без авторизации страницы.
@@ -69,6 +80,8 @@ async def sitemap_xml() -> Response:
     Приоритеты:
       1.0 — /        (главная)
       0.9 — /login   (вход/регистрация — ключевая страница конверсии)
+
+    lastmod — дата старта воркера.
     """
     today = date.today().isoformat()
 
@@ -96,16 +109,11 @@ async def sitemap_xml() -> Response:
 
 </urlset>"""
 
-    return Response(
-        content=content,
-        media_type="application/xml",
-        headers={"Content-Type": "application/xml; charset=utf-8"},
-    )
+    return content
 
 
 # ── JSON-LD структурированные данные (задание 3.4) ────────────────────────────
-@router.get("/structured-data.json", include_in_schema=False)
-async def structured_data() -> JSONResponse:
+def build_structured_data() -> dict:
     """
     JSON-LD разметка типа SoftwareApplication для главной страницы.
     Используется фронтендом для вставки в <script type="application/ld+json">.
@@ -161,4 +169,30 @@ async def structured_data() -> JSONResponse:
             },
         ],
     }
-    return JSONResponse(content=data)
+    return data
+
+
+_ROBOTS_TXT = CachedPayload(
+    build_robots_txt().encode("utf-8"), "text/plain; charset=utf-8", SEO_CACHE_MAX_AGE,
+)
+_SITEMAP_XML = CachedPayload(
+    build_sitemap_xml().encode("utf-8"), "application/xml; charset=utf-8", SEO_CACHE_MAX_AGE,
+)
+_STRUCTURED_DATA = CachedPayload(
+    orjson.dumps(build_structured_data()), "application/json", SEO_CACHE_MAX_AGE,
+)
+
+
+@router.get("/robots.txt", include_in_schema=False)
+async def robots_txt(request: Request) -> Response:
+    return _ROBOTS_TXT.respond(request)
+
+
+@router.get("/sitemap.xml", include_in_schema=False)
+async def sitemap_xml(request: Request) -> Response:
+    return _SITEMAP_XML.respond(request)
+
+
+@router.get("/structured-data.json", include_in_schema=False)
+async def structured_data(request: Request) -> Response:
+    return _STRUCTURED_DATA.respond(request)
@@ -0,0 +1,82 @@
+"""
+Нагрузочный бенчмарк горячих API-путей в процессе (TestClient):
+POST /image/, GET /image/, POST /auth/login.
+
+БД — временный SQLite (DATABASE_URL задаёт benchmarks/run.py). S3 — moto (если установлен) или бэкенд
+хранилища в памяти (STORAGE_BACKEND=memory), подставленный в StorageService на время прогона.
+"""
+import os
+from contextlib import contextmanager
+from typing import Dict, Iterator, List
+
+from benchmarks.corpus import CorpusItem
+from benchmarks.stats import measure, summarize
+
+
+@contextmanager
+def _s3_stand_in() -> Iterator[str]:
+    try:
+        from moto import mock_aws
+    except ImportError:
+        mock_aws = None
+
+    if mock_aws is not None:
+        os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+        with mock_aws():
+            yield "moto"
+        return
+
+    from services.storage_service import MemoryBackend, StorageService
+
+    previous = StorageService.use_backend(MemoryBackend())
+    try:
+        yield "memory"
+    finally:
+        StorageService.use_backend(previous)
+
+
+def run(corpus: List[CorpusItem], iterations: int) -> Dict[str, Dict]:
+    from fastapi.testclient import TestClient
+    from core import DEFAULT_ADMIN_EMAIL, DEFAULT_ADMIN_PASSWORD
+    from manage import migrate
+    import main
+
+    migrate()
+
+    # Загрузки выполняет admin — у него нет лимита free_user
+    sample = next(item for item in corpus if item.fmt == "jpg" and item.faces > 0)
+    payload = sample.path.read_bytes()
+    results: Dict[str, Dict] = {}
+    uploaded: List[int] = []
+
+    with _s3_stand_in() as backend, TestClient(main.app) as client:
+        credentials = {"email": DEFAULT_ADMIN_EMAIL, "password": DEFAULT_ADMIN_PASSWORD}
+
+        def login():
+            response = client.post("/auth/login", json=credentials)
+            assert response.status_code == 200, response.text
+            return response
+
+        token = login().json()["access_token"]
+        headers = {"Authorization": f"Bearer {token}"}
+
+        def upload():
+            response = client.post(
+                "/image/", headers=headers,
+                files={"file": (sample.name, payload, "image/jpeg")},
+            )
+            assert response.status_code == 201, response.text
+            uploaded.append(response.json()["id"])
+
+        def list_images():
+            response = client.get("/image/?limit=100", headers=headers)
+            assert response.status_code == 200, response.text
+
+        results["api.auth_login"] = summarize(measure(login, iterations))
+        results["api.image_upload"] = {**summarize(measure(upload, iterations)), "s3": backend}
+        results["api.image_list"] = summarize(measure(list_images, iterations))
+
+        for image_id in uploaded:
+            client.delete(f"/image/{image_id}", headers=headers)
+
+    return results
@@ -0,0 +1,96 @@
+"""
+Бенчмарк оценки уверенности и подавления дубликатов в детекции лиц:
+
+  - detection.legacy / detection.scored — латентность detectMultiScale
+    (прежний путь) и detectMultiScale3 с уверенностью и NMS (detect_objects);
+  - detection.accuracy.min_conf_* — precision/recall по корпусу при разных
+    FACE_MIN_CONFIDENCE (эталон — face_layout: рамка засчитывается, если
+    содержит центр ещё не найденного лица);
+  - detection.blur_overlap.* — apply_blur на рамках с пересекающимися
+    дубликатами с объединением областей и без (blurred_pixels — сумма площадей).
+"""
+import importlib
+from typing import Dict, List, Tuple
+
+import cv2
+
+from benchmarks.corpus import CorpusItem, face_layout
+from benchmarks.stats import measure, summarize
+
+MIN_CONFIDENCES = (0.0, 0.2, 0.5, 0.8)
+
+
+def _match(objects: List[Dict], layout: List[Tuple[int, int, int]]) -> Tuple[int, int, int]:
+    """(tp, fp, fn): рамка — верная, если содержит центр ещё не найденного лица."""
+    remaining = list(layout)
+    tp = 0
+    for obj in objects:
+        x1, y1, x2, y2 = obj['bbox']
+        hit = next((face for face in remaining if x1 <= face[0] <= x2 and y1 <= face[1] <= y2), None)
+        if hit is not None:
+            remaining.remove(hit)
+            tp += 1
+    return tp, len(objects) - tp, len(remaining)
+
+
+def run(corpus: List[CorpusItem], iterations: int) -> Dict[str, Dict]:
+    # Модуль, а не экземпляр services.ai_service (см. services/__init__.py)
+    ai_module = importlib.import_module("services.ai_service")
+    from services.ai_service import ai_service, merge_regions, TILE_PIXEL_THRESHOLD
+
+    ai_service.ensure_loaded()
+    items = [item for item in corpus if item.fmt == corpus[0].fmt and item.pixels <= TILE_PIXEL_THRESHOLD]
+    frames = {item.name: cv2.imread(str(item.path)) for item in items}
+
+    results: Dict[str, Dict] = {}
+    for item in items:
+        frame = frames[item.name]
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        samples = measure(lambda: ai_service.face_cascade.detectMultiScale(gray, 1.3, 5), iterations)
+        results[f"detection.legacy.{item.name}"] = {
+            **summarize(samples), "faces_found": len(ai_service.face_cascade.detectMultiScale(gray, 1.3, 5)),
+        }
+        samples = measure(lambda: ai_service.detect_objects(frame), iterations)
+        results[f"detection.scored.{item.name}"] = {
+            **summarize(samples), "faces_found": len(ai_service.detect_objects(frame)),
+        }
+
+        # Каждая рамка с дубликатом, сдвинутым на четверть размера
+        objects = ai_service.detect_objects(frame)
+        if not objects:
+            continue
+        duplicated = []
+        for obj in objects:
+            x1, y1, x2, y2 = obj['bbox']
+            shift = (x2 - x1) // 4
+            duplicated += [obj, {**obj, 'bbox': [x1 + shift, y1 + shift, x2 + shift, y2 + shift]}]
+        merge = ai_module.ANONYMIZE_MERGE_OVERLAPS
+        try:
+            for merged in (False, True):
+                ai_module.ANONYMIZE_MERGE_OVERLAPS = merged
+                regions = merge_regions(duplicated, frame.shape)
+                samples = measure(lambda: ai_service.apply_blur(frame, duplicated), iterations)
+                results[f"detection.blur_overlap.{'merge' if merged else 'no_merge'}.{item.name}"] = {
+                    **summarize(samples),
+                    "regions": len(regions),
+                    "blurred_pixels": sum((x2 - x1) * (y2 - y1) for (x1, y1, x2, y2), _ in regions),
+                }
+        finally:
+            ai_module.ANONYMIZE_MERGE_OVERLAPS = merge
+
+    min_confidence = ai_module.FACE_MIN_CONFIDENCE
+    try:
+        for threshold in MIN_CONFIDENCES:
+            ai_module.FACE_MIN_CONFIDENCE = threshold
+            tp = fp = fn = 0
+            for item in items:
+                counts = _match(ai_service.detect_objects(frames[item.name]), face_layout(item.width, item.height, item.faces))
+                tp, fp, fn = tp + counts[0], fp + counts[1], fn + counts[2]
+            results[f"detection.accuracy.min_conf_{threshold}"] = {
+                "tp": tp, "fp": fp, "fn": fn,
+                "precision": round(tp / (tp + fp), 4) if tp + fp else 1.0,
+                "recall": round(tp / (tp + fn), 4) if tp + fn else 1.0,
+            }
+    finally:
+        ai_module.FACE_MIN_CONFIDENCE = min_confidence
+    return results
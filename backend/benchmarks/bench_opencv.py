@@ -0,0 +1,77 @@
+"""
+Бенчмарк профиля OpenCV: пропускная способность detect_objects + apply_blur
+при разном числе потоков OpenCV и числе одновременных запросов, а также
+с переиспользованием буферов и без.
+
+Для каждой нагрузки (concurrency) в результат попадает лучший OPENCV_THREADS
+на этой машине: при concurrency ≈ число ядер обычно выигрывает 1 поток
+(профиль process), при единичных запросах — число ядер (профиль request).
+"""
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+
+import cv2
+
+from benchmarks.corpus import CorpusItem
+from benchmarks.stats import summarize
+
+
+def _thread_counts() -> List[int]:
+    cpu_count = os.cpu_count() or 1
+    return sorted({count for count in (1, 2, 4, cpu_count) if count <= cpu_count})
+
+
+def run(corpus: List[CorpusItem], iterations: int) -> Dict[str, Dict]:
+    import services.ai_service as ai_module
+    from services.ai_service import ai_service, TILE_PIXEL_THRESHOLD
+
+    items = [item for item in corpus if item.pixels <= TILE_PIXEL_THRESHOLD] or corpus
+    item = max(items, key=lambda candidate: candidate.pixels)
+    frame = cv2.imread(str(item.path))
+    ai_service.ensure_loaded()
+    initial_threads = cv2.getNumThreads()
+    initial_reuse = ai_module.BUFFER_REUSE
+
+    def job() -> float:
+        started = time.perf_counter()
+        objects = ai_service.detect_objects(frame)
+        ai_service.apply_blur(frame, objects)
+        return time.perf_counter() - started
+
+    results: Dict[str, Dict] = {}
+    cpu_count = os.cpu_count() or 1
+    try:
+        for concurrency in sorted({1, cpu_count}):
+            jobs = max(iterations, 1) * concurrency
+            best = None
+            for threads in _thread_counts():
+                cv2.setNumThreads(threads)
+                with ThreadPoolExecutor(max_workers=concurrency) as clients:
+                    list(clients.map(lambda _: job(), range(concurrency)))  # прогрев
+                    started = time.perf_counter()
+                    samples = list(clients.map(lambda _: job(), range(jobs)))
+                    wall = time.perf_counter() - started
+                result = {
+                    **summarize(samples), "per_sec": round(jobs / wall, 2),
+                    "threads": threads, "concurrency": concurrency, "image": item.name,
+                }
+                results[f"opencv.threads{threads}.concurrency{concurrency}"] = result
+                if best is None or result["per_sec"] > best["per_sec"]:
+                    best = result
+            results[f"opencv.best.concurrency{concurrency}"] = {
+                **best, "cpu_count": cpu_count, "cpu_features": cv2.getCPUFeaturesLine(),
+            }
+
+        # Переиспользование серых и временных буферов против выделения на каждый вызов
+        cv2.setNumThreads(1)
+        for reuse in (True, False):
+            ai_module.BUFFER_REUSE = reuse
+            ai_service._buffers.clear()
+            samples = [job() for _ in range(max(iterations, 1) * 4)]
+            results[f"opencv.buffer_reuse.{'on' if reuse else 'off'}"] = summarize(samples)
+    finally:
+        ai_module.BUFFER_REUSE = initial_reuse
+        cv2.setNumThreads(initial_threads)
+    return results
@@ -0,0 +1,70 @@
+"""
+Бенчмарк конвейера AIService: detect_objects, повторная детекция через кеш
+по dHash, apply_blur, кодирование и process_image.
+"""
+import shutil
+import tempfile
+from pathlib import Path
+from typing import Dict, List
+
+import cv2
+
+from benchmarks.corpus import CorpusItem
+from benchmarks.stats import measure, summarize
+
+
+def run(corpus: List[CorpusItem], iterations: int) -> Dict[str, Dict]:
+    from services.ai_service import ai_service, TILE_PIXEL_THRESHOLD
+    from services.detection_cache import detection_cache
+    from services.encoder_service import EncoderService
+
+    results: Dict[str, Dict] = {}
+    workdir = Path(tempfile.mkdtemp(prefix="dc-bench-"))
+    try:
+        for item in corpus:
+            frame = cv2.imread(str(item.path))
+            tiled = item.pixels > TILE_PIXEL_THRESHOLD
+            detect = ai_service.detect_objects_tiled if tiled else ai_service.detect_objects
+
+            objects = detect(frame)
+            samples = measure(lambda: detect(frame), iterations)
+            results[f"pipeline.detect.{item.name}"] = {
+                **summarize(samples), "faces_expected": item.faces, "faces_found": len(objects),
+            }
+
+            # Тот же кадр (совпал SHA-256 пикселей): рамки из кеша вместо полной детекции
+            enabled, persist = detection_cache.enabled, detection_cache.persist
+            detection_cache.enabled, detection_cache.persist = True, False
+            try:
+                detection_cache.clear()
+                ai_service.detect_with_cache(frame, tiled)
+                cached = ai_service.detect_with_cache(frame, tiled)
+                samples = measure(lambda: ai_service.detect_with_cache(frame, tiled), iterations)
+            finally:
+                detection_cache.enabled, detection_cache.persist = enabled, persist
+                detection_cache.clear()
+            results[f"pipeline.detect_cached.{item.name}"] = {
+                **summarize(samples), "faces_expected": item.faces, "faces_found": len(cached),
+            }
+
+            if objects:
+                samples = measure(lambda: ai_service.apply_blur(frame, objects), iterations)
+                results[f"pipeline.blur.{item.name}"] = summarize(samples)
+
+            stem = workdir / f"encoded_{item.path.stem}"
+            output, _ = EncoderService.encode(frame, stem, str(item.path))
+            samples = measure(lambda: EncoderService.encode(frame, stem, str(item.path)), iterations)
+            results[f"pipeline.encode.{item.name}"] = {
+                **summarize(samples),
+                "source_bytes": item.path.stat().st_size,
+                "output_bytes": output.stat().st_size,
+            }
+
+            # process_image пишет результат рядом с исходником — работаем с копией
+            source = workdir / item.path.name
+            shutil.copyfile(item.path, source)
+            samples = measure(lambda: ai_service.process_image(str(source)), iterations)
+            results[f"pipeline.process_image.{item.name}"] = summarize(samples)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return results
@@ -0,0 +1,86 @@
+"""
+Бенчмарк построения ответа GET /image/ для страницы из 100 изображений
+с массивами detected_objects, без БД и S3 (s3_key = None):
+
+  - pydantic: прежний путь — словари, PaginatedImageResponse в сервисе,
+    повторная валидация и model_dump по response_model, json.dumps в JSONResponse;
+  - orjson: сериализатор image_serializer и ORJSONResponse без валидации;
+  - orjson.sparse: то же с fields=id,url,original_name,created_at.
+
+Кроме латентности для каждого варианта записывается пик выделенной памяти
+на один ответ (tracemalloc) и размер тела ответа.
+"""
+import json
+import tracemalloc
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List
+
+from benchmarks.corpus import CorpusItem
+from benchmarks.stats import measure, summarize
+
+PAGE_SIZE = 100
+OBJECTS_PER_IMAGE = 8
+SPARSE_FIELDS = ("id", "original_name", "created_at", "url")
+
+
+def _page() -> List:
+    from models.image import Image
+
+    created_at = datetime(2026, 1, 1)
+    objects = [
+        {"type": "face", "x": 10 * i, "y": 20 * i, "width": 64, "height": 64, "confidence": 0.9}
+        for i in range(OBJECTS_PER_IMAGE)
+    ]
+    return [
+        Image(
+            id=i, filename=f"{i:08d}.jpg", original_name=f"photo_{i}.jpg", user_id=1,
+            created_at=created_at + timedelta(minutes=i), processed=True,
+            detected_objects=json.dumps(objects), detected_count=len(objects), s3_key=None,
+        )
+        for i in range(1, PAGE_SIZE + 1)
+    ]
+
+
+def _peak_kb(fn: Callable[[], bytes]) -> float:
+    tracemalloc.start()
+    try:
+        fn()
+        return round(tracemalloc.get_traced_memory()[1] / 1024, 1)
+    finally:
+        tracemalloc.stop()
+
+
+def run(corpus: List[CorpusItem], iterations: int) -> Dict[str, Dict]:
+    from fastapi.responses import JSONResponse, ORJSONResponse
+
+    from schemas.image import PaginatedImageResponse
+    from services.image_service import image_serializer
+
+    images = _page()
+    meta = {"total": PAGE_SIZE, "page": 1, "limit": PAGE_SIZE, "pages": 1}
+
+    def pydantic_path() -> bytes:
+        serialize = image_serializer()
+        page = PaginatedImageResponse(items=[serialize(img) for img in images], **meta)
+        # Что делает FastAPI с возвращённой моделью при заданном response_model
+        validated = PaginatedImageResponse.model_validate(page.model_dump())
+        return JSONResponse(validated.model_dump(mode="json")).body
+
+    def orjson_path(fields=None) -> bytes:
+        serialize = image_serializer(fields)
+        return ORJSONResponse({"items": [serialize(img) for img in images], **meta}).body
+
+    variants = {
+        "pydantic": pydantic_path,
+        "orjson": orjson_path,
+        "orjson.sparse": lambda: orjson_path(SPARSE_FIELDS),
+    }
+    results: Dict[str, Dict] = {}
+    for name, fn in variants.items():
+        samples = measure(fn, max(iterations, 1) * 20, warmup=3)
+        results[f"serialization.{name}"] = {
+            **summarize(samples, items_per_call=PAGE_SIZE),
+            "peak_kb": _peak_kb(fn),
+            "body_bytes": len(fn()),
+        }
+    return results
@@ -0,0 +1,45 @@
+"""
+Время старта приложения: импорт main, первый ответ /health (liveness)
+и готовность /ready после прогрева модели. Каждый замер — в новом процессе,
+чтобы не учитывать уже импортированные модули.
+"""
+import os
+import subprocess
+import sys
+from pathlib import Path
+from typing import Dict, List
+
+from benchmarks.corpus import CorpusItem
+from benchmarks.stats import summarize
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+# Печатает три времени (сек.) от старта интерпретатора: import main, /health, /ready
+_PROBE = """
+import time
+t0 = time.perf_counter()
+import main
+t_import = time.perf_counter() - t0
+from fastapi.testclient import TestClient
+with TestClient(main.app) as client:
+    assert client.get("/health").status_code == 200
+    t_health = time.perf_counter() - t0
+    while client.get("/ready").status_code != 200:
+        time.sleep(0.005)
+    t_ready = time.perf_counter() - t0
+print(t_import, t_health, t_ready)
+"""
+
+
+def run(corpus: List[CorpusItem], iterations: int) -> Dict[str, Dict]:
+    samples = {"import": [], "health": [], "ready": []}
+    for _ in range(iterations):
+        output = subprocess.run(
+            [sys.executable, "-c", _PROBE],
+            cwd=BACKEND_DIR, env=dict(os.environ), check=True,
+            capture_output=True, text=True,
+        ).stdout.split()
+        for key, value in zip(("import", "health", "ready"), output[-3:]):
+            samples[key].append(float(value))
+
+    return {f"startup.{key}": summarize(values) for key, values in samples.items()}
@@ -0,0 +1,74 @@
+"""
+Бенчмарк хранилища: цена недоступного S3 для загрузки и бэкенды без S3.
+
+  - storage.dead_s3.no_breaker — S3 не отвечает (соединение отклоняется),
+    цепь никогда не размыкается: каждая загрузка ждёт попыток boto3;
+  - storage.dead_s3.breaker — то же с circuit breaker по умолчанию, цепь уже
+    разомкнута: операция завершается без обращения к S3. Первые
+    CIRCUIT_FAILURE_THRESHOLD сбоев, размыкающие цепь, в выборку не входят —
+    их суммарное время в trip_ms;
+  - storage.put.local / storage.put.memory — загрузка файла корпуса в
+    локальный (жёсткая ссылка) и in-memory бэкенды.
+"""
+import shutil
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List
+
+from benchmarks.corpus import CorpusItem
+from benchmarks.stats import measure, summarize
+
+DEAD_ENDPOINT = "http://127.0.0.1:1"
+
+
+def _dead_s3():
+    from services.storage_service import S3Backend
+
+    backend = S3Backend()
+    backend._internal_client = backend._client(DEAD_ENDPOINT)
+    return backend
+
+
+def run(corpus: List[CorpusItem], iterations: int) -> Dict[str, Dict]:
+    from core.circuit_breaker import CircuitBreaker
+    from services.storage_service import LocalBackend, MemoryBackend, StorageService
+
+    sample = max(corpus, key=lambda item: item.path.stat().st_size)
+    results: Dict[str, Dict] = {}
+    previous = StorageService.backend
+    try:
+        def upload():
+            try:
+                StorageService.upload_file(str(sample.path), f"bench/{sample.path.name}")
+            except Exception:
+                pass
+
+        StorageService.use_backend(_dead_s3())
+        StorageService.breaker = CircuitBreaker("storage", failure_threshold=10 ** 9)
+        samples = measure(upload, iterations, warmup=0)
+        results["storage.dead_s3.no_breaker"] = {**summarize(samples), "circuit": StorageService.breaker.state}
+
+        StorageService.use_backend(_dead_s3())
+        started = time.perf_counter()
+        for _ in range(StorageService.breaker.failure_threshold):
+            upload()
+        trip_ms = (time.perf_counter() - started) * 1000
+        samples = measure(upload, iterations, warmup=0)
+        results["storage.dead_s3.breaker"] = {
+            **summarize(samples), "circuit": StorageService.breaker.state, "trip_ms": round(trip_ms, 1),
+        }
+
+        root = Path(tempfile.mkdtemp(prefix="bench-storage-"))
+        try:
+            for name, backend in (("local", LocalBackend(root, "/uploads/objects")), ("memory", MemoryBackend())):
+                StorageService.use_backend(backend)
+                samples = measure(
+                    lambda: StorageService.upload_file(str(sample.path), f"bench/{sample.path.name}"), iterations,
+                )
+                results[f"storage.put.{name}"] = {**summarize(samples), "bytes": sample.path.stat().st_size}
+        finally:
+            shutil.rmtree(root, ignore_errors=True)
+    finally:
+        StorageService.use_backend(previous)
+    return results
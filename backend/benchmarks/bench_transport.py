@@ -0,0 +1,82 @@
+"""
+Бенчмарк передачи декодированного кадра в процесс пула и обратно:
+
+  - transport.pickle — кадр аргументом задачи ProcessPoolExecutor и обратно
+    результатом (сериализация и копия при каждом переходе);
+  - transport.shm / transport.mmap — кольцо общей памяти benchmarks/frame_transport.py:
+    копия в слот, дескриптор в очереди, изменение на месте, копия из слота.
+
+copies — копирования кадра в пользовательском пространстве за круг (без учёта
+копирования ядром при записи в pipe у pickle), queue_bytes — размер того, что
+уходит в очередь задач.
+"""
+import multiprocessing
+import pickle
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from benchmarks.corpus import CorpusItem
+from benchmarks.stats import measure, summarize
+
+SHAPES = ((480, 640, 3), (1080, 1920, 3), (2160, 3840, 3))
+
+_ring = None
+
+
+def _init(ring) -> None:
+    global _ring
+    _ring = ring
+
+
+def _touch_pickled(frame: np.ndarray) -> np.ndarray:
+    frame[0, 0, 0] ^= 1
+    return frame
+
+
+def _touch_slot(descriptor) -> None:
+    _ring.view(descriptor)[0, 0, 0] ^= 1
+
+
+def run(corpus: List[CorpusItem], iterations: int) -> Dict[str, Dict]:
+    from benchmarks.frame_transport import FrameRing
+
+    results: Dict[str, Dict] = {}
+    context = multiprocessing.get_context("fork")
+    for transport in ("shm", "mmap"):
+        ring = FrameRing(slots=1, transport=transport)
+        executor: Optional[ProcessPoolExecutor] = None
+        try:
+            executor = ProcessPoolExecutor(1, mp_context=context, initializer=_init, initargs=(ring,))
+            for shape in SHAPES:
+                frame = np.random.default_rng(0).integers(0, 255, size=shape, dtype=np.uint8)
+                name = f"{shape[1]}x{shape[0]}"
+
+                if transport == "shm":
+                    samples = measure(lambda: executor.submit(_touch_pickled, frame).result(), iterations)
+                    results[f"transport.pickle.{name}"] = {
+                        **summarize(samples), "copies": 4,
+                        "queue_bytes": len(pickle.dumps(frame, protocol=pickle.HIGHEST_PROTOCOL)),
+                    }
+
+                def round_trip():
+                    descriptor, = ring.put_many([frame])
+                    try:
+                        executor.submit(_touch_slot, descriptor).result()
+                        return ring.view(descriptor).copy()
+                    finally:
+                        ring.release(descriptor)
+
+                descriptor, = ring.put_many([frame])
+                ring.release(descriptor)
+                samples = measure(round_trip, iterations)
+                results[f"transport.{transport}.{name}"] = {
+                    **summarize(samples), "copies": 2,
+                    "queue_bytes": len(pickle.dumps(descriptor, protocol=pickle.HIGHEST_PROTOCOL)),
+                }
+        finally:
+            if executor is not None:
+                executor.shutdown()
+            ring.close()
+    return results
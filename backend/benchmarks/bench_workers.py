@@ -0,0 +1,95 @@
+"""
+Бенчмарк пула инференса: пропускная способность process_image при разном числе
+процессов и память на процесс (Rss/Pss/Private из /proc/<pid>/smaps_rollup).
+
+Pss показывает реальную долю памяти процесса с учётом общих copy-on-write
+страниц — именно он растёт при добавлении воркеров.
+"""
+import os
+import shutil
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from benchmarks.corpus import CorpusItem
+from benchmarks.stats import summarize
+
+
+def _pool_sizes() -> List[int]:
+    cpu_count = os.cpu_count() or 1
+    return sorted({size for size in (1, 2, 4, cpu_count) if size <= cpu_count})
+
+
+def _memory_mb(pid: int) -> Optional[Dict[str, float]]:
+    """Rss/Pss/Private процесса в МБ (только Linux)."""
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as rollup:
+            lines = rollup.read().splitlines()
+    except OSError:
+        return None
+
+    values: Dict[str, int] = {}
+    for line in lines:
+        parts = line.split()
+        if len(parts) >= 2 and parts[0].endswith(":") and parts[1].isdigit():
+            values[parts[0][:-1]] = int(parts[1])
+    private = values.get("Private_Clean", 0) + values.get("Private_Dirty", 0)
+    return {
+        "rss_mb": round(values.get("Rss", 0) / 1024, 1),
+        "pss_mb": round(values.get("Pss", 0) / 1024, 1),
+        "private_mb": round(private / 1024, 1),
+    }
+
+
+def run(corpus: List[CorpusItem], iterations: int) -> Dict[str, Dict]:
+    from services.ai_service import ai_service, TILE_PIXEL_THRESHOLD
+    from services.inference_pool import InferencePool
+
+    # Тайловые изображения слишком долгие для замера масштабирования
+    items = [item for item in corpus if item.pixels <= TILE_PIXEL_THRESHOLD] or corpus
+    # Как в лаунчере: каскад загружен до fork и делится между процессами
+    ai_service.ensure_loaded()
+
+    results: Dict[str, Dict] = {}
+    workdir = Path(tempfile.mkdtemp(prefix="dc-bench-workers-"))
+    try:
+        sources = []
+        for item in items:
+            source = workdir / item.path.name
+            shutil.copyfile(item.path, source)
+            sources.append(str(source))
+        jobs = sources * max(1, iterations)
+
+        for size in _pool_sizes():
+            pool = InferencePool(workers=size)
+            try:
+                pool.start()
+
+                def timed_job(path: str) -> float:
+                    started = time.perf_counter()
+                    pool.process_image(path)
+                    return time.perf_counter() - started
+
+                # Клиентов вдвое больше процессов — очередь пула не простаивает
+                with ThreadPoolExecutor(max_workers=size * 2) as clients:
+                    started = time.perf_counter()
+                    samples = list(clients.map(timed_job, jobs))
+                    wall = time.perf_counter() - started
+
+                memory = [m for m in (_memory_mb(pid) for pid in pool._executor._processes) if m]
+                result = {**summarize(samples), "per_sec": round(len(jobs) / wall, 2), "workers": size}
+                parent = _memory_mb(os.getpid())
+                if parent:
+                    result["parent_rss_mb"] = parent["rss_mb"]
+                if memory:
+                    result["worker_rss_mb"] = max(m["rss_mb"] for m in memory)
+                    result["worker_pss_mb"] = max(m["pss_mb"] for m in memory)
+                    result["worker_private_mb"] = max(m["private_mb"] for m in memory)
+                results[f"workers.process_image.x{size}"] = result
+            finally:
+                pool.shutdown(wait=True)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return results
@@ -0,0 +1,95 @@
+"""
+Синтетический корпус изображений для бенчмарков.
+
+Лица рисуются примитивами (овал, брови, глаза, нос, рот) и слегка размываются —
+такой рисунок стабильно находится каскадом Хаара, поэтому число лиц в кадре
+известно заранее. Генерация детерминирована (фиксированный seed).
+"""
+from dataclasses import dataclass
+from pathlib import Path
+from typing import List, Sequence, Tuple
+
+import cv2
+import numpy as np
+
+RESOLUTIONS: Sequence[Tuple[int, int]] = ((640, 480), (1920, 1080), (4000, 3000))
+FACE_COUNTS: Sequence[int] = (0, 1, 5)
+FORMATS: Sequence[str] = ("jpg", "png", "webp")
+
+
+@dataclass
+class CorpusItem:
+    name: str
+    path: Path
+    width: int
+    height: int
+    faces: int
+    fmt: str
+
+    @property
+    def pixels(self) -> int:
+        return self.width * self.height
+
+
+def draw_face(image: np.ndarray, cx: int, cy: int, size: int) -> None:
+    """Рисует детектируемое каскадом «лицо» шириной size с центром (cx, cy)."""
+    s = size
+    cv2.ellipse(image, (cx, cy), (int(s * 0.45), int(s * 0.6)), 0, 0, 360, (150, 170, 200), -1)
+    eye_y = cy - int(s * 0.12)
+    eye_dx = int(s * 0.2)
+    for dx in (-eye_dx, eye_dx):
+        cv2.ellipse(image, (cx + dx, eye_y - int(s * 0.1)), (int(s * 0.14), int(s * 0.03)), 0, 0, 360, (40, 50, 60), -1)
+        cv2.ellipse(image, (cx + dx, eye_y), (int(s * 0.1), int(s * 0.05)), 0, 0, 360, (30, 30, 30), -1)
+    cv2.ellipse(image, (cx, cy + int(s * 0.1)), (int(s * 0.05), int(s * 0.12)), 0, 0, 360, (175, 195, 225), -1)
+    cv2.ellipse(image, (cx, cy + int(s * 0.32)), (int(s * 0.16), int(s * 0.04)), 0, 0, 360, (60, 60, 120), -1)
+
+
+def face_layout(width: int, height: int, faces: int) -> List[Tuple[int, int, int]]:
+    """Центры и размер лиц (cx, cy, size) — сетка без перекрытий; эталон для оценки точности."""
+    if not faces:
+        return []
+    cols = int(np.ceil(np.sqrt(faces)))
+    rows = int(np.ceil(faces / cols))
+    cell_w, cell_h = width // cols, height // rows
+    size = int(min(cell_w, cell_h / 1.3) * 0.6)
+    return [
+        (col * cell_w + cell_w // 2, row * cell_h + cell_h // 2, size)
+        for row, col in (divmod(i, cols) for i in range(faces))
+    ]
+
+
+def make_frame(width: int, height: int, faces: int, seed: int = 0) -> np.ndarray:
+    """Кадр с шумным фоном и faces лицами, разложенными по сетке без перекрытий."""
+    rng = np.random.default_rng(seed)
+    frame = rng.integers(60, 120, size=(height, width, 3), dtype=np.uint8)
+    frame = cv2.GaussianBlur(frame, (0, 0), 3)
+
+    layout = face_layout(width, height, faces)
+    for cx, cy, size in layout:
+        draw_face(frame, cx, cy, size)
+    if layout:
+        frame = cv2.GaussianBlur(frame, (0, 0), max(1.0, layout[0][2] * 0.03))
+    return frame
+
+
+def generate_corpus(
+        directory: Path,
+        resolutions: Sequence[Tuple[int, int]] = RESOLUTIONS,
+        face_counts: Sequence[int] = FACE_COUNTS,
+        formats: Sequence[str] = FORMATS,
+) -> List[CorpusItem]:
+    """Создаёт (или переиспользует) файлы корпуса в directory."""
+    directory.mkdir(parents=True, exist_ok=True)
+    items = []
+    for width, height in resolutions:
+        for faces in face_counts:
+            frame = None
+            for fmt in formats:
+                name = f"{width}x{height}_{faces}f.{fmt}"
+                path = directory / name
+                if not path.exists():
+                    if frame is None:
+                        frame = make_frame(width, height, faces, seed=width * 31 + faces)
+                    cv2.imwrite(str(path), frame)
+                items.append(CorpusItem(name, path, width, height, faces, fmt))
+    return items
@@ -0,0 +1,170 @@
+"""
+Кольцо заранее выделенных слотов общей памяти для передачи декодированных
+кадров в процессы пула без pickle (используется bench_transport). В сервисе
+кадры через границу процессов не передаются: пул инференса получает путь к файлу.
+
+  - Память — multiprocessing.shared_memory (FRAME_TRANSPORT=shm) или файл в
+    UPLOADS_DIR, отображённый через mmap и сразу удалённый (FRAME_TRANSPORT=mmap,
+    для контейнеров с маленьким /dev/shm). Если кольцо не помещается в свободное
+    место /dev/shm (в Docker по умолчанию 64 МБ), используется mmap: сегмент shm
+    больше лимита создаётся, но запись в слот за его пределами — SIGBUS.
+    Кольцо создаётся в родителе до fork, процессы пула наследуют отображение;
+    страницы выделяются при первой записи.
+  - В очередь задач попадает только FrameDescriptor (слот, форма, dtype) —
+    десятки байт вместо мегабайт кадра. Кадр копируется один раз в слот и
+    один раз из слота; процесс пула работает с view на месте.
+  - Слот освобождается, когда счётчик ссылок падает до нуля: ссылки держат
+    вызывающий код (пока не скопирует результат) и задача пула (до её
+    завершения, даже если вызывающий перестал ждать). Слоты пакета берутся
+    разом, без свободных слотов put_many ждёт — память ограничена кольцом.
+  - Кадр больше FRAME_SLOT_BYTES в слот не помещается (fits).
+"""
+import logging
+import mmap
+import os
+import shutil
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+from multiprocessing import shared_memory
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from core import UPLOADS_DIR
+
+logger = logging.getLogger(__name__)
+
+FRAME_TRANSPORT = os.getenv("FRAME_TRANSPORT", "shm").lower()
+FRAME_RING_SLOTS = int(os.getenv("FRAME_RING_SLOTS", "4"))
+# Размер слота: 24 МБ вмещают BGR-кадр 3840x2160
+FRAME_SLOT_BYTES = int(os.getenv("FRAME_SLOT_BYTES", str(24 * 1024 * 1024)))
+# Сколько ждать свободных слотов, секунд
+FRAME_ACQUIRE_TIMEOUT = float(os.getenv("FRAME_ACQUIRE_TIMEOUT", "30"))
+
+SHM_DIR = "/dev/shm"
+
+
+def _shm_free_bytes() -> Optional[int]:
+    """Свободное место в /dev/shm; None — размер неизвестен (не Linux)."""
+    try:
+        return shutil.disk_usage(SHM_DIR).free
+    except OSError:
+        return None
+
+
+@dataclass(frozen=True)
+class FrameDescriptor:
+    """Кадр в слоте кольца — всё, что передаётся в процесс пула."""
+    slot: int
+    shape: Tuple[int, ...]
+    dtype: str
+
+
+class FrameRing:
+    """Кольцо слотов общей памяти со счётчиками ссылок (счётчики — в процессе-владельце)."""
+
+    def __init__(self, slots: int = FRAME_RING_SLOTS, slot_bytes: int = FRAME_SLOT_BYTES,
+                 transport: str = FRAME_TRANSPORT):
+        self.slots = slots
+        self.slot_bytes = slot_bytes
+        self.transport = "mmap" if transport == "mmap" else "shm"
+        size = slots * slot_bytes
+        if self.transport == "shm":
+            free = _shm_free_bytes()
+            if free is not None and free < size:
+                logger.warning(
+                    f"Кольцо кадров {size // 1024 // 1024} МБ не помещается в {SHM_DIR} "
+                    f"(свободно {free // 1024 // 1024} МБ) — используется mmap"
+                )
+                self.transport = "mmap"
+        self._shm = None
+        self._mmap = None
+        if self.transport == "mmap":
+            path = UPLOADS_DIR / f".frames-{os.getpid()}-{uuid.uuid4().hex}.ring"
+            with open(path, "w+b") as f:
+                f.truncate(size)
+                self._mmap = mmap.mmap(f.fileno(), size)
+            # Отображение живёт без файла: после падения процесса ничего не остаётся
+            path.unlink()
+            self._buffer = memoryview(self._mmap)
+        else:
+            self._shm = shared_memory.SharedMemory(create=True, size=size)
+            self._buffer = self._shm.buf
+        self._refcounts = [0] * slots
+        self._next = 0
+        self._cond = threading.Condition()
+        self.owner_pid = os.getpid()
+
+    def fits(self, frame: np.ndarray) -> bool:
+        return frame.nbytes <= self.slot_bytes
+
+    def put_many(self, frames: Sequence[np.ndarray], timeout: float = FRAME_ACQUIRE_TIMEOUT) -> List[FrameDescriptor]:
+        """Копирует кадры в свободные слоты (по одной ссылке у вызывающего на слот)."""
+        descriptors = [
+            FrameDescriptor(slot, frame.shape, frame.dtype.str)
+            for slot, frame in zip(self._acquire(len(frames), timeout), frames)
+        ]
+        for descriptor, frame in zip(descriptors, frames):
+            np.copyto(self.view(descriptor), frame)
+        return descriptors
+
+    def view(self, descriptor: FrameDescriptor) -> np.ndarray:
+        """Кадр в слоте без копирования; действителен, пока на слот есть ссылки."""
+        return np.ndarray(
+            descriptor.shape, dtype=np.dtype(descriptor.dtype),
+            buffer=self._buffer, offset=descriptor.slot * self.slot_bytes,
+        )
+
+    def retain(self, descriptor: FrameDescriptor) -> None:
+        with self._cond:
+            self._refcounts[descriptor.slot] += 1
+
+    def release(self, descriptor: FrameDescriptor) -> None:
+        with self._cond:
+            self._refcounts[descriptor.slot] -= 1
+            if self._refcounts[descriptor.slot] == 0:
+                self._cond.notify_all()
+
+    def in_use(self) -> int:
+        with self._cond:
+            return sum(1 for count in self._refcounts if count)
+
+    def close(self) -> None:
+        """Освобождает память кольца (в процессе-владельце — удаляет сегмент shm)."""
+        try:
+            if self._shm is not None:
+                self._buffer = None
+                self._shm.close()
+                if self.owner_pid == os.getpid():
+                    self._shm.unlink()
+            elif self._mmap is not None:
+                self._buffer.release()
+                self._mmap.close()
+        except BufferError:
+            # Остались view на слоты — память освободится вместе с процессом
+            logger.warning("Кольцо кадров закрыто с живыми view на слоты")
+        except FileNotFoundError:
+            pass
+
+    def _acquire(self, count: int, timeout: float) -> List[int]:
+        """Разом берёт count свободных слотов: пакеты не делят кольцо по частям и не блокируют друг друга."""
+        if count > self.slots:
+            raise ValueError(f"Пакет из {count} кадров больше кольца ({self.slots} слотов)")
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while True:
+                free = [
+                    slot for slot in ((self._next + step) % self.slots for step in range(self.slots))
+                    if self._refcounts[slot] == 0
+                ][:count]
+                if len(free) == count:
+                    for slot in free:
+                        self._refcounts[slot] = 1
+                    self._next = (free[-1] + 1) % self.slots if free else self._next
+                    return free
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise TimeoutError(f"Нет {count} свободных слотов кольца кадров за {timeout} с")
+                self._cond.wait(remaining)
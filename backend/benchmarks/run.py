@@ -0,0 +1,103 @@
+"""
+Запуск бенчмарков.
+
+    cd backend
+    python -m benchmarks.run                              # все наборы -> bench_results.json
+    python -m benchmarks.run --suite pipeline --quick     # только 640x480, быстро
+    python -m benchmarks.run --suite workers              # масштабирование пула инференса
+    python -m benchmarks.run --suite opencv               # лучший OPENCV_THREADS для этой машины
+    python -m benchmarks.run --suite serialization        # построение ответа списка изображений
+    python -m benchmarks.run --suite storage              # цена недоступного S3, бэкенды без S3
+    python -m benchmarks.run --output base.json           # сохранить baseline
+    python -m benchmarks.run --compare base.json          # код 1 при регрессии > 10%
+
+Результат — JSON с p50/p95/p99/mean (мс) и per_sec (изображений/запросов в сек.).
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+from datetime import datetime
+from pathlib import Path
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks import corpus as corpus_module  # noqa: E402
+from benchmarks.stats import compare, load_results  # noqa: E402
+
+SUITES = ("pipeline", "detection", "transport", "storage", "api", "startup", "workers", "opencv",
+          "serialization")
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="DataCleaner benchmarks")
+    parser.add_argument("--suite", action="append", choices=SUITES,
+                        help="Набор бенчмарков (можно несколько раз). По умолчанию — все")
+    parser.add_argument("--iterations", type=int, default=5, help="Повторов на замер")
+    parser.add_argument("--quick", action="store_true", help="Только малое разрешение и JPEG")
+    parser.add_argument("--corpus-dir", type=Path,
+                        default=Path(tempfile.gettempdir()) / "datacleaner-bench-corpus")
+    parser.add_argument("--output", type=Path, default=Path("bench_results.json"))
+    parser.add_argument("--compare", type=Path, help="Baseline для сравнения")
+    parser.add_argument("--threshold", type=float, default=0.10,
+                        help="Допустимый рост p50/p95 относительно baseline (0.10 = 10%%)")
+    args = parser.parse_args(argv)
+
+    # Временная БД, чтобы не трогать рабочую auth.db. Задаётся до импорта core
+    os.environ.setdefault(
+        "DATABASE_URL", f"sqlite:///{tempfile.mkdtemp(prefix='dc-bench-db-')}/bench.db"
+    )
+    # Бенчмарк API многократно логинится и загружает — лимиты частоты мешают замеру
+    os.environ.setdefault("RATE_LIMIT_ENABLED", "false")
+    # Повторы одного кадра иначе попадают в кеш детекции и замеряют его, а не детекцию
+    # (кеш замеряется отдельно: pipeline.detect_cached.*)
+    os.environ.setdefault("DETECTION_CACHE_ENABLED", "false")
+
+    if args.quick:
+        corpus = corpus_module.generate_corpus(
+            args.corpus_dir, resolutions=[(640, 480)], formats=["jpg"],
+        )
+    else:
+        corpus = corpus_module.generate_corpus(args.corpus_dir)
+
+    results = {}
+    for suite in args.suite or SUITES:
+        module = __import__(f"benchmarks.bench_{suite}", fromlist=["run"])
+        print(f"▶ {suite} ({len(corpus)} изображений, {args.iterations} повторов)")
+        results.update(module.run(corpus, args.iterations))
+
+    report = {
+        "created_at": datetime.utcnow().isoformat(),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "iterations": args.iterations,
+        "results": results,
+    }
+    args.output.write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+
+    width = max(len(name) for name in results) if results else 0
+    for name, result in sorted(results.items()):
+        if "p50_ms" not in result:
+            # Результаты без замера времени (точность детекции и т.п.)
+            print(f"{name:<{width}}  " + "  ".join(f"{key}={value}" for key, value in result.items()))
+            continue
+        print(f"{name:<{width}}  p50={result['p50_ms']:>9.2f}ms  p95={result['p95_ms']:>9.2f}ms  "
+              f"{result['per_sec']:>8.2f}/s")
+    print(f"💾 {args.output}")
+
+    if args.compare:
+        regressions = compare(results, load_results(args.compare), args.threshold)
+        if regressions:
+            print(f"❌ Регрессии относительно {args.compare}:")
+            for name, base, current, change in regressions:
+                print(f"  {name}: {base:.2f} -> {current:.2f} ms (+{change:.0%})")
+            return 1
+        print(f"✅ Регрессий относительно {args.compare} нет")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,57 @@
+"""Статистика по замерам и сравнение с сохранённым baseline."""
+import json
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Tuple
+
+import numpy as np
+
+
+def summarize(samples: List[float], items_per_call: int = 1) -> Dict[str, float]:
+    """p50/p95/p99/mean в миллисекундах и пропускная способность (items/sec)."""
+    data = np.asarray(samples, dtype=np.float64) * 1000
+    total = float(data.sum()) / 1000
+    return {
+        "n": len(samples),
+        "p50_ms": round(float(np.percentile(data, 50)), 3),
+        "p95_ms": round(float(np.percentile(data, 95)), 3),
+        "p99_ms": round(float(np.percentile(data, 99)), 3),
+        "mean_ms": round(float(data.mean()), 3),
+        "per_sec": round(len(samples) * items_per_call / total, 2) if total > 0 else 0.0,
+    }
+
+
+def measure(fn: Callable[[], object], iterations: int, warmup: int = 1) -> List[float]:
+    """Время каждого из iterations вызовов fn (после warmup прогревочных)."""
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - started)
+    return samples
+
+
+def compare(current: Dict[str, Dict], baseline: Dict[str, Dict], threshold: float) -> List[Tuple[str, float, float, float]]:
+    """
+    Регрессии по p50 и p95: (имя.метрика, baseline, current, изменение).
+    Регрессией считается рост латентности больше чем на threshold (0.1 = 10%).
+    """
+    regressions = []
+    for name, result in current.items():
+        base = baseline.get(name)
+        if not base:
+            continue
+        for key in ("p50_ms", "p95_ms"):
+            if key not in result or not base.get(key):
+                continue
+            change = (result[key] - base[key]) / base[key]
+            if change > threshold:
+                regressions.append((f"{name}.{key}", base[key], result[key], change))
+    return regressions
+
+
+def load_results(path: Path) -> Dict[str, Dict]:
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)["results"]
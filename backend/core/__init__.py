@@ -15,6 +15,9 @@ SECRET_KEY = os.getenv("SECRET_KEY", "your-secret-key-here-change-in-production"
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 REFRESH_TOKEN_EXPIRE_DAYS = 30
+# Токен подписки на SSE (?token=): действует только для GET /image/events
+# и только на время установки соединения — в логах прокси он быстро бесполезен
+STREAM_TOKEN_EXPIRE_SECONDS = int(os.getenv("STREAM_TOKEN_EXPIRE_SECONDS", "60"))
 
 # === Дефолтный admin (задаётся через переменные окружения) ===
 DEFAULT_ADMIN_EMAIL = os.getenv("ADMIN_EMAIL", "admin@datacleaner.com")
@@ -29,6 +32,15 @@ S3_ACCESS_KEY = os.getenv("S3_ACCESS_KEY", "minioadmin")
 S3_SECRET_KEY = os.getenv("S3_SECRET_KEY", "minioadmin")
 S3_BUCKET = os.getenv("S3_BUCKET", "datacleaner-images")
 
+# === Ограничения на изображения ===
+# MAX_FILE_SIZE ограничивает только сжатый размер файла; число пикселей после
+# декодирования ограничивается отдельно (защита от decompression bomb)
+MAX_FILE_SIZE = int(os.getenv("MAX_FILE_SIZE", str(10 * 1024 * 1024)))  # 10 МБ
+MAX_IMAGE_PIXELS = int(os.getenv("MAX_IMAGE_PIXELS", str(80_000_000)))  # ~80 Мп
+
+# === Квоты ===
+FREE_USER_UPLOAD_LIMIT = int(os.getenv("FREE_USER_UPLOAD_LIMIT", "3"))
+
 # === БД ===
 # В Docker передаётся DATABASE_URL=sqlite:////data/auth.db (named volume)
 # При локальной разработке используется sqlite:///./auth.db (рядом с кодом)
@@ -0,0 +1,87 @@
+"""
+Circuit breaker для внешних зависимостей (объектное хранилище):
+
+  - closed: вызовы идут как обычно, подряд идущие сбои считаются;
+  - open: после CIRCUIT_FAILURE_THRESHOLD сбоев подряд вызовы не выполняются
+    вовсе (allow() == False) — недоступный сервис не стоит запросу таймаута
+    соединения с повторами;
+  - half_open: через CIRCUIT_RESET_TIMEOUT секунд один вызов пропускается
+    пробным; успех закрывает цепь, сбой снова открывает её на тот же срок.
+
+Состояние — в памяти процесса, фоновых таймеров нет: переход в half_open
+происходит при очередном allow().
+"""
+import os
+import threading
+import time
+from typing import Dict
+
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "3"))
+CIRCUIT_RESET_TIMEOUT = float(os.getenv("CIRCUIT_RESET_TIMEOUT", "30"))
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+# Значение gauge состояния
+STATE_CODES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+
+class CircuitBreaker:
+
+    def __init__(self, name: str, failure_threshold: int = CIRCUIT_FAILURE_THRESHOLD,
+                 reset_timeout: float = CIRCUIT_RESET_TIMEOUT):
+        self.name = name
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_timeout = reset_timeout
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        # Пробный вызов в half_open уже выдан и ещё не завершился
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._current_state()
+
+    def allow(self) -> bool:
+        """Можно ли выполнить вызов. В half_open разрешается ровно один пробный."""
+        with self._lock:
+            state = self._current_state()
+            if state == CLOSED:
+                return True
+            if state == HALF_OPEN and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return True
+            return False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._state = CLOSED
+            self._failures = 0
+            self._probe_in_flight = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            if self._probe_in_flight or self._failures >= self.failure_threshold:
+                self._state = OPEN
+                self._opened_at = time.monotonic()
+            self._probe_in_flight = False
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            state = self._current_state()
+            retry_in = self._opened_at + self.reset_timeout - time.monotonic() if state == OPEN else 0.0
+            return {
+                "state": state,
+                "consecutive_failures": self._failures,
+                "retry_in_seconds": round(max(retry_in, 0.0), 1),
+            }
+
+    def _current_state(self) -> str:
+        if self._state == OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+            self._state = HALF_OPEN
+        return self._state
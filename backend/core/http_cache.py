@@ -0,0 +1,84 @@
+"""
+Условные запросы: weak ETag и 304 Not Modified.
+
+ETag списков и карточек изображений строится из состояния выборки
+(число записей, max(id), max(updated_at)) и параметров запроса, а не из
+тела ответа: при совпадении If-None-Match ответ не собирается и не
+сериализуется. Для маленьких ответов без такого состояния (/auth/me)
+ETag считается по готовому телу.
+
+Статические ответы (SEO) собираются один раз при старте и отдаются из
+памяти с Cache-Control (CachedPayload).
+"""
+import hashlib
+from typing import Dict, Optional
+
+import orjson
+from fastapi import Request, Response
+from fastapi.responses import ORJSONResponse
+
+# Частные ответы API: браузер хранит копию, но перед использованием перепроверяет
+PRIVATE_REVALIDATE = "private, no-cache"
+
+
+def weak_etag(*parts) -> str:
+    digest = hashlib.blake2b(repr(parts).encode("utf-8"), digest_size=16).hexdigest()
+    return f'W/"{digest}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Слабое сравнение (RFC 9110): W/ не учитывается, поддерживаются списки и '*'."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    opaque = etag.removeprefix("W/")
+    return any(
+        candidate.strip().removeprefix("W/") == opaque
+        for candidate in if_none_match.split(",")
+    )
+
+
+def not_modified(etag: str, cache_control: str = PRIVATE_REVALIDATE) -> Response:
+    return Response(status_code=304, headers={"ETag": etag, "Cache-Control": cache_control})
+
+
+def conditional_json(
+        request: Request,
+        content,
+        etag: Optional[str] = None,
+        cache_control: str = PRIVATE_REVALIDATE,
+) -> Response:
+    """
+    JSON-ответ с ETag. Без готового etag он считается по телу — только для
+    небольших ответов, где сериализация дешевле отдельного запроса к БД.
+    """
+    if etag is None:
+        body = orjson.dumps(content)
+        etag = f'W/"{hashlib.blake2b(body, digest_size=16).hexdigest()}"'
+        if etag_matches(request.headers.get("if-none-match"), etag):
+            return not_modified(etag, cache_control)
+        return Response(body, media_type="application/json",
+                        headers={"ETag": etag, "Cache-Control": cache_control})
+
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return not_modified(etag, cache_control)
+    return ORJSONResponse(content, headers={"ETag": etag, "Cache-Control": cache_control})
+
+
+class CachedPayload:
+    """Тело ответа, собранное один раз, с ETag и Cache-Control."""
+
+    def __init__(self, body: bytes, media_type: str, max_age: int = 3600):
+        self.body = body
+        self.media_type = media_type
+        self.etag = f'"{hashlib.blake2b(body, digest_size=16).hexdigest()}"'
+        self.headers: Dict[str, str] = {
+            "ETag": self.etag,
+            "Cache-Control": f"public, max-age={max_age}",
+        }
+
+    def respond(self, request: Request) -> Response:
+        if etag_matches(request.headers.get("if-none-match"), self.etag):
+            return Response(status_code=304, headers=self.headers)
+        return Response(self.body, media_type=self.media_type, headers=self.headers)
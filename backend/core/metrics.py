@@ -0,0 +1,371 @@
+"""
+Метрики в формате Prometheus (text exposition 0.0.4) без внешних зависимостей.
+
+API для сервисов:
+  - with metrics.stage("detect"): ...      — время этапа конвейера
+  - @metrics.timed("encode")                — то же самое декоратором
+  - S3_ERRORS.inc(operation="upload")       — счётчики/гистограммы напрямую
+
+При METRICS_ENABLED=false stage() возвращает общий пустой контекст
+(если запрос не профилируется), а inc/observe выходят сразу.
+"""
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+from functools import wraps
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from .profiling import PROFILING_ENABLED
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_NULL_CONTEXT = nullcontext()
+
+# Этапы текущего запроса [(stage, seconds), ...] — заполняется, когда запрос
+# профилируется (см. core/profiling.py)
+request_stages: ContextVar[Optional[List[Tuple[str, float]]]] = ContextVar("request_stages", default=None)
+
+
+def _format_labels(labelnames: Sequence[str], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(labelnames, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        REGISTRY.register(self)
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self.samples())
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        if not METRICS_ENABLED:
+            return
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, k)} {_format_value(v)}" for k, v in items]
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._functions: Dict[Tuple[str, ...], Callable[[], float]] = {}
+
+    def set(self, value: float, **labels) -> None:
+        if not METRICS_ENABLED:
+            return
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        if not METRICS_ENABLED:
+            return
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels) -> None:
+        self.inc(-amount, **labels)
+
+    def set_function(self, fn: Callable[[], float], **labels) -> None:
+        """Значение вычисляется при каждом запросе /metrics."""
+        with self._lock:
+            self._functions[self._key(labels)] = fn
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            items = dict(self._values)
+            functions = list(self._functions.items())
+        for key, fn in functions:
+            try:
+                items[key] = float(fn())
+            except Exception:
+                continue
+        return [f"{self.name}{_format_labels(self.labelnames, k)} {_format_value(v)}" for k, v in items.items()]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        # label values -> [счётчики по бакетам..., сумма, количество]
+        self._values: Dict[Tuple[str, ...], List[float]] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        if not METRICS_ENABLED:
+            return
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [0.0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[i] += 1
+                    break
+            state[-2] += value
+            state[-1] += 1
+
+    @contextmanager
+    def time(self, **labels) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            items = [(k, list(v)) for k, v in self._values.items()]
+        lines = []
+        for key, state in items:
+            cumulative = 0.0
+            for i, bound in enumerate(self.buckets):
+                cumulative += state[i]
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {_format_value(cumulative)}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(state[-2])}")
+            lines.append(f"{self.name}_count{labels} {_format_value(state[-1])}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+
+    def register(self, metric: _Metric) -> None:
+        self._metrics.append(metric)
+
+    def render(self) -> str:
+        return "\n".join(metric.render() for metric in self._metrics) + "\n"
+
+
+REGISTRY = Registry()
+
+# ── Метрики приложения ────────────────────────────────────────────────────────
+STAGE_SECONDS = Histogram(
+    "datacleaner_pipeline_stage_seconds",
+    "Длительность этапов конвейера обработки изображений",
+    ["stage"],
+)
+ENCODE_SKIPPED = Counter(
+    "datacleaner_encode_skipped_total",
+    "Загрузки без повторного кодирования (объекты не найдены)",
+)
+HTTP_REQUESTS = Counter(
+    "datacleaner_http_requests_total",
+    "HTTP-запросы по маршруту, методу и статусу",
+    ["route", "method", "status"],
+)
+HTTP_REQUEST_SECONDS = Histogram(
+    "datacleaner_http_request_seconds",
+    "Длительность HTTP-запросов по маршруту",
+    ["route", "method"],
+)
+EXECUTOR_QUEUE_DEPTH = Gauge(
+    "datacleaner_executor_queue_depth",
+    "Задачи, ожидающие свободного потока исполнителя",
+    ["executor"],
+)
+CACHE_REQUESTS = Counter(
+    "datacleaner_cache_requests_total",
+    "Обращения к кешам (hit ratio = hit / (hit + miss))",
+    ["cache", "result"],
+)
+S3_ERRORS = Counter(
+    "datacleaner_s3_errors_total",
+    "Ошибки операций с S3 по типу операции",
+    ["operation"],
+)
+GEO_UPSTREAM_SECONDS = Histogram(
+    "datacleaner_geo_upstream_seconds",
+    "Латентность запросов к ip-api.com",
+    ["outcome"],
+)
+SCHEDULER_WAIT_SECONDS = Histogram(
+    "datacleaner_scheduler_wait_seconds",
+    "Ожидание слота обработки по классу приоритета",
+    ["priority_class"],
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0),
+)
+SCHEDULER_QUEUE_DEPTH = Gauge(
+    "datacleaner_scheduler_queue_depth",
+    "Задачи обработки в очереди планировщика по классу приоритета",
+    ["priority_class"],
+)
+SCHEDULER_DROPPED = Counter(
+    "datacleaner_scheduler_dropped_total",
+    "Задачи, снятые с очереди (клиент отключился / истёк срок ожидания)",
+    ["priority_class", "reason"],
+)
+RATE_LIMITED = Counter(
+    "datacleaner_rate_limited_total",
+    "Запросы, отклонённые ограничителем частоты (429)",
+    ["policy", "role"],
+)
+PROGRESS_SUBSCRIBERS = Gauge(
+    "datacleaner_progress_subscribers",
+    "Открытые SSE-соединения прогресса обработки",
+)
+PROGRESS_EVENTS_DROPPED = Counter(
+    "datacleaner_progress_events_dropped_total",
+    "События прогресса, вытесненные из переполненной очереди подписчика",
+)
+
+DETECTION_CACHE_SAVED_SECONDS = Counter(
+    "datacleaner_detection_cache_saved_seconds_total",
+    "Время детекции, сэкономленное повторным использованием рамок почти одинаковых кадров",
+)
+IDEMPOTENT_REPLAYS = Counter(
+    "datacleaner_idempotent_replays_total",
+    "Повторы запросов загрузки, отданные из сохранённого результата Idempotency-Key",
+)
+STORAGE_CIRCUIT_STATE = Gauge(
+    "datacleaner_storage_circuit_state",
+    "Состояние circuit breaker объектного хранилища: 0 closed, 1 half_open, 2 open",
+    ["backend"],
+)
+STORAGE_SHORT_CIRCUITED = Counter(
+    "datacleaner_storage_short_circuited_total",
+    "Операции с хранилищем, пропущенные без обращения к нему (цепь разомкнута)",
+    ["operation"],
+)
+STORAGE_REPLICATED = Counter(
+    "datacleaner_storage_replicated_total",
+    "Локальные файлы, загруженные репликатором в объектное хранилище",
+    ["result"],
+)
+
+
+@contextmanager
+def _timed_stage(name: str) -> Iterator[None]:
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_SECONDS.observe(elapsed, stage=name)
+        stages = request_stages.get()
+        if stages is not None:
+            stages.append((name, elapsed))
+
+
+def stage(name: str):
+    """Контекст-менеджер для замера этапа конвейера."""
+    if not METRICS_ENABLED and request_stages.get() is None:
+        return _NULL_CONTEXT
+    return _timed_stage(name)
+
+
+def timed(name: str):
+    """
+    Декоратор для замера этапа конвейера. При выключенных метриках и
+    профилировании — без обёртки (этапы принудительно профилируемых запросов
+    тогда видны только по stage()).
+    """
+    def decorator(fn):
+        if not METRICS_ENABLED and not PROFILING_ENABLED:
+            return fn
+
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            with stage(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def cache_lookup(cache: str, hit: bool) -> None:
+    """Учёт попадания/промаха кеша."""
+    CACHE_REQUESTS.inc(cache=cache, result="hit" if hit else "miss")
+
+
+def render_latest() -> str:
+    return REGISTRY.render()
+
+
+class MetricsMiddleware:
+    """ASGI middleware: счётчик запросов и латентность по шаблону маршрута."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not METRICS_ENABLED:
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status_code: List[Optional[int]] = [None]
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status_code[0] = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        except Exception:
+            status_code[0] = 500
+            raise
+        finally:
+            # Шаблон маршрута (/image/{image_id}), а не сырой путь — иначе
+            # кардинальность меток растёт с каждым id
+            route = scope.get("route")
+            route_path = getattr(route, "path", None) or "unmatched"
+            method = scope.get("method", "")
+            HTTP_REQUESTS.inc(route=route_path, method=method, status=str(status_code[0] or 500))
+            HTTP_REQUEST_SECONDS.observe(time.perf_counter() - start, route=route_path, method=method)
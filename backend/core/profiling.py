@@ -0,0 +1,188 @@
+"""
+Профилирование запросов в продакшене.
+
+  - Сэмплирующий профайлер: фоновый поток раз в PROFILING_INTERVAL_MS снимает
+    стеки потоков, обрабатывающих запрос (sys._current_frames), и считает
+    частоту кадров. Накладные расходы не зависят от глубины вызовов.
+  - Потоки запроса: event loop (async-обработчики и middleware) и поток пула
+    AnyIO, в котором выполняется синхронный обработчик, — его регистрирует
+    ProfiledRoute (route_class роутеров) через contextvar current_profiler.
+  - Профилируется доля PROFILING_SAMPLE_RATE запросов, либо запрос
+    администратора с заголовком X-Profile: 1.
+  - Медленные запросы (> PROFILING_SLOW_MS) и явно запрошенные профили
+    сохраняются в кольцевой буфер: этапы конвейера + топ кадров стека.
+"""
+import asyncio
+import os
+import random
+import sys
+import threading
+import uuid
+from collections import Counter, deque
+from contextvars import ContextVar
+from datetime import datetime
+from functools import wraps
+from typing import Callable, Deque, Dict, List, Optional, Tuple
+
+from fastapi.routing import APIRoute
+
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "false").lower() == "true"
+PROFILING_SAMPLE_RATE = float(os.getenv("PROFILING_SAMPLE_RATE", "0.01"))
+PROFILING_SLOW_MS = float(os.getenv("PROFILING_SLOW_MS", "2000"))
+PROFILING_BUFFER_SIZE = int(os.getenv("PROFILING_BUFFER_SIZE", "50"))
+PROFILING_INTERVAL_MS = float(os.getenv("PROFILING_INTERVAL_MS", "5"))
+PROFILING_HEADER = "X-Profile"
+
+_MAX_STACK_DEPTH = 40
+_TOP_FRAMES = 25
+
+_profiles: Deque[dict] = deque(maxlen=PROFILING_BUFFER_SIZE)
+_profiles_lock = threading.Lock()
+
+
+class SamplingProfiler:
+    """Сэмплирует стеки потоков запроса из отдельного daemon-потока."""
+
+    def __init__(self, thread_id: int, interval: float = PROFILING_INTERVAL_MS / 1000):
+        self.thread_ids = {thread_id}
+        self.interval = interval
+        self.samples = 0
+        self._stacks: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="request-profiler", daemon=True)
+
+    def start(self) -> "SamplingProfiler":
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join(timeout=1.0)
+
+    def add_thread(self, thread_id: int) -> None:
+        self.thread_ids = self.thread_ids | {thread_id}
+
+    def remove_thread(self, thread_id: int) -> None:
+        self.thread_ids = self.thread_ids - {thread_id}
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            frames = sys._current_frames()
+            for thread_id in self.thread_ids:
+                frame = frames.get(thread_id)
+                # Простаивающий event loop (ждёт в selectors) — не работа запроса
+                if frame is None or frame.f_code.co_filename.endswith("selectors.py"):
+                    continue
+                stack = []
+                while frame is not None and len(stack) < _MAX_STACK_DEPTH:
+                    code = frame.f_code
+                    stack.append((code.co_filename, frame.f_lineno, code.co_name))
+                    frame = frame.f_back
+                self._stacks[tuple(stack)] += 1
+                self.samples += 1
+
+    def top_frames(self, limit: int = _TOP_FRAMES) -> List[dict]:
+        """Кадры с наибольшей долей сэмплов (inclusive — кадр есть где-то в стеке)."""
+        inclusive: Counter = Counter()
+        leaf: Counter = Counter()
+        for stack, count in self._stacks.items():
+            if stack:
+                leaf[stack[0]] += count
+            for frame in set(stack):
+                inclusive[frame] += count
+
+        result = []
+        for (filename, lineno, name), count in inclusive.most_common(limit):
+            result.append({
+                "frame": f"{name} ({_short_path(filename)}:{lineno})",
+                "samples": count,
+                "self_samples": leaf.get((filename, lineno, name), 0),
+                "share": round(count / self.samples, 3) if self.samples else 0.0,
+            })
+        return result
+
+
+# Профайлер текущего запроса (задаётся middleware, копируется в поток обработчика)
+current_profiler: ContextVar[Optional[SamplingProfiler]] = ContextVar("current_profiler", default=None)
+
+
+def _register_thread(endpoint: Callable) -> Callable:
+    """Синхронный обработчик: поток пула, в котором он выполняется, добавляется к профилю."""
+    @wraps(endpoint)
+    def wrapper(*args, **kwargs):
+        profiler = current_profiler.get()
+        if profiler is None:
+            return endpoint(*args, **kwargs)
+        thread_id = threading.get_ident()
+        profiler.add_thread(thread_id)
+        try:
+            return endpoint(*args, **kwargs)
+        finally:
+            profiler.remove_thread(thread_id)
+
+    wrapper.profiled = True
+    return wrapper
+
+
+class ProfiledRoute(APIRoute):
+    """Маршрут, синхронный обработчик которого виден сэмплирующему профайлеру."""
+
+    def __init__(self, path: str, endpoint: Callable, **kwargs):
+        if not asyncio.iscoroutinefunction(endpoint) and not getattr(endpoint, "profiled", False):
+            endpoint = _register_thread(endpoint)
+        super().__init__(path, endpoint, **kwargs)
+
+
+def _short_path(filename: str) -> str:
+    parts = filename.replace("\\", "/").split("/")
+    return "/".join(parts[-2:])
+
+
+def should_sample() -> bool:
+    return PROFILING_ENABLED and random.random() < PROFILING_SAMPLE_RATE
+
+
+def record(
+        method: str,
+        path: str,
+        status_code: int,
+        duration: float,
+        stages: List[Tuple[str, float]],
+        profiler: Optional[SamplingProfiler],
+        forced: bool,
+) -> None:
+    """Сохраняет профиль медленного (или явно запрошенного) запроса в буфер."""
+    duration_ms = duration * 1000
+    if not forced and duration_ms < PROFILING_SLOW_MS:
+        return
+
+    entry = {
+        "id": str(uuid.uuid4()),
+        "timestamp": datetime.utcnow().isoformat(),
+        "method": method,
+        "path": path,
+        "status_code": status_code,
+        "duration_ms": round(duration_ms, 2),
+        "forced": forced,
+        "stages": [{"stage": name, "ms": round(seconds * 1000, 2)} for name, seconds in stages],
+        "samples": profiler.samples if profiler else 0,
+        "top_frames": profiler.top_frames() if profiler else [],
+    }
+    with _profiles_lock:
+        _profiles.append(entry)
+
+
+def get_profiles() -> List[dict]:
+    with _profiles_lock:
+        return list(_profiles)
+
+
+def clear_profiles() -> None:
+    with _profiles_lock:
+        _profiles.clear()
+
+
+def summary(entry: Dict) -> dict:
+    """Краткая запись для списка профилей (без стеков)."""
+    return {key: entry[key] for key in ("id", "timestamp", "method", "path", "status_code",
+                                        "duration_ms", "forced", "samples")}
@@ -0,0 +1,150 @@
+"""
+Ограничение частоты запросов: token bucket в памяти процесса.
+
+  - Ключ — (политика, user id) для авторизованных маршрутов
+    или (политика, IP) для анонимных (/auth/login, /auth/register).
+  - На активный ключ хранится пара (токены, время последнего обновления);
+    токены пополняются лениво при обращении — фоновых таймеров нет.
+  - Ключи упорядочены по времени последнего обращения (OrderedDict):
+    простаивающие дольше времени полного пополнения вытесняются с начала
+    за O(1) на запрос, общее число ключей ограничено RATE_LIMIT_MAX_KEYS.
+
+Лимиты задаются строкой "<запросов>/<секунд>" на политику и роль и
+переопределяются переменными окружения RATE_LIMIT_<POLICY>_<ROLE>,
+например RATE_LIMIT_UPLOAD_FREE_USER=5/60. Пустое значение или "0" —
+без ограничения.
+
+Состояние не разделяется между процессами: при WEB_WORKERS=N фактический
+лимит на пользователя до N раз выше (балансировщик обычно распределяет
+соединения одного клиента по воркерам неравномерно).
+"""
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "true").lower() == "true"
+RATE_LIMIT_MAX_KEYS = int(os.getenv("RATE_LIMIT_MAX_KEYS", "100000"))
+
+# Роль для анонимных запросов (ключ — IP)
+ANONYMOUS = "anonymous"
+
+# Лимиты по умолчанию: политика -> роль -> "<запросов>/<секунд>"
+DEFAULT_LIMITS: Dict[str, Dict[str, str]] = {
+    # POST /image/ — CPU-bound обработка
+    "upload": {"free_user": "10/60", "pro_user": "60/60", "admin": "300/60"},
+    # /auth/login, /auth/register — Argon2 по ~50 мс CPU на попытку
+    "auth": {ANONYMOUS: "10/60"},
+}
+
+
+@dataclass(frozen=True)
+class Limit:
+    capacity: int
+    period: float
+
+    @property
+    def rate(self) -> float:
+        """Токенов в секунду."""
+        return self.capacity / self.period
+
+    @property
+    def policy_header(self) -> str:
+        return f"{self.capacity};w={int(self.period)}"
+
+    @classmethod
+    def parse(cls, value: str) -> Optional["Limit"]:
+        value = (value or "").strip()
+        if not value or value == "0":
+            return None
+        count, _, seconds = value.partition("/")
+        return cls(capacity=int(count), period=float(seconds or 1))
+
+
+@dataclass(frozen=True)
+class Decision:
+    allowed: bool
+    limit: Limit
+    remaining: int
+    reset_after: float    # секунд до полного пополнения корзины
+    retry_after: float    # секунд до появления следующего токена (0 — если разрешено)
+
+    def headers(self) -> Dict[str, str]:
+        headers = {
+            "RateLimit-Limit": str(self.limit.capacity),
+            "RateLimit-Remaining": str(self.remaining),
+            "RateLimit-Reset": str(math.ceil(self.reset_after)),
+            "RateLimit-Policy": self.limit.policy_header,
+        }
+        if not self.allowed:
+            headers["Retry-After"] = str(max(1, math.ceil(self.retry_after)))
+        return headers
+
+
+def get_limit(policy: str, role: str) -> Optional[Limit]:
+    """Лимит для политики и роли с учётом переопределения из окружения."""
+    env_name = f"RATE_LIMIT_{policy}_{role}".upper()
+    value = os.getenv(env_name)
+    if value is None:
+        value = DEFAULT_LIMITS.get(policy, {}).get(role, "")
+    return Limit.parse(value)
+
+
+class TokenBucketLimiter:
+    """Набор token bucket'ов с вытеснением простаивающих ключей."""
+
+    def __init__(self, max_keys: int = RATE_LIMIT_MAX_KEYS, clock=time.monotonic):
+        self.max_keys = max_keys
+        self._clock = clock
+        # key -> (токены, время обновления, время полного пополнения)
+        self._buckets: "OrderedDict[Tuple[str, str], Tuple[float, float, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+    def hit(self, key: Tuple[str, str], limit: Limit, cost: float = 1.0) -> Decision:
+        now = self._clock()
+        with self._lock:
+            state = self._buckets.pop(key, None)
+            if state is None:
+                tokens = float(limit.capacity)
+            else:
+                tokens, updated, _ = state
+                tokens = min(limit.capacity, tokens + (now - updated) * limit.rate)
+
+            allowed = tokens >= cost
+            if allowed:
+                tokens -= cost
+
+            full_after = (limit.capacity - tokens) / limit.rate
+            self._buckets[key] = (tokens, now, now + full_after)
+            self._evict(now)
+
+        retry_after = 0.0 if allowed else (cost - tokens) / limit.rate
+        return Decision(
+            allowed=allowed,
+            limit=limit,
+            remaining=int(tokens),
+            reset_after=full_after,
+            retry_after=retry_after,
+        )
+
+    def _evict(self, now: float) -> None:
+        """Удаляет с начала очереди полностью пополненные корзины (они неотличимы от новых)."""
+        buckets = self._buckets
+        while buckets:
+            key, (_, _, full_at) = next(iter(buckets.items()))
+            if full_at > now and len(buckets) <= self.max_keys:
+                break
+            del buckets[key]
+
+    def reset(self) -> None:
+        with self._lock:
+            self._buckets.clear()
+
+
+limiter = TokenBucketLimiter()
@@ -1,10 +1,11 @@
-from typing import List
-from fastapi import Depends, HTTPException, status
+from typing import List, Optional, Tuple, Type
+from fastapi import Depends, HTTPException, Query, Request, Response, status
+from pydantic import BaseModel
 from sqlalchemy.orm import Session
 from jwt.exceptions import InvalidTokenError
 import jwt
 
-from core import SECRET_KEY, ALGORITHM, oauth2_scheme, get_db
+from core import SECRET_KEY, ALGORITHM, oauth2_scheme, get_db, SessionLocal, metrics, rate_limit as rl
 from models.user import User
 from schemas.user import UserResponse
 
@@ -18,7 +19,8 @@ def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         email: str = payload.get("sub")
-        if email is None:
+        # Токен подписки на SSE не заменяет access token
+        if email is None or payload.get("type") == "stream":
             raise credentials_exception
     except InvalidTokenError:
         raise credentials_exception
@@ -38,6 +40,54 @@ def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(
     )
 
 
+def get_stream_user(request: Request, token: Optional[str] = Query(None, include_in_schema=False)) -> UserResponse:
+    """
+    Пользователь для долгих потоков (SSE). EventSource в браузере не умеет
+    передавать заголовки, поэтому в ?token= принимается только короткоживущий
+    токен подписки (POST /image/events/token), а не access token: строка
+    запроса попадает в access log uvicorn и прокси.
+    Сессия БД закрывается сразу после проверки, а не держится до конца потока.
+    """
+    authorization = request.headers.get("Authorization", "")
+    db = SessionLocal()
+    try:
+        if authorization.startswith("Bearer "):
+            return get_current_user(authorization[len("Bearer "):], db)
+        return _get_stream_token_user(token, db)
+    finally:
+        db.close()
+
+
+def _get_stream_token_user(token: Optional[str], db: Session) -> UserResponse:
+    credentials_exception = HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Could not validate stream token",
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+    if not token:
+        raise credentials_exception
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    except InvalidTokenError:
+        raise credentials_exception
+    email = payload.get("sub")
+    if payload.get("type") != "stream" or not email:
+        raise credentials_exception
+
+    user = db.query(User).filter(User.email == email).first()
+    if user is None:
+        raise credentials_exception
+    return UserResponse(
+        id=user.id,
+        email=user.email,
+        username=user.username,
+        name=user.name,
+        role=user.role,
+        upload_count=user.upload_count,
+        created_at=user.created_at.isoformat()
+    )
+
+
 def require_role(roles: List[str]):
     """
     Фабрика dependency-зависимостей для проверки ролей.
@@ -53,3 +103,82 @@ def require_role(roles: List[str]):
             )
         return current_user
     return check_role
+
+
+def sparse_fields(model: Type[BaseModel]):
+    """
+    Фабрика dependency для параметра fields=id,url,... (sparse fieldset).
+    Возвращает кортеж запрошенных полей model в порядке их объявления
+    или None, если параметр не задан (все поля). Неизвестное поле — 422.
+    """
+    allowed = tuple(model.model_fields)
+
+    def parse_fields(
+            fields: Optional[str] = Query(None, description=f"Поля ответа через запятую: {', '.join(allowed)}"),
+    ) -> Optional[Tuple[str, ...]]:
+        if not fields:
+            return None
+        requested = {name.strip() for name in fields.split(",") if name.strip()}
+        unknown = requested.difference(allowed)
+        if unknown:
+            raise HTTPException(
+                status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                detail=f"Неизвестные поля: {', '.join(sorted(unknown))}. Допустимые: {', '.join(allowed)}",
+            )
+        return tuple(name for name in allowed if name in requested)
+    return parse_fields
+
+
+def is_admin_token(token: str) -> bool:
+    """Проверка access token вне dependency-механизма (например, в middleware)."""
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    except InvalidTokenError:
+        return False
+    email = payload.get("sub")
+    if not email or payload.get("type") == "stream":
+        return False
+
+    db = SessionLocal()
+    try:
+        user = db.query(User).filter(User.email == email).first()
+        return user is not None and user.role == "admin"
+    finally:
+        db.close()
+
+
+def _enforce_rate_limit(policy: str, role: str, key: str, response: Response) -> None:
+    limit = rl.get_limit(policy, role)
+    if not rl.RATE_LIMIT_ENABLED or limit is None:
+        return
+    decision = rl.limiter.hit((policy, key), limit)
+    if not decision.allowed:
+        metrics.RATE_LIMITED.inc(policy=policy, role=role)
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Слишком много запросов. Попробуйте позже",
+            headers=decision.headers(),
+        )
+    for name, value in decision.headers().items():
+        response.headers[name] = value
+
+
+def rate_limit(policy: str):
+    """
+    Фабрика dependency: token bucket по пользователю, лимит зависит от роли.
+    Добавляет к ответу заголовки RateLimit-*, при превышении — 429 с Retry-After.
+
+    Пример: Depends(rate_limit("upload"))
+    """
+    def check_rate_limit(response: Response, current_user: UserResponse = Depends(get_current_user)):
+        _enforce_rate_limit(policy, current_user.role, f"user:{current_user.id}", response)
+        return current_user
+    return check_rate_limit
+
+
+def rate_limit_by_ip(policy: str):
+    """Фабрика dependency для анонимных маршрутов: token bucket по IP клиента."""
+    def check_rate_limit(request: Request, response: Response):
+        client_ip = request.client.host if request.client else "unknown"
+        _enforce_rate_limit(policy, rl.ANONYMOUS, f"ip:{client_ip}", response)
+    return check_rate_limit
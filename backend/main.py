@@ -1,98 +1,93 @@
+import logging
 import os
+import re
 import sys
-import logging
+import threading
+import time
+from contextlib import asynccontextmanager
+
+import anyio.to_thread
 
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
 from fastapi import FastAPI, Depends, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, ORJSONResponse, PlainTextResponse
 from fastapi.exceptions import RequestValidationError
 from starlette.exceptions import HTTPException as StarletteHTTPException
 from sqlalchemy import text
 
 from api import router
 from api.seo import router as seo_router  # SEO: robots.txt, sitemap.xml, JSON-LD
-from core import (engine, Base, UPLOADS_DIR, SessionLocal,
-                  DEFAULT_ADMIN_EMAIL, DEFAULT_ADMIN_USERNAME,
-                  DEFAULT_ADMIN_NAME, DEFAULT_ADMIN_PASSWORD)
+from core import engine, UPLOADS_DIR
+from core import metrics, profiling
+from core.compression import CompressionMiddleware
+from core.http_cache import conditional_json
 from models import User, RefreshToken  # noqa: F401 — ensure table is registered
-from services import AuthService
-from dependencies import get_current_user
+from dependencies import get_current_user, is_admin_token
 
-Base.metadata.create_all(bind=engine)
+# Схема БД и admin по умолчанию создаются отдельной командой `python manage.py migrate`
+# (run.py выполняет её один раз перед запуском сервера), а не при импорте приложения.
 
-# Миграция: добавляем колонку role если её ещё нет
-with engine.connect() as conn:
-    try:
-        conn.execute(text("ALTER TABLE users ADD COLUMN role VARCHAR DEFAULT 'user' NOT NULL"))
-        conn.commit()
-    except Exception:
-        pass  # Колонка уже существует
+# Прогрев AI-модели в фоне при старте; до его завершения /ready отвечает 503
+WARMUP_ON_STARTUP = os.getenv("WARMUP_ON_STARTUP", "true").lower() == "true"
 
-# Миграция: добавляем колонку upload_count если её ещё нет
-with engine.connect() as conn:
-    try:
-        conn.execute(text("ALTER TABLE users ADD COLUMN upload_count INTEGER DEFAULT 0 NOT NULL"))
-        conn.commit()
-    except Exception:
-        pass  # Колонка уже существует
+# Очередь пула потоков, в котором Starlette выполняет синхронные обработчики
+metrics.EXECUTOR_QUEUE_DEPTH.set_function(
+    lambda: anyio.to_thread.current_default_thread_limiter().statistics().tasks_waiting,
+    executor="threadpool",
+)
 
-# Миграция: переименовываем роль 'user' -> 'free_user'
-with engine.connect() as conn:
-    conn.execute(text("UPDATE users SET role='free_user' WHERE role='user'"))
-    conn.commit()
+# Токены в строке запроса (?token= у GET /image/events) не пишутся в access log
+_TOKEN_QUERY = re.compile(r"([?&]token=)[^&\s]*")
 
-# Миграция: добавляем колонку detected_count если её ещё нет
-with engine.connect() as conn:
-    try:
-        conn.execute(text("ALTER TABLE images ADD COLUMN detected_count INTEGER DEFAULT 0 NOT NULL"))
-        conn.commit()
-    except Exception:
-        pass  # Колонка уже существует
 
-# Миграция: добавляем колонку s3_key если её ещё нет
-with engine.connect() as conn:
-    try:
-        conn.execute(text("ALTER TABLE images ADD COLUMN s3_key VARCHAR"))
-        conn.commit()
-    except Exception:
-        pass  # Колонка уже существует
+class _RedactTokenFilter(logging.Filter):
+    def filter(self, record: logging.LogRecord) -> bool:
+        # uvicorn.access: args = (client_addr, method, full_path, http_version, status_code)
+        if isinstance(record.args, tuple) and len(record.args) >= 3 and "token=" in str(record.args[2]):
+            args = list(record.args)
+            args[2] = _TOKEN_QUERY.sub(r"\1***", str(args[2]))
+            record.args = tuple(args)
+        return True
 
 
-def create_default_admin() -> None:
-    """Создаёт admin-пользователя при старте, если ни одного admin ещё нет."""
-    db = SessionLocal()
-    try:
-        admin_exists = db.query(User).filter(User.role == 'admin').first()
-        if admin_exists:
-            return
-
-        hashed_password = AuthService.hash_password(DEFAULT_ADMIN_PASSWORD)
-        admin = User(
-            email=DEFAULT_ADMIN_EMAIL,
-            username=DEFAULT_ADMIN_USERNAME,
-            name=DEFAULT_ADMIN_NAME,
-            hashed_password=hashed_password,
-            role='admin'
-        )
-        db.add(admin)
-        db.commit()
-        logging.getLogger(__name__).info(
-            f"Default admin created: email={DEFAULT_ADMIN_EMAIL}, password={DEFAULT_ADMIN_PASSWORD}"
-        )
-    finally:
-        db.close()
+logging.getLogger("uvicorn.access").addFilter(_RedactTokenFilter())
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if WARMUP_ON_STARTUP:
+        from services.ai_service import ai_service
+
+        # Каскад загружается в отдельном потоке — /health доступен сразу
+        threading.Thread(target=ai_service.ensure_loaded, name="ai-warmup", daemon=True).start()
 
+    from services.inference_pool import inference_pool
+    if inference_pool.enabled:
+        # Процессы пула форкаются заранее, чтобы первый запрос не ждал их старта
+        threading.Thread(target=inference_pool.start, name="inference-pool-start", daemon=True).start()
+
+    from services.storage_replicator import storage_replicator
+    # Догрузка в S3 файлов, сохранённых локально, пока хранилище было недоступно
+    storage_replicator.start()
+    yield
+    storage_replicator.stop()
+    # Graceful shutdown: принятые задачи дорабатывают, затем процессы пула завершаются
+    inference_pool.shutdown(wait=True)
 
-create_default_admin()
 
 app = FastAPI(
     title="DataCleaner API",
     version="1.0.0",
     description="API сервиса анонимизации изображений DataCleaner",
+    lifespan=lifespan,
+    # orjson быстрее стандартного json и сериализует datetime/date без jsonable_encoder
+    default_response_class=ORJSONResponse,
 )
+# Синхронные обработчики выполняются в пуле потоков AnyIO — их поток виден профайлеру
+app.router.route_class = profiling.ProfiledRoute
 
 app.add_middleware(
     CORSMiddleware,
@@ -102,8 +97,58 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Метрики: счётчики запросов и латентность по маршрутам (/metrics)
+app.add_middleware(metrics.MetricsMiddleware)
+
+# Сжатие ответов: brotli/gzip для JSON и XML от COMPRESSION_MIN_SIZE байт
+app.add_middleware(CompressionMiddleware)
+
 app.mount("/uploads", StaticFiles(directory=str(UPLOADS_DIR)), name="uploads")
 
+# ── Профилирование: сэмплирование доли запросов и захват медленных ──────────
+@app.middleware("http")
+async def profiling_middleware(request: Request, call_next):
+    forced = False
+    if request.headers.get(profiling.PROFILING_HEADER) == "1":
+        authorization = request.headers.get("Authorization", "")
+        if authorization.startswith("Bearer "):
+            forced = await anyio.to_thread.run_sync(is_admin_token, authorization[len("Bearer "):])
+
+    if not profiling.PROFILING_ENABLED and not forced:
+        return await call_next(request)
+
+    stages = []
+    stages_token = metrics.request_stages.set(stages)
+    # Сэмплируется event loop (async-обработчики); поток синхронного обработчика
+    # добавляет ProfiledRoute через current_profiler
+    profiler = None
+    if forced or profiling.should_sample():
+        profiler = profiling.SamplingProfiler(threading.get_ident()).start()
+    profiler_token = profiling.current_profiler.set(profiler)
+
+    started = time.perf_counter()
+    status_code = 500
+    try:
+        response = await call_next(request)
+        status_code = response.status_code
+        return response
+    finally:
+        duration = time.perf_counter() - started
+        metrics.request_stages.reset(stages_token)
+        profiling.current_profiler.reset(profiler_token)
+        if profiler:
+            profiler.stop()
+        profiling.record(
+            method=request.method,
+            path=request.url.path,
+            status_code=status_code,
+            duration=duration,
+            stages=stages,
+            profiler=profiler,
+            forced=forced,
+        )
+
+
 # ── SEO роутер — монтируется без префикса (robots.txt, sitemap.xml на корне) ─
 app.include_router(seo_router)
 
@@ -134,6 +179,8 @@ async def http_exception_handler(request: Request, exc: StarletteHTTPException):
             "status_code": exc.status_code,
             "path": str(request.url.path),
         },
+        # WWW-Authenticate (401), Retry-After и RateLimit-* (429)
+        headers=getattr(exc, "headers", None),
     )
 
 
@@ -152,13 +199,44 @@ async def validation_exception_handler(request: Request, exc: RequestValidationE
 
 @app.get("/health", tags=["system"])
 async def health_check():
+    """Liveness: процесс жив и обслуживает запросы."""
     return {"status": "healthy", "service": "datacleaner"}
 
 
+@app.get("/ready", tags=["system"])
+def readiness_check():
+    """Readiness: AI-модель загружена и БД доступна."""
+    from services.ai_service import ai_service
+
+    checks = {"model": ai_service.is_loaded, "database": True}
+    try:
+        with engine.connect() as conn:
+            conn.execute(text("SELECT 1"))
+    except Exception:
+        checks["database"] = False
+
+    ready = all(checks.values())
+    return JSONResponse(
+        status_code=200 if ready else 503,
+        content={"status": "ready" if ready else "not_ready", "checks": checks},
+    )
+
+
+@app.get("/metrics", tags=["system"], include_in_schema=False)
+async def metrics_endpoint():
+    """Метрики в формате Prometheus."""
+    if not metrics.METRICS_ENABLED:
+        raise StarletteHTTPException(status_code=404)
+    return PlainTextResponse(
+        content=metrics.render_latest(),
+        media_type="text/plain; version=0.0.4; charset=utf-8",
+    )
+
+
 @app.get("/profile", tags=["system"])
-async def get_profile(current_user=Depends(get_current_user)):
-    """Получить профиль текущего пользователя"""
-    return current_user
+async def get_profile(request: Request, current_user=Depends(get_current_user)):
+    """Получить профиль текущего пользователя (ETag по телу, 304 при совпадении)"""
+    return conditional_json(request, current_user.model_dump())
 
 
 if __name__ == "__main__":
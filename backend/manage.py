@@ -0,0 +1,218 @@
+# backend/manage.py
+"""
+Служебные команды (выполняются один раз, отдельно от HTTP-воркеров):
+
+    python manage.py migrate      # схема БД, миграции колонок, admin по умолчанию
+    python manage.py purge        # удалить изображения по политике RETENTION_DAYS_<ROLE> (для cron)
+    python manage.py backfill-stats  # пересчитать счётчики и дневную сводку по существующим данным
+    python manage.py reconcile    # сверить UPLOADS_DIR, S3 и images после сбоев (для cron)
+"""
+import argparse
+import logging
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from sqlalchemy import text  # noqa: E402
+
+from core import (engine, Base, SessionLocal,  # noqa: E402
+                  DEFAULT_ADMIN_EMAIL, DEFAULT_ADMIN_USERNAME,
+                  DEFAULT_ADMIN_NAME, DEFAULT_ADMIN_PASSWORD)
+import models  # noqa: E402,F401 — регистрация всех таблиц в Base.metadata
+from models import User  # noqa: E402
+
+logger = logging.getLogger(__name__)
+
+# Добавление колонок в существующие таблицы: (таблица, DDL колонки)
+ADD_COLUMN_MIGRATIONS = [
+    ("users", "role VARCHAR DEFAULT 'user' NOT NULL"),
+    ("users", "upload_count INTEGER DEFAULT 0 NOT NULL"),
+    ("images", "detected_count INTEGER DEFAULT 0 NOT NULL"),
+    ("images", "s3_key VARCHAR"),
+    ("images", "file_size INTEGER DEFAULT 0 NOT NULL"),
+    ("images", "processing_ms INTEGER DEFAULT 0 NOT NULL"),
+    ("images", "updated_at DATETIME"),
+    ("images", "method VARCHAR DEFAULT 'blur' NOT NULL"),
+    ("images", "replication_attempts INTEGER DEFAULT 0 NOT NULL"),
+    ("detection_hashes", "content_hash VARCHAR(64)"),
+]
+
+# Заполнение новых колонок существующих записей
+DATA_MIGRATIONS = [
+    "UPDATE images SET updated_at = created_at WHERE updated_at IS NULL",
+]
+
+# Индексы для таблиц, созданных до их появления в моделях
+INDEX_MIGRATIONS = [
+    "CREATE INDEX IF NOT EXISTS ix_images_user_id ON images (user_id)",
+]
+
+
+def run_migrations() -> None:
+    """Создаёт таблицы и применяет миграции колонок (идемпотентно)."""
+    Base.metadata.create_all(bind=engine)
+
+    for table, column_ddl in ADD_COLUMN_MIGRATIONS:
+        with engine.connect() as conn:
+            try:
+                conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {column_ddl}"))
+                conn.commit()
+            except Exception:
+                pass  # Колонка уже существует
+
+    with engine.connect() as conn:
+        for statement in INDEX_MIGRATIONS + DATA_MIGRATIONS:
+            conn.execute(text(statement))
+        conn.commit()
+
+    # Миграция: переименовываем роль 'user' -> 'free_user'
+    with engine.connect() as conn:
+        conn.execute(text("UPDATE users SET role='free_user' WHERE role='user'"))
+        conn.commit()
+
+
+def create_default_admin() -> None:
+    """Создаёт admin-пользователя, если ни одного admin ещё нет."""
+    from repositories.stats_repository import StatsRepository
+    from services.auth_service import AuthService
+
+    db = SessionLocal()
+    try:
+        admin_exists = db.query(User).filter(User.role == 'admin').first()
+        if admin_exists:
+            return
+
+        hashed_password = AuthService.hash_password(DEFAULT_ADMIN_PASSWORD)
+        admin = User(
+            email=DEFAULT_ADMIN_EMAIL,
+            username=DEFAULT_ADMIN_USERNAME,
+            name=DEFAULT_ADMIN_NAME,
+            hashed_password=hashed_password,
+            role='admin'
+        )
+        db.add(admin)
+        StatsRepository(db).record_user('admin')
+        db.commit()
+        logger.info(
+            f"Default admin created: email={DEFAULT_ADMIN_EMAIL}, password={DEFAULT_ADMIN_PASSWORD}"
+        )
+    finally:
+        db.close()
+
+
+def stats_empty() -> bool:
+    from repositories.stats_repository import StatsRepository
+
+    db = SessionLocal()
+    try:
+        repo = StatsRepository(db)
+        return not repo.get_all() or repo.usage_empty()
+    finally:
+        db.close()
+
+
+def backfill_stats() -> dict:
+    """Пересчёт system_stats и usage_daily по таблицам (и размеров файлов старых записей)."""
+    from repositories.stats_repository import StatsRepository
+
+    db = SessionLocal()
+    try:
+        repo = StatsRepository(db)
+        repo.backfill_file_sizes()
+        stats = repo.rebuild()
+        stats["usage_daily_rows"] = repo.rebuild_usage()
+        db.commit()
+        return stats
+    finally:
+        db.close()
+
+
+def migrate() -> None:
+    run_migrations()
+    # Счётчики dashboard считаются по таблицам один раз, дальше — инкрементально
+    needs_stats = stats_empty()
+    create_default_admin()
+    if needs_stats:
+        backfill_stats()
+
+
+def main(argv=None) -> int:
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="DataCleaner management commands")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("migrate", help="Создать/обновить схему БД и admin по умолчанию")
+
+    purge_parser = subparsers.add_parser("purge", help="Удалить изображения старше срока хранения")
+    purge_parser.add_argument(
+        "--days", action="append", default=[], metavar="ROLE=DAYS",
+        help="Срок хранения для роли (можно несколько раз). По умолчанию — RETENTION_DAYS_<ROLE>",
+    )
+    purge_parser.add_argument("--dry-run", action="store_true", help="Только посчитать записи")
+
+    subparsers.add_parser("backfill-stats", help="Пересчитать счётчики и дневную сводку по существующим данным")
+
+    reconcile_parser = subparsers.add_parser(
+        "reconcile", help="Найти и исправить расхождения между UPLOADS_DIR, S3 и таблицей images",
+    )
+    reconcile_parser.add_argument("--dry-run", action="store_true", help="Только посчитать расхождения")
+    reconcile_parser.add_argument(
+        "--grace-minutes", type=int, default=None,
+        help="Не трогать файлы и записи моложе N минут. По умолчанию — RECONCILE_GRACE_MINUTES",
+    )
+
+    args = parser.parse_args(argv)
+    if args.command == "migrate":
+        migrate()
+        print("✅ Миграции применены")
+    elif args.command == "backfill-stats":
+        stats = backfill_stats()
+        print(f"✅ Статистика пересчитана: {stats}")
+    elif args.command == "purge":
+        return purge(args.days, args.dry_run)
+    elif args.command == "reconcile":
+        return reconcile(args.dry_run, args.grace_minutes)
+    return 0
+
+
+def purge(days_args, dry_run: bool) -> int:
+    from services.purge_service import PurgeService, default_retention_days
+
+    policy = default_retention_days()
+    for item in days_args:
+        role, _, days = item.partition("=")
+        policy[role] = int(days)
+    if not any(days > 0 for days in policy.values()):
+        print("Политика хранения пуста: задайте --days ROLE=DAYS или RETENTION_DAYS_<ROLE>")
+        return 1
+
+    db = SessionLocal()
+    try:
+        if dry_run:
+            for role, days in policy.items():
+                count = PurgeService.retention_query(db, role, days).count() if days > 0 else 0
+                print(f"{role}: {count} изображений старше {days} дн.")
+            return 0
+        deleted = PurgeService.purge_retention(db, policy)
+    finally:
+        db.close()
+    print(f"✅ Удалено изображений: {deleted}")
+    return 0
+
+
+def reconcile(dry_run: bool, grace_minutes) -> int:
+    from services.reconcile_service import ReconcileService
+
+    db = SessionLocal()
+    try:
+        report = ReconcileService.run(db, dry_run=dry_run, grace_minutes=grace_minutes)
+    finally:
+        db.close()
+    for name, count in report.items():
+        print(f"{name}: {count}")
+    print("✅ Сверка завершена" + (" (dry run, ничего не изменено)" if dry_run else ""))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,4 +1,9 @@
 # backend/models/__init__.py
 from .user import User
 from .image import Image
-from .refresh_token import RefreshToken
\ No newline at end of file
+from .refresh_token import RefreshToken
+from .system_stat import SystemStat
+from .usage_daily import UsageDaily
+from .detection_hash import DetectionHash
+from .idempotency_key import IdempotencyKey
+from .upload_session import UploadSession
@@ -0,0 +1,31 @@
+from sqlalchemy import Column, Integer, DateTime, BigInteger, String, Text
+from datetime import datetime
+from core import Base
+
+
+class DetectionHash(Base):
+    """
+    Перцептивный хеш (dHash) кадра и найденные на нём рамки — кеш детекции
+    для почти одинаковых изображений (серии снимков, повторные экспорты).
+    """
+    __tablename__ = "detection_hashes"
+
+    id = Column(Integer, primary_key=True)
+    # 64-битный dHash как знаковое целое SQLite
+    dhash = Column(BigInteger, nullable=False)
+    # Полосы хеша (13, 13, 13, 13, 12 бит) для поиска кандидатов по индексу:
+    # при расстоянии Хэмминга не больше 4 хотя бы одна полоса совпадает точно
+    band0 = Column(Integer, nullable=False, index=True)
+    band1 = Column(Integer, nullable=False, index=True)
+    band2 = Column(Integer, nullable=False, index=True)
+    band3 = Column(Integer, nullable=False, index=True)
+    band4 = Column(Integer, nullable=False, index=True)
+    width = Column(Integer, nullable=False)
+    height = Column(Integer, nullable=False)
+    # SHA-256 пикселей и настроек детектора: рамки переиспользуются только при совпадении
+    content_hash = Column(String(64), nullable=True)
+    # JSON-список объектов в формате detected_objects
+    objects = Column(Text, nullable=False)
+    # Время полной детекции — оценка сэкономленного CPU при повторном использовании
+    detect_ms = Column(Integer, default=0, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
@@ -0,0 +1,24 @@
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Text, UniqueConstraint
+from datetime import datetime
+from core import Base
+
+
+class IdempotencyKey(Base):
+    """
+    Ключ Idempotency-Key запроса загрузки и его результат: повтор запроса
+    с тем же ключом возвращает сохранённый ответ без повторной обработки.
+    """
+    __tablename__ = "idempotency_keys"
+    __table_args__ = (UniqueConstraint("user_id", "key", name="uq_idempotency_keys_user_key"),)
+
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    key = Column(String, nullable=False)
+    # SHA-256 содержимого и параметров запроса: тот же ключ с другими данными — ошибка клиента
+    fingerprint = Column(String, nullable=False)
+    # pending — запрос выполняется, completed — ответ сохранён
+    status = Column(String, default="pending", nullable=False)
+    image_id = Column(Integer, nullable=True)
+    # JSON ответа на момент завершения (если изображение уже удалено)
+    response = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False, index=True)
@@ -9,12 +9,24 @@ class Image(Base):
     id = Column(Integer, primary_key=True, index=True)
     filename = Column(String, nullable=False)
     original_name = Column(String, nullable=False)
-    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
     created_at = Column(DateTime, default=datetime.utcnow)
+    # Меняется при любом изменении записи — входит в ETag списков и карточки
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
     processed = Column(Boolean, default=False)
+    # Метод анонимизации: blur, pixelate, none
+    method = Column(String, default="blur", nullable=False)
     detected_objects = Column(Text)
     detected_count = Column(Integer, default=0)
 
     # S3 ключ файла (None для старых записей — используется локальный /uploads/)
     s3_key = Column(String, nullable=True)
+    # Неудачные попытки фоновой репликации в хранилище (сбрасывается при новом файле)
+    replication_attempts = Column(Integer, default=0, nullable=False)
+
+    # Размер сохранённого файла в байтах (0 для записей до появления колонки)
+    file_size = Column(Integer, default=0, nullable=False)
+
+    # Время AI обработки в миллисекундах (0 — без обработки или до появления колонки)
+    processing_ms = Column(Integer, default=0, nullable=False)
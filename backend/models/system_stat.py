@@ -0,0 +1,12 @@
+from sqlalchemy import Column, Integer, String, DateTime
+from datetime import datetime
+from core import Base
+
+
+class SystemStat(Base):
+    """Системные счётчики для admin dashboard, обновляются инкрементально."""
+    __tablename__ = "system_stats"
+
+    key = Column(String, primary_key=True)
+    value = Column(Integer, default=0, nullable=False)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
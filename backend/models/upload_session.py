@@ -0,0 +1,19 @@
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey
+from datetime import datetime
+from core import Base
+
+
+class UploadSession(Base):
+    """Возобновляемая загрузка частями: данные копятся в UPLOADS_DIR/.partial/{id}.part."""
+    __tablename__ = "upload_sessions"
+
+    id = Column(String, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+    filename = Column(String, nullable=False)
+    content_type = Column(String, nullable=False)
+    process_type = Column(String, default="blur", nullable=False)
+    # Объявленный размер файла и число уже принятых байт (источник истины — БД, не длина файла)
+    size = Column(Integer, nullable=False)
+    received = Column(Integer, default=0, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
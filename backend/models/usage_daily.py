@@ -0,0 +1,16 @@
+from sqlalchemy import Column, Integer, Date, ForeignKey, BigInteger
+from core import Base
+
+
+class UsageDaily(Base):
+    """Дневная сводка по пользователю, обновляется инкрементально вместе с images."""
+    __tablename__ = "usage_daily"
+
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    day = Column(Date, primary_key=True, index=True)
+
+    uploads = Column(Integer, default=0, nullable=False)
+    processed = Column(Integer, default=0, nullable=False)
+    detections = Column(Integer, default=0, nullable=False)
+    bytes = Column(BigInteger, default=0, nullable=False)
+    processing_ms = Column(BigInteger, default=0, nullable=False)
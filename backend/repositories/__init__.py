@@ -1,2 +1,3 @@
 from .user_repository import UserRepository
 from .token_repository import TokenRepository
+from .stats_repository import StatsRepository
@@ -0,0 +1,238 @@
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterable, List, Optional
+
+from sqlalchemy import Integer, String, cast, delete, func, insert as sql_insert, select
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.orm import Session
+
+from core import UPLOADS_DIR
+from models.image import Image
+from models.system_stat import SystemStat
+from models.usage_daily import UsageDaily
+from models.user import User
+
+# Ключи system_stats
+USERS_TOTAL = "users_total"
+IMAGES_TOTAL = "images_total"
+IMAGES_PROCESSED = "images_processed"
+DETECTIONS_TOTAL = "detections_total"
+STORAGE_BYTES = "storage_bytes"
+ROLE_PREFIX = "users_role_"
+
+# Счётчики дневной сводки usage_daily
+USAGE_FIELDS = ("uploads", "processed", "detections", "bytes", "processing_ms")
+USAGE_BUCKETS = ("day", "week", "month")
+
+
+def bucket_start(day: date, bucket: str) -> date:
+    """Начало периода: понедельник для week, первое число для month."""
+    if bucket == "week":
+        return day - timedelta(days=day.weekday())
+    if bucket == "month":
+        return day.replace(day=1)
+    return day
+
+
+def next_bucket(start: date, bucket: str) -> date:
+    if bucket == "week":
+        return start + timedelta(days=7)
+    if bucket == "month":
+        return (start.replace(day=28) + timedelta(days=4)).replace(day=1)
+    return start + timedelta(days=1)
+
+
+class StatsRepository:
+    """
+    Агрегаты для админки. Счётчики system_stats меняются в той же транзакции,
+    что и изменение данных (методы не делают commit), поэтому dashboard
+    читает несколько строк вместо сканирования users и images.
+    """
+
+    def __init__(self, db: Session):
+        self.db = db
+
+    def increment(self, deltas: Dict[str, int]) -> None:
+        """Атомарно прибавляет значения к счётчикам (UPSERT, без commit)."""
+        rows = [{"key": key, "value": value} for key, value in deltas.items() if value]
+        if not rows:
+            return
+        stmt = insert(SystemStat).values(rows)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[SystemStat.key],
+            set_={"value": SystemStat.value + stmt.excluded.value, "updated_at": func.current_timestamp()},
+        )
+        self.db.execute(stmt)
+
+    def record_images(self, images: Iterable, sign: int = 1) -> None:
+        """
+        Учёт добавленных (sign=1) или удалённых (sign=-1) изображений.
+        images — модели или строки запроса с user_id, created_at, processed,
+        detected_count, file_size, processing_ms.
+        """
+        deltas = {IMAGES_TOTAL: 0, IMAGES_PROCESSED: 0, DETECTIONS_TOTAL: 0, STORAGE_BYTES: 0}
+        usage = defaultdict(lambda: dict.fromkeys(USAGE_FIELDS, 0))
+        for image in images:
+            deltas[IMAGES_TOTAL] += sign
+            deltas[IMAGES_PROCESSED] += sign if image.processed else 0
+            deltas[DETECTIONS_TOTAL] += sign * (image.detected_count or 0)
+            deltas[STORAGE_BYTES] += sign * (image.file_size or 0)
+
+            day = (image.created_at or datetime.utcnow()).date()
+            row = usage[(image.user_id, day)]
+            row["uploads"] += sign
+            row["processed"] += sign if image.processed else 0
+            row["detections"] += sign * (image.detected_count or 0)
+            row["bytes"] += sign * (image.file_size or 0)
+            row["processing_ms"] += sign * (image.processing_ms or 0)
+        self.increment(deltas)
+        self.increment_usage(usage)
+
+    def increment_usage(self, usage: Dict[tuple, Dict[str, int]]) -> None:
+        """UPSERT дневной сводки: {(user_id, day): {поле: прирост}} (без commit)."""
+        rows = [
+            {"user_id": user_id, "day": day, **values}
+            for (user_id, day), values in usage.items() if any(values.values())
+        ]
+        if not rows:
+            return
+        stmt = insert(UsageDaily).values(rows)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[UsageDaily.user_id, UsageDaily.day],
+            set_={field: getattr(UsageDaily, field) + stmt.excluded[field] for field in USAGE_FIELDS},
+        )
+        self.db.execute(stmt)
+
+    def usage_series(
+            self,
+            user_id: Optional[int],
+            date_from: date,
+            date_to: date,
+            bucket: str = "day",
+    ) -> List[Dict]:
+        """
+        Временной ряд по сводке usage_daily с группировкой day/week/month.
+        user_id=None — по всем пользователям. Пустые периоды заполняются нулями.
+        """
+        if bucket == "week":
+            period = func.date(UsageDaily.day, "weekday 0", "-6 days", type_=String)
+        elif bucket == "month":
+            period = func.strftime("%Y-%m-01", UsageDaily.day, type_=String)
+        else:
+            period = func.date(UsageDaily.day, type_=String)
+
+        query = self.db.query(
+            period.label("period"),
+            *(func.sum(getattr(UsageDaily, field)) for field in USAGE_FIELDS),
+        ).filter(UsageDaily.day >= date_from, UsageDaily.day <= date_to)
+        if user_id is not None:
+            query = query.filter(UsageDaily.user_id == user_id)
+        totals = {
+            date.fromisoformat(row[0]): dict(zip(USAGE_FIELDS, row[1:]))
+            for row in query.group_by("period").all()
+        }
+
+        series = []
+        start = bucket_start(date_from, bucket)
+        while start <= date_to:
+            series.append({"period": start, **totals.get(start, dict.fromkeys(USAGE_FIELDS, 0))})
+            start = next_bucket(start, bucket)
+        return series
+
+    def record_user(self, role: str, sign: int = 1) -> None:
+        self.increment({USERS_TOTAL: sign, f"{ROLE_PREFIX}{role}": sign})
+
+    def record_role_change(self, old_role: str, new_role: str) -> None:
+        if old_role != new_role:
+            self.increment({f"{ROLE_PREFIX}{old_role}": -1, f"{ROLE_PREFIX}{new_role}": 1})
+
+    def get_all(self) -> Dict[str, int]:
+        return {row.key: row.value for row in self.db.query(SystemStat).all()}
+
+    def last_updated(self):
+        return self.db.query(func.max(SystemStat.updated_at)).scalar()
+
+    def user_aggregates(self, user_ids: List[int]) -> Dict[int, Dict[str, int]]:
+        """Число изображений, объектов и байт по пользователям — один GROUP BY по индексу user_id."""
+        if not user_ids:
+            return {}
+        rows = (
+            self.db.query(
+                Image.user_id,
+                func.count(Image.id),
+                func.coalesce(func.sum(Image.detected_count), 0),
+                func.coalesce(func.sum(Image.file_size), 0),
+            )
+            .filter(Image.user_id.in_(user_ids))
+            .group_by(Image.user_id)
+            .all()
+        )
+        return {
+            user_id: {"image_count": count, "detections_total": detections, "storage_bytes": size}
+            for user_id, count, detections, size in rows
+        }
+
+    def backfill_file_sizes(self) -> int:
+        """Размер файлов для записей без file_size — по локальной копии в uploads."""
+        updated = 0
+        rows = self.db.query(Image.id, Image.filename).filter(Image.file_size == 0).all()
+        for image_id, filename in rows:
+            path = UPLOADS_DIR / filename
+            if path.exists():
+                self.db.query(Image).filter(Image.id == image_id).update(
+                    {"file_size": path.stat().st_size}, synchronize_session=False
+                )
+                updated += 1
+        return updated
+
+    def rebuild(self) -> Dict[str, int]:
+        """Пересчёт всех счётчиков по таблицам (миграция, восстановление после сбоя)."""
+        images_total, processed, detections, storage = self.db.query(
+            func.count(Image.id),
+            func.coalesce(func.sum(cast(Image.processed, Integer)), 0),
+            func.coalesce(func.sum(Image.detected_count), 0),
+            func.coalesce(func.sum(Image.file_size), 0),
+        ).one()
+        stats = {
+            USERS_TOTAL: 0,
+            IMAGES_TOTAL: images_total,
+            IMAGES_PROCESSED: processed,
+            DETECTIONS_TOTAL: detections,
+            STORAGE_BYTES: storage,
+        }
+        for role, count in self.db.query(User.role, func.count(User.id)).group_by(User.role).all():
+            stats[f"{ROLE_PREFIX}{role}"] = count
+            stats[USERS_TOTAL] += count
+
+        self.db.execute(delete(SystemStat))
+        self.db.add_all(SystemStat(key=key, value=value) for key, value in stats.items())
+        return stats
+
+    def rebuild_usage(self) -> int:
+        """Пересчёт usage_daily по images одним INSERT ... SELECT. Возвращает число строк."""
+        day = func.date(Image.created_at)
+        source = (
+            select(
+                Image.user_id,
+                day,
+                func.count(Image.id),
+                func.coalesce(func.sum(cast(Image.processed, Integer)), 0),
+                func.coalesce(func.sum(Image.detected_count), 0),
+                func.coalesce(func.sum(Image.file_size), 0),
+                func.coalesce(func.sum(Image.processing_ms), 0),
+            )
+            .where(Image.created_at.is_not(None))
+            .group_by(Image.user_id, day)
+        )
+        self.db.execute(delete(UsageDaily))
+        self.db.execute(
+            sql_insert(UsageDaily).from_select(["user_id", "day", *USAGE_FIELDS], source)
+        )
+        return self.db.query(func.count()).select_from(UsageDaily).scalar()
+
+    def usage_empty(self) -> bool:
+        """Сводка пуста, а изображения есть (БД до появления usage_daily)."""
+        return (
+            self.db.query(UsageDaily.user_id).first() is None
+            and self.db.query(Image.id).first() is not None
+        )
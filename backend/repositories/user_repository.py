@@ -1,5 +1,9 @@
+from typing import List, Optional
+
+from sqlalchemy import or_
 from sqlalchemy.orm import Session
 from models.user import User
+from .stats_repository import StatsRepository
 
 
 class UserRepository:
@@ -20,9 +24,31 @@ class UserRepository:
     def get_admin(self):
         return self.db.query(User).filter(User.role == 'admin').first()
 
+    def list_page(
+            self,
+            after_id: Optional[int] = None,
+            limit: int = 50,
+            search: Optional[str] = None,
+            role: Optional[str] = None,
+    ) -> List[User]:
+        """
+        Keyset-пагинация по id: WHERE id > after_id ORDER BY id LIMIT n.
+        Стоимость страницы не зависит от её номера, в отличие от OFFSET.
+        """
+        query = self.db.query(User)
+        if after_id:
+            query = query.filter(User.id > after_id)
+        if search and search.strip():
+            pattern = f"%{search.strip()}%"
+            query = query.filter(or_(User.email.ilike(pattern), User.username.ilike(pattern)))
+        if role:
+            query = query.filter(User.role == role)
+        return query.order_by(User.id).limit(limit).all()
+
     def create(self, **kwargs) -> User:
         user = User(**kwargs)
         self.db.add(user)
+        StatsRepository(self.db).record_user(user.role or 'free_user')
         self.db.commit()
         self.db.refresh(user)
         return user
@@ -1,19 +1,182 @@
 # backend/run.py
+"""
+Запуск сервера.
+
+    python run.py                                  # один процесс (разработка)
+    python run.py --workers auto --inference-workers auto
+
+Продакшен-режим (--workers > 1 или --inference-workers > 0):
+  - родитель применяет миграции, импортирует приложение и загружает каскад
+    ДО fork — код и модель делятся между воркерами copy-on-write;
+  - N HTTP-воркеров принимают соединения с общего сокета;
+  - у каждого HTTP-воркера свой пул из M/N процессов инференса
+    (shared-nothing), OpenCV в них работает в 1 поток;
+  - SIGTERM/SIGINT: воркеры перестают принимать соединения, дожидаются
+    текущих запросов (до --graceful-timeout) и останавливают пулы.
+
+Компромиссы (замер: python -m benchmarks.run --suite workers):
+  - пропускная способность обработки растёт почти линейно с числом процессов
+    инференса до числа физических ядер, дальше — только рост латентности;
+  - каждый процесс инференса добавляет лишь приватную память (кадры и буферы),
+    модель и интерпретатор остаются общими страницами; HTTP-воркер
+    без OpenCV-нагрузки — самый дешёвый по RSS;
+  - больше HTTP-воркеров нужно только при высокой доле лёгких запросов
+    (списки, auth); для загрузок ограничивающий ресурс — процессы инференса.
+"""
+import argparse
+import logging
 import os
+import signal
+import socket
 import sys
+import time
 
 # Добавляем текущую директорию в PYTHONPATH
 current_dir = os.path.dirname(os.path.abspath(__file__))
 sys.path.insert(0, current_dir)
 
-# Теперь импортируем и запускаем
-if __name__ == "__main__":
-    from main import app
+logger = logging.getLogger("launcher")
+
+
+def _parse_count(value: str, auto: int) -> int:
+    return auto if value == "auto" else max(0, int(value))
+
+
+def _serve_worker(app, sock: socket.socket, args, http_workers: int, inference_workers: int) -> None:
+    """Тело HTTP-воркера после fork."""
     import uvicorn
+    from services.ai_service import ai_service
+    from services.inference_pool import inference_pool
 
-    uvicorn.run(
+    inference_pool.configure(inference_workers)
+    # Потоки OpenCV (профиль auto) — с учётом размера пула и числа соседних воркеров
+    ai_service.configure_runtime(web_workers=http_workers)
+    config = uvicorn.Config(
         app=app,
-        host="0.0.0.0",
-        port=8000,
-        log_level="info"
-    )
\ No newline at end of file
+        log_level="info",
+        timeout_graceful_shutdown=args.graceful_timeout,
+    )
+    server = uvicorn.Server(config)
+    server.run(sockets=[sock])
+
+
+def run_prefork(app, args, http_workers: int, inference_total: int) -> int:
+    """Prefork-мастер: общий сокет, N HTTP-воркеров, перезапуск упавших, graceful drain."""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((args.host, args.port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+
+    per_worker = max(1, inference_total // http_workers) if inference_total else 0
+    logger.info(
+        f"Старт: {http_workers} HTTP-воркеров, по {per_worker} процессов инференса на воркер, "
+        f"http://{args.host}:{args.port}"
+    )
+
+    children = {}
+    stopping = False
+
+    def spawn() -> None:
+        pid = os.fork()
+        if pid == 0:
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            try:
+                _serve_worker(app, sock, args, http_workers, per_worker)
+            finally:
+                os._exit(0)
+        children[pid] = time.monotonic()
+
+    def stop(signum, frame) -> None:
+        nonlocal stopping
+        stopping = True
+        for pid in list(children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    for _ in range(http_workers):
+        spawn()
+
+    deadline = None
+    while children:
+        if stopping and deadline is None:
+            deadline = time.monotonic() + args.graceful_timeout + 5
+        try:
+            pid, status = os.waitpid(-1, os.WNOHANG)
+        except ChildProcessError:
+            break
+        if pid == 0:
+            if deadline is not None and time.monotonic() > deadline:
+                logger.warning("Воркеры не завершились вовремя — SIGKILL")
+                for child in list(children):
+                    try:
+                        os.kill(child, signal.SIGKILL)
+                    except ProcessLookupError:
+                        pass
+                deadline = float("inf")
+            time.sleep(0.2)
+            continue
+
+        children.pop(pid, None)
+        if not stopping:
+            logger.warning(f"HTTP-воркер {pid} завершился (status={status}), перезапуск")
+            spawn()
+
+    sock.close()
+    return 0
+
+
+def main(argv=None) -> int:
+    cpu_count = os.cpu_count() or 1
+    parser = argparse.ArgumentParser(description="DataCleaner server launcher")
+    parser.add_argument("--host", default=os.getenv("HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", "8000")))
+    parser.add_argument(
+        "--workers", default=os.getenv("WEB_WORKERS", "1"),
+        help="HTTP-воркеров (число или auto = max(1, ядра/4)). Каждый ~ интерпретатор "
+             "+ приложение; растить при большой доле лёгких запросов",
+    )
+    parser.add_argument(
+        "--inference-workers", default=os.getenv("INFERENCE_WORKERS", "0"),
+        help="Процессов инференса всего (число или auto = число ядер); 0 — обработка "
+             "внутри HTTP-воркера. Пропускная способность загрузок растёт до числа ядер",
+    )
+    parser.add_argument(
+        "--graceful-timeout", type=int, default=int(os.getenv("GRACEFUL_TIMEOUT", "30")),
+        help="Сколько секунд ждать завершения текущих запросов при SIGTERM",
+    )
+    parser.add_argument("--skip-migrations", action="store_true",
+                        help="Не выполнять manage.py migrate перед стартом")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+
+    http_workers = max(1, _parse_count(args.workers, max(1, cpu_count // 4)))
+    inference_total = _parse_count(args.inference_workers, cpu_count)
+
+    # Миграции — один раз до старта сервера, а не при импорте приложения
+    if not args.skip_migrations:
+        from manage import migrate
+        migrate()
+
+    from main import app
+
+    if http_workers == 1 and inference_total == 0:
+        import uvicorn
+        uvicorn.run(app=app, host=args.host, port=args.port, log_level="info",
+                    timeout_graceful_shutdown=args.graceful_timeout)
+        return 0
+
+    # Предзагрузка до fork: модель и импортированные модули делятся copy-on-write
+    from services.ai_service import ai_service
+    ai_service.ensure_loaded()
+    return run_prefork(app, args, http_workers, inference_total)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
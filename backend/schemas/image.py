@@ -1,4 +1,5 @@
 from pydantic import BaseModel
+from datetime import date
 from typing import Optional, List, Dict, Any
 
 
@@ -12,6 +13,7 @@ class ImageResponse(BaseModel):
     detected_objects: Optional[List[Dict[str, Any]]] = None
     detected_count: int = 0
     s3_key: Optional[str] = None
+    method: str = "blur"
 
     class Config:
         from_attributes = True
@@ -23,3 +25,93 @@ class PaginatedImageResponse(BaseModel):
     page: int
     limit: int
     pages: int
+
+
+class ReprocessRequest(BaseModel):
+    """Повторная обработка сохранённого оригинала."""
+    # blur, pixelate или none; по умолчанию — текущий метод изображения
+    method: Optional[str] = None
+    # Рамки [x1, y1, x2, y2] от пользователя — детекция не выполняется
+    boxes: Optional[List[List[int]]] = None
+    # true — только рамки пользователя, без сохранённых детекций (убрать ложные срабатывания)
+    replace_boxes: bool = False
+
+
+class UploadSessionCreate(BaseModel):
+    """Возобновляемая загрузка: файл передаётся частями в PUT /image/uploads/{id}."""
+    filename: str
+    # Полный размер файла в байтах
+    size: int
+    content_type: str = "image/jpeg"
+    process_type: str = "blur"
+
+
+class UploadSessionResponse(BaseModel):
+    id: str
+    filename: str
+    size: int
+    # Принято байт — смещение следующей части
+    offset: int
+    process_type: str
+    complete: bool
+    expires_at: str
+
+
+class BulkDeleteRequest(BaseModel):
+    """Массовое удаление: список id или фильтры списка изображений."""
+    ids: Optional[List[int]] = None
+    search: Optional[str] = None
+    processed: Optional[bool] = None
+    date_from: Optional[date] = None
+    date_to: Optional[date] = None
+    # Удаление по пустому фильтру (вся история) требует явного подтверждения
+    all: bool = False
+
+
+class PurgeJobResponse(BaseModel):
+    id: str
+    kind: str
+    status: str
+    params: Dict[str, Any] = {}
+    total: int = 0
+    deleted: int = 0
+    failed: int = 0
+    progress: float = 0.0
+    error: Optional[str] = None
+    created_at: str
+    finished_at: Optional[str] = None
+
+
+class BulkDeleteResponse(BaseModel):
+    deleted: int = 0
+    # Для больших удалений — фоновая задача (прогресс: GET /image/jobs/{id})
+    job: Optional[PurgeJobResponse] = None
+
+
+class RetentionPurgeRequest(BaseModel):
+    # Роль -> хранить дней; по умолчанию — RETENTION_DAYS_<ROLE> из окружения
+    days: Optional[Dict[str, int]] = None
+
+
+class UsageTotals(BaseModel):
+    uploads: int = 0
+    processed: int = 0
+    detections: int = 0
+    bytes: int = 0
+    processing_ms: int = 0
+    avg_processing_ms: float = 0.0
+
+
+class UsagePoint(UsageTotals):
+    # Начало периода: день, понедельник недели или первое число месяца
+    period: date
+
+
+class UsageStatsResponse(BaseModel):
+    bucket: str
+    date_from: date
+    date_to: date
+    # None — по всем пользователям (только admin)
+    user_id: Optional[int] = None
+    items: List[UsagePoint]
+    totals: UsageTotals
@@ -1,4 +1,6 @@
 # backend/schemas/user.py
+from typing import Dict, List, Optional
+
 from pydantic import BaseModel
 
 
@@ -31,6 +33,11 @@ class TokenResponse(BaseModel):
     user: UserResponse
 
 
+class StreamTokenResponse(BaseModel):
+    token: str
+    expires_in: int
+
+
 class RefreshTokenRequest(BaseModel):
     refresh_token: str
 
@@ -47,3 +54,24 @@ class UserAdminView(BaseModel):
     role: str
     upload_count: int = 0
     created_at: str
+    # Агрегаты по изображениям пользователя
+    image_count: int = 0
+    detections_total: int = 0
+    storage_bytes: int = 0
+
+
+class UserAdminPage(BaseModel):
+    items: List[UserAdminView]
+    limit: int
+    # id последнего пользователя страницы — передаётся как after_id; None — страниц больше нет
+    next_cursor: Optional[int] = None
+
+
+class AdminDashboard(BaseModel):
+    users_total: int = 0
+    users_by_role: Dict[str, int] = {}
+    images_total: int = 0
+    images_processed: int = 0
+    detections_total: int = 0
+    storage_bytes: int = 0
+    updated_at: Optional[str] = None
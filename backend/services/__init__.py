@@ -1,4 +1,6 @@
 from .auth_service import AuthService
 from .image_service import ImageService
-from .ai_service import ai_service
-from .storage_service import StorageService
\ No newline at end of file
+from .storage_service import StorageService
+
+# ai_service (OpenCV, NumPy) не реэкспортируется: пакет импортируется без него,
+# экземпляр — from services.ai_service import ai_service
@@ -1,22 +1,344 @@
 import cv2
 import numpy as np
 import logging
+import sys
+import threading
+import time
+from functools import lru_cache
 from pathlib import Path
-from typing import List, Dict, Tuple
+from typing import List, Dict, Optional, Tuple
 import os
 
+from core import MAX_IMAGE_PIXELS, metrics
+from . import detection_cache as detection_cache_module
+from .detection_cache import content_digest, detection_cache, dhash
+from .encoder_service import EncoderService
+from .progress import report as report_progress
+
 logger = logging.getLogger(__name__)
 
+# === Тайловый режим для больших изображений ===
+# Изображения больше TILE_PIXEL_THRESHOLD пикселей обрабатываются по тайлам:
+# детекция идёт на перекрывающихся фрагментах (маленькая серая копия на тайл),
+# рамки объединяются через NMS, размытие применяется на месте без копии кадра.
+TILE_PIXEL_THRESHOLD = int(os.getenv("TILE_PIXEL_THRESHOLD", str(12_000_000)))  # ~12 Мп
+TILE_SIZE = int(os.getenv("TILE_SIZE", "2048"))
+TILE_OVERLAP = int(os.getenv("TILE_OVERLAP", "256"))  # должно быть больше ожидаемого размера лица
+NMS_IOU_THRESHOLD = float(os.getenv("NMS_IOU_THRESHOLD", "0.3"))
+
+# === Детекция лиц каскадом Хаара ===
+HAAR_SCALE_FACTOR = float(os.getenv("HAAR_SCALE_FACTOR", "1.3"))
+HAAR_MIN_NEIGHBORS = int(os.getenv("HAAR_MIN_NEIGHBORS", "5"))
+# Уверенность — сигмоида от веса последней ступени каскада (levelWeights из
+# detectMultiScale3): 1 / (1 + exp(-(weight - CENTER) / SCALE)). У чётких лиц вес 6–11
+HAAR_WEIGHT_CENTER = float(os.getenv("HAAR_WEIGHT_CENTER", "2.0"))
+HAAR_WEIGHT_SCALE = float(os.getenv("HAAR_WEIGHT_SCALE", "2.0"))
+# Лица с меньшей уверенностью отбрасываются (для dnn — DNN_CONFIDENCE)
+FACE_MIN_CONFIDENCE = float(os.getenv("FACE_MIN_CONFIDENCE", "0.2"))
+
+# === Профиль выполнения OpenCV ===
+# process — 1 поток OpenCV на процесс: параллелизм даёт пул процессов
+#           (INFERENCE_WORKERS > 0), внутренний пул потоков только мешает;
+# request — многопоточный OpenCV внутри одного запроса (обработка в HTTP-воркере);
+# auto    — process в процессах пула инференса, в остальных request с числом
+#           потоков ядра / (слоты планировщика × HTTP-воркеры), не меньше 1.
+OPENCV_PROFILE = os.getenv("OPENCV_PROFILE", "auto").lower()
+# Потоков OpenCV в профиле request (0 — по числу ядер, в auto — ядра на одну
+# одновременную обработку), иначе потоки OpenCV конкурируют за ядра
+OPENCV_THREADS = int(os.getenv("OPENCV_THREADS", "0"))
+OPENCV_USE_OPTIMIZED = os.getenv("OPENCV_USE_OPTIMIZED", "true").lower() == "true"
+# OpenCL для каскадов Хаара на CPU-серверах медленнее из-за копирования в UMat
+OPENCV_USE_OPENCL = os.getenv("OPENCV_USE_OPENCL", "false").lower() == "true"
+# Повторное использование серых/временных буферов между вызовами (на поток).
+# Буферы больше лимита выделяются разово и не удерживаются
+BUFFER_REUSE = os.getenv("BUFFER_REUSE", "true").lower() == "true"
+BUFFER_REUSE_MAX_BYTES = int(os.getenv("BUFFER_REUSE_MAX_BYTES", str(8 * 1024 * 1024)))
+
+# === Бэкенд детекции ===
+# haar — каскад Хаара; dnn — модель OpenCV DNN (SSD-детектор лиц, например
+# res10_300x300_ssd) из DNN_MODEL_PATH/DNN_CONFIG_PATH; auto — dnn, если задан путь к модели.
+# Модель в репозиторий не входит; если она не загрузилась, используется каскад
+DETECTOR_BACKEND = os.getenv("DETECTOR_BACKEND", "auto").lower()
+DNN_MODEL_PATH = os.getenv("DNN_MODEL_PATH", "")
+DNN_CONFIG_PATH = os.getenv("DNN_CONFIG_PATH", "")
+DNN_INPUT_SIZE = int(os.getenv("DNN_INPUT_SIZE", "300"))
+DNN_MEAN = tuple(float(v) for v in os.getenv("DNN_MEAN", "104,177,123").split(","))
+DNN_SWAP_RB = os.getenv("DNN_SWAP_RB", "false").lower() == "true"
+DNN_CONFIDENCE = float(os.getenv("DNN_CONFIDENCE", "0.5"))
+
+# === Методы анонимизации ===
+ANONYMIZE_METHODS = ("blur", "pixelate")
+# Пересекающиеся рамки объединяются в одну область перед анонимизацией,
+# чтобы каждый пиксель размывался один раз
+ANONYMIZE_MERGE_OVERLAPS = os.getenv("ANONYMIZE_MERGE_OVERLAPS", "true").lower() == "true"
+# Размытие по классу объекта: (размер ядра, sigma)
+BLUR_PARAMS = {
+    'face': (99, 40),
+    'license_plate': (111, 50),
+}
+DEFAULT_BLUR_PARAMS = (75, 30)
+# Число блоков пикселизации по меньшей стороне области
+PIXELATE_BLOCKS = int(os.getenv("PIXELATE_BLOCKS", "10"))
+
+
+def get_peak_rss_mb() -> float:
+    """Пиковое потребление памяти (RSS) текущего процесса в МБ (0 там, где нет resource — Windows)."""
+    try:
+        import resource
+    except ImportError:
+        return 0.0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux отдаёт значение в КБ, macOS — в байтах
+    if sys.platform == "darwin":
+        return peak / 1024 / 1024
+    return peak / 1024
+
+
+@lru_cache(maxsize=None)
+def _gaussian_kernel(size: int, sigma: float) -> np.ndarray:
+    """
+    Одномерное ядро Гаусса. Размытие идёт через sepFilter2D с этим ядром:
+    для uint8 и больших ядер GaussianBlur выбирает точную целочисленную
+    реализацию, которая на порядок медленнее (разница результатов — ±2).
+    """
+    return cv2.getGaussianKernel(size, sigma)
+
+
+def _roi_bounds(bbox: List[int], shape: Tuple[int, ...]) -> Optional[Tuple[int, int, int, int]]:
+    """Рамка [x1, y1, x2, y2], обрезанная по границам кадра; None — пустая область."""
+    x1, y1, x2, y2 = (int(v) for v in bbox)
+    x1, y1 = max(0, x1), max(0, y1)
+    x2, y2 = min(shape[1], x2), min(shape[0], y2)
+    if x2 <= x1 or y2 <= y1:
+        return None
+    return x1, y1, x2, y2
+
+
+def non_max_suppression(boxes: np.ndarray, scores: np.ndarray, iou_threshold: float) -> np.ndarray:
+    """
+    Векторизованный NMS. boxes — массив (N, 4) в формате [x1, y1, x2, y2].
+    Возвращает индексы оставленных рамок в порядке убывания score.
+    """
+    if len(boxes) == 0:
+        return np.empty(0, dtype=np.int64)
+
+    boxes = boxes.astype(np.float32)
+    x1, y1, x2, y2 = boxes[:, 0], boxes[:, 1], boxes[:, 2], boxes[:, 3]
+    areas = (x2 - x1) * (y2 - y1)
+    order = np.argsort(scores)[::-1]
+
+    keep = []
+    while order.size > 0:
+        i = order[0]
+        keep.append(i)
+        rest = order[1:]
+
+        xx1 = np.maximum(x1[i], x1[rest])
+        yy1 = np.maximum(y1[i], y1[rest])
+        xx2 = np.minimum(x2[i], x2[rest])
+        yy2 = np.minimum(y2[i], y2[rest])
+        inter = np.clip(xx2 - xx1, 0, None) * np.clip(yy2 - yy1, 0, None)
+        # Доля пересечения относительно меньшей рамки: лицо, разрезанное
+        # границей тайла, даёт рамку-подмножество, у которой IoU невелик
+        overlap = inter / np.maximum(np.minimum(areas[i], areas[rest]), 1e-6)
+
+        order = rest[overlap <= iou_threshold]
+
+    return np.array(keep, dtype=np.int64)
+
+
+def suppress_duplicates(objects: List[Dict]) -> List[Dict]:
+    """NMS по уверенности: из пересекающихся рамок одного лица остаётся одна."""
+    if len(objects) < 2:
+        return objects
+    boxes = np.array([obj['bbox'] for obj in objects])
+    scores = np.array([obj['confidence'] for obj in objects])
+    return [objects[i] for i in non_max_suppression(boxes, scores, NMS_IOU_THRESHOLD)]
+
+
+def merge_regions(objects: List[Dict], shape: Tuple[int, ...]) -> List[Tuple[Tuple[int, int, int, int], str]]:
+    """
+    Области анонимизации: рамки, обрезанные по кадру, где пересекающиеся
+    объединены в охватывающий прямоугольник (каждый пиксель обрабатывается
+    один раз). Класс области — с самым сильным размытием среди объединённых.
+    """
+    regions = []
+    for obj in objects:
+        bounds = _roi_bounds(obj['bbox'], shape)
+        if bounds is not None:
+            regions.append((bounds, obj['class']))
+    if len(regions) < 2 or not ANONYMIZE_MERGE_OVERLAPS:
+        return regions
+
+    boxes = np.array([bounds for bounds, _ in regions])
+    classes = [class_name for _, class_name in regions]
+    # Охватывающий прямоугольник может задеть новые рамки — повторяем до устойчивости
+    while len(boxes) > 1:
+        overlaps = (
+            (np.maximum(boxes[:, None, 0], boxes[None, :, 0]) < np.minimum(boxes[:, None, 2], boxes[None, :, 2]))
+            & (np.maximum(boxes[:, None, 1], boxes[None, :, 1]) < np.minimum(boxes[:, None, 3], boxes[None, :, 3]))
+        )
+        np.fill_diagonal(overlaps, False)
+        if not overlaps.any():
+            break
+        # Компоненты связности: распространение минимальной метки по рёбрам
+        count = len(boxes)
+        labels = np.arange(count)
+        while True:
+            updated = np.minimum(labels, np.where(overlaps, labels[None, :], count).min(axis=1))
+            updated = updated[updated]
+            if np.array_equal(updated, labels):
+                break
+            labels = updated
+
+        merged_boxes, merged_classes = [], []
+        for label in np.unique(labels):
+            members = np.flatnonzero(labels == label)
+            group = boxes[members]
+            merged_boxes.append([group[:, 0].min(), group[:, 1].min(), group[:, 2].max(), group[:, 3].max()])
+            merged_classes.append(max(
+                (classes[i] for i in members), key=lambda c: BLUR_PARAMS.get(c, DEFAULT_BLUR_PARAMS)[0]
+            ))
+        boxes, classes = np.array(merged_boxes), merged_classes
+
+    return [(tuple(int(v) for v in box), class_name) for box, class_name in zip(boxes, classes)]
+
+
+class ScratchBuffers(threading.local):
+    """
+    Переиспользуемые буферы на поток: один плоский массив на слот
+    (gray, blur), из которого нарезается непрерывный view нужной формы.
+    Для повторяющихся разрешений выделение памяти уходит с горячего пути.
+    """
+
+    def __init__(self):
+        self._slots: Dict[str, np.ndarray] = {}
+
+    def get(self, slot: str, shape: Tuple[int, ...], dtype=np.uint8) -> np.ndarray:
+        size = int(np.prod(shape))
+        nbytes = size * np.dtype(dtype).itemsize
+        if not BUFFER_REUSE or nbytes > BUFFER_REUSE_MAX_BYTES:
+            metrics.cache_lookup("scratch_buffer", False)
+            return np.empty(shape, dtype=dtype)
+
+        buffer = self._slots.get(slot)
+        hit = buffer is not None and buffer.nbytes >= nbytes
+        metrics.cache_lookup("scratch_buffer", hit)
+        if not hit:
+            buffer = np.empty(nbytes, dtype=np.uint8)
+            self._slots[slot] = buffer
+        return buffer[:nbytes].view(dtype).reshape(shape)
+
+    def clear(self) -> None:
+        self._slots.clear()
+
 
 class AIService:
     """AI сервис для обработки изображений"""
 
     def __init__(self):
-        logger.info("🚀 Инициализация AI сервиса...")
-        self.load_models()
+        # Модели загружаются при первом использовании (или прогреве на старте),
+        # а не при импорте модуля
+        self.face_cascade = None
+        self.plate_cascade = None
+        # DNN-детектор лиц (DETECTOR_BACKEND=dnn); Net не потокобезопасен — вызовы под _net_lock
+        self.face_net = None
+        self._net_lock = threading.Lock()
+        self._loaded = False
+        self._load_lock = threading.Lock()
+        self._buffers = ScratchBuffers()
+        self.runtime_profile: Optional[str] = None
+
+    @property
+    def is_loaded(self) -> bool:
+        return self._loaded
+
+    def ensure_loaded(self) -> None:
+        """Однократная потокобезопасная загрузка моделей."""
+        if self._loaded:
+            return
+        with self._load_lock:
+            if not self._loaded:
+                if self.runtime_profile is None:
+                    self.configure_runtime()
+                self.load_models()
+                self._loaded = True
+
+    def configure_runtime(
+            self,
+            profile: Optional[str] = None,
+            threads: Optional[int] = None,
+            web_workers: int = 1,
+    ) -> Dict:
+        """
+        Применяет профиль выполнения OpenCV (потоки, оптимизации, OpenCL).
+        Настройки OpenCV глобальны для процесса. web_workers — число HTTP-воркеров
+        на машине (для профиля auto). Возвращает runtime_info().
+        """
+        profile = (profile or OPENCV_PROFILE).lower()
+        auto = profile == "auto"
+        if auto:
+            profile = "request"
+        if profile not in ("process", "request"):
+            logger.warning(f"Неизвестный OPENCV_PROFILE={profile}, используется request")
+            profile = "request"
+
+        if threads is None:
+            if profile == "process":
+                threads = 1
+            elif OPENCV_THREADS:
+                threads = OPENCV_THREADS
+            elif auto:
+                threads = self._auto_threads(web_workers)
+            else:
+                threads = os.cpu_count() or 1
+
+        cv2.setUseOptimized(OPENCV_USE_OPTIMIZED)
+        cv2.ocl.setUseOpenCL(OPENCV_USE_OPENCL)
+        cv2.setNumThreads(threads)
+        self.runtime_profile = profile
+
+        info = self.runtime_info()
+        logger.info(
+            f"⚙️ OpenCV {info['opencv_version']}: профиль {profile}, потоков {info['threads']}, "
+            f"optimized={info['optimized']}, OpenCL={info['opencl']}, CPU: {info['cpu_features']}"
+        )
+        return info
+
+    @staticmethod
+    def _auto_threads(web_workers: int) -> int:
+        """Ядра на одну одновременную обработку: слоты планировщика × HTTP-воркеры."""
+        from .scheduler import SCHEDULER_ENABLED, processing_scheduler
+
+        cores = os.cpu_count() or 1
+        # Без планировщика одновременных обработок столько, сколько потоков у Starlette
+        concurrency = processing_scheduler.concurrency if SCHEDULER_ENABLED else cores
+        return max(1, cores // (max(1, concurrency) * max(1, web_workers)))
+
+    def runtime_info(self) -> Dict:
+        """Текущие настройки OpenCV и используемые возможности CPU."""
+        build = cv2.getBuildInformation()
+        marker = build.find("Parallel framework:")
+        parallel = build[marker:].split("\n", 1)[0].split(":", 1)[1].strip() if marker >= 0 else "unknown"
+        return {
+            "profile": self.runtime_profile,
+            "opencv_version": cv2.__version__,
+            "threads": cv2.getNumThreads(),
+            "cpu_count": os.cpu_count(),
+            "parallel_framework": parallel,
+            "optimized": cv2.useOptimized(),
+            "opencl": cv2.ocl.useOpenCL(),
+            "opencl_available": cv2.ocl.haveOpenCL(),
+            # Базовые SIMD-расширения сборки и диспетчеризуемые (*) — доступные на этом CPU
+            "cpu_features": cv2.getCPUFeaturesLine(),
+            "buffer_reuse": BUFFER_REUSE,
+            "detector_backend": "dnn" if self.face_net is not None else "haar",
+            "detection_cache": detection_cache.stats(),
+        }
 
     def load_models(self):
         """Загрузка моделей для детекции"""
+        logger.info("🚀 Инициализация AI сервиса...")
         try:
             # Загружаем каскад для лиц
             cascade_path = cv2.data.haarcascades + 'haarcascade_frontalface_default.xml'
@@ -30,117 +352,320 @@ class AIService:
             self.face_cascade = None
             self.plate_cascade = None
 
-    def detect_objects(self, image_np: np.ndarray) -> List[Dict]:
-        """Обнаружение объектов на изображении"""
+        # Каскад загружается и при dnn: на нём работает запасной путь
+        backend = DETECTOR_BACKEND
+        if backend == "auto":
+            backend = "dnn" if DNN_MODEL_PATH else "haar"
+        self.face_net = None
+        if backend == "dnn":
+            try:
+                self.face_net = cv2.dnn.readNet(DNN_MODEL_PATH, DNN_CONFIG_PATH)
+                logger.info(f"✅ Загружена DNN-модель лиц: {DNN_MODEL_PATH}")
+            except cv2.error as e:
+                logger.error(f"❌ DNN-модель не загружена ({e}), используется каскад Хаара")
+
+    def detect_objects(self, image_np: np.ndarray, offset: Tuple[int, int] = (0, 0)) -> List[Dict]:
+        """Обнаружение объектов на изображении (offset — сдвиг тайла в исходном кадре)"""
+        self.ensure_loaded()
+        if self.face_net is not None:
+            objects = self._detect_dnn(image_np)
+        else:
+            objects = self._detect_haar(image_np)
+
+        objects = suppress_duplicates(objects)
+
+        off_x, off_y = offset
+        if off_x or off_y:
+            for obj in objects:
+                x1, y1, x2, y2 = obj['bbox']
+                obj['bbox'] = [x1 + off_x, y1 + off_y, x2 + off_x, y2 + off_y]
+        logger.debug("Обнаружено лиц: %d", len(objects))
+        return objects
+
+    def _detect_haar(self, image_np: np.ndarray) -> List[Dict]:
+        if self.face_cascade is None:
+            return []
+        # Серый кадр пишется в переиспользуемый буфер потока
+        gray = self._buffers.get("gray", image_np.shape[:2])
+        cv2.cvtColor(image_np, cv2.COLOR_BGR2GRAY, dst=gray)
+        faces, _, weights = self.face_cascade.detectMultiScale3(
+            gray, HAAR_SCALE_FACTOR, HAAR_MIN_NEIGHBORS, outputRejectLevels=True,
+        )
+        if len(faces) == 0:
+            return []
+        weights = np.asarray(weights, dtype=np.float64).ravel()
+        confidences = 1.0 / (1.0 + np.exp(-(weights - HAAR_WEIGHT_CENTER) / HAAR_WEIGHT_SCALE))
+        # numpy.int32 -> int для JSON
+        return [
+            {'class': 'face', 'confidence': round(float(confidence), 3), 'bbox': [int(x), int(y), int(x + w), int(y + h)]}
+            for (x, y, w, h), confidence in zip(faces, confidences)
+            if confidence >= FACE_MIN_CONFIDENCE
+        ]
+
+    def _detect_dnn(self, image_np: np.ndarray) -> List[Dict]:
+        """
+        Forward SSD-детектора. Выход [1, 1, N, 7]:
+        [номер кадра, класс, уверенность, x1, y1, x2, y2] в долях размера кадра.
+        """
+        blob = cv2.dnn.blobFromImage(
+            image_np, 1.0, (DNN_INPUT_SIZE, DNN_INPUT_SIZE), DNN_MEAN, swapRB=DNN_SWAP_RB, crop=False,
+        )
+        with self._net_lock:
+            self.face_net.setInput(blob)
+            detections = self.face_net.forward().reshape(-1, 7)
+
+        height, width = image_np.shape[:2]
         objects = []
+        for _, _, confidence, x1, y1, x2, y2 in detections[detections[:, 2] >= DNN_CONFIDENCE]:
+            bbox = [
+                max(0, int(x1 * width)), max(0, int(y1 * height)),
+                min(width, int(x2 * width)), min(height, int(y2 * height)),
+            ]
+            if bbox[2] > bbox[0] and bbox[3] > bbox[1]:
+                objects.append({'class': 'face', 'confidence': round(float(confidence), 3), 'bbox': bbox})
+        return objects
 
-        if self.face_cascade is not None:
-            # Детекция лиц
-            gray = cv2.cvtColor(image_np, cv2.COLOR_BGR2GRAY)
-            faces = self.face_cascade.detectMultiScale(gray, 1.3, 5)
-
-            for (x, y, w, h) in faces:
-                # Конвертируем numpy.int64 в int
-                x_int, y_int, w_int, h_int = int(x), int(y), int(w), int(h)
-                objects.append({
-                    'class': 'face',
-                    'confidence': 0.9,
-                    'bbox': [x_int, y_int, x_int + w_int, y_int + h_int]
-                })
-                logger.debug(f"Обнаружено лицо: {x_int},{y_int},{w_int},{h_int}")
+    def detect_objects_tiled(self, image_np: np.ndarray) -> List[Dict]:
+        """
+        Детекция на перекрывающихся тайлах для больших изображений.
+        Серая копия создаётся только для одного тайла за раз, крупные лица
+        ищутся на уменьшенной копии, дубликаты убираются через NMS.
+        """
+        height, width = image_np.shape[:2]
+        # Перекрытие не больше половины тайла, иначе число тайлов растёт квадратично
+        step = TILE_SIZE - min(TILE_OVERLAP, TILE_SIZE // 2)
 
+        objects = []
+        for y in range(0, height, step):
+            for x in range(0, width, step):
+                # Срез numpy — view без копирования
+                tile = image_np[y:y + TILE_SIZE, x:x + TILE_SIZE]
+                objects.extend(self.detect_objects(tile, offset=(x, y)))
+                if x + TILE_SIZE >= width:
+                    break
+            if y + TILE_SIZE >= height:
+                break
+
+        # Крупные лица, не помещающиеся в тайл, ищем на уменьшенной копии кадра
+        scale = TILE_SIZE / max(height, width)
+        if scale < 1:
+            proxy = cv2.resize(image_np, (int(width * scale), int(height * scale)), interpolation=cv2.INTER_AREA)
+            for obj in self.detect_objects(proxy):
+                obj['bbox'] = [int(round(v / scale)) for v in obj['bbox']]
+                objects.append(obj)
+            del proxy
+
+        merged = suppress_duplicates(objects)
+        logger.debug(f"Тайловая детекция: {len(objects)} рамок -> {len(merged)} после NMS")
+        return merged
+
+    def detect_with_cache(self, image_np: np.ndarray, tiled: bool = False) -> List[Dict]:
+        """
+        Детекция с кешем: рамки из кеша возвращаются только для того же кадра —
+        совпадает SHA-256 пикселей и настроек детектора (CachedDetection.reusable).
+        Совпадение одного dHash, даже с расстоянием 0, не доказывает тождества:
+        новое маленькое лицо его почти не меняет, поэтому такой кадр
+        детектируется заново.
+        """
+        height, width = image_np.shape[:2]
+        key = digest = None
+        if detection_cache.enabled:
+            started = time.perf_counter()
+            key = dhash(image_np)
+            digest = content_digest(image_np, self._detector_signature(tiled))
+            cached = detection_cache.lookup(key, width, height, digest)
+            if cached is None:
+                detection_cache_module.record("miss")
+            elif not cached.reusable(digest):
+                detection_cache_module.record("rejected")
+            else:
+                saved = cached.detect_ms / 1000 - (time.perf_counter() - started)
+                detection_cache_module.record("hit", max(0.0, saved))
+                logger.info(f"♻️ Рамки из кеша детекции (тот же кадр): {len(cached.objects)}")
+                return [dict(obj) for obj in cached.objects]
+
+        started = time.perf_counter()
+        with metrics.stage("detect"):
+            objects = self.detect_objects_tiled(image_np) if tiled else self.detect_objects(image_np)
+        if key is not None:
+            detection_cache.store(key, width, height, objects, round((time.perf_counter() - started) * 1000), digest)
         return objects
 
-    def apply_blur(self, image_np: np.ndarray, objects: List[Dict]) -> np.ndarray:
-        """Применение размытия к обнаруженным областям"""
+    def _detector_signature(self, tiled: bool) -> str:
+        """Настройки, от которых зависит результат детекции (часть ключа кеша)."""
+        if self.face_net is not None:
+            detector = f"dnn:{DNN_MODEL_PATH}:{DNN_INPUT_SIZE}:{DNN_CONFIDENCE}"
+        else:
+            detector = f"haar:{HAAR_SCALE_FACTOR}:{HAAR_MIN_NEIGHBORS}:{FACE_MIN_CONFIDENCE}"
+        if tiled:
+            detector += f"|tiles:{TILE_SIZE}:{TILE_OVERLAP}:{NMS_IOU_THRESHOLD}"
+        return detector
+
+    def anonymize(self, image_np: np.ndarray, objects: List[Dict], method: str, in_place: bool = False) -> np.ndarray:
+        """Размытие (blur) или пикселизация (pixelate) областей объектов."""
+        if method == "pixelate":
+            return self.apply_pixelate(image_np, objects, in_place=in_place)
+        if method == "blur":
+            return self.apply_blur(image_np, objects, in_place=in_place)
+        return image_np
+
+    def apply_pixelate(self, image_np: np.ndarray, objects: List[Dict], in_place: bool = False) -> np.ndarray:
+        """
+        Пикселизация областей объектов: ROI уменьшается до PIXELATE_BLOCKS блоков
+        по меньшей стороне (INTER_AREA усредняет блок) и растягивается обратно
+        без интерполяции. Работает только с ROI, без копии всего кадра при in_place.
+        """
         if not objects:
             return image_np
 
-        processed = image_np.copy()
+        processed = image_np if in_place else image_np.copy()
 
-        for obj in objects:
-            x1, y1, x2, y2 = obj['bbox']
-            class_name = obj['class']
+        for (x1, y1, x2, y2), class_name in merge_regions(objects, processed.shape):
+            roi = processed[y1:y2, x1:x2]
+            self._pixelate_roi(roi, self._buffers.get("blur", roi.shape))
 
-            # Корректируем границы
-            x1, y1 = max(0, x1), max(0, y1)
-            x2, y2 = min(processed.shape[1], x2), min(processed.shape[0], y2)
+            logger.debug(f"Пикселизирован {class_name}: {x1},{y1} - {x2},{y2}")
 
-            if x2 <= x1 or y2 <= y1:
-                continue
+        return processed
 
-            roi = processed[y1:y2, x1:x2]
-            if roi.size == 0:
-                continue
-
-            # Определяем параметры размытия
-            if class_name == 'face':
-                kernel_size = (99, 99)
-                sigma = 40
-            elif class_name == 'license_plate':
-                kernel_size = (111, 111)
-                sigma = 50
-            else:
-                kernel_size = (75, 75)
-                sigma = 30
+    def apply_blur(self, image_np: np.ndarray, objects: List[Dict], in_place: bool = False) -> np.ndarray:
+        """
+        Применение размытия к обнаруженным областям.
+        При in_place=True кадр изменяется на месте без полной копии.
+        """
+        if not objects:
+            return image_np
+
+        processed = image_np if in_place else image_np.copy()
 
-            # Гауссово размытие
-            blurred = cv2.GaussianBlur(roi, kernel_size, sigma)
-            processed[y1:y2, x1:x2] = blurred
+        # Границы обрезаются по кадру, пересекающиеся рамки объединяются
+        for (x1, y1, x2, y2), class_name in merge_regions(objects, processed.shape):
+            roi = processed[y1:y2, x1:x2]
+            self._blur_roi(roi, class_name, self._buffers.get("blur", roi.shape))
 
             logger.debug(f"Размыт {class_name}: {x1},{y1} - {x2},{y2}")
 
         return processed
 
+    @staticmethod
+    def _blur_roi(roi: np.ndarray, class_name: str, scratch: np.ndarray) -> None:
+        """Гауссово размытие области на месте через временный буфер того же размера."""
+        size, sigma = BLUR_PARAMS.get(class_name, DEFAULT_BLUR_PARAMS)
+        kernel = _gaussian_kernel(size, sigma)
+        cv2.sepFilter2D(roi, -1, kernel, kernel, dst=scratch)
+        roi[...] = scratch
+
+    @staticmethod
+    def _pixelate_roi(roi: np.ndarray, scratch: np.ndarray) -> None:
+        """Пикселизация области на месте через временный буфер того же размера."""
+        height, width = roi.shape[:2]
+        block = max(1, min(width, height) // PIXELATE_BLOCKS)
+        small = cv2.resize(roi, (max(1, width // block), max(1, height // block)), interpolation=cv2.INTER_AREA)
+        cv2.resize(small, (width, height), dst=scratch, interpolation=cv2.INTER_NEAREST)
+        roi[...] = scratch
+
+    @staticmethod
+    def load_image(image_path: str) -> np.ndarray:
+        """
+        Декодирование изображения в BGR-массив.
+        Размер проверяется по заголовку до декодирования (защита от decompression bomb).
+        """
+        from PIL import Image, UnidentifiedImageError
+
+        try:
+            with Image.open(image_path) as header:
+                width, height = header.size
+        except Image.DecompressionBombError as e:
+            raise ValueError(f"Изображение слишком велико: {e}")
+        except UnidentifiedImageError:
+            width = height = 0  # формат не распознан PIL — проверит OpenCV (CV_IO_MAX_IMAGE_PIXELS)
+        if width * height > MAX_IMAGE_PIXELS:
+            raise ValueError(
+                f"Изображение слишком велико: {width}x{height} пикселей (лимит {MAX_IMAGE_PIXELS})"
+            )
+
+        # cv2.imread сам применяет EXIF-ориентацию, поэтому детекция идёт по
+        # правильно повёрнутому кадру и результат не зависит от EXIF
+        image_np = cv2.imread(image_path)
+        if image_np is None:
+            # Если OpenCV не смог, пробуем через PIL
+            try:
+                from PIL import ImageOps
+
+                with Image.open(image_path) as pil_img:
+                    image_np = np.array(ImageOps.exif_transpose(pil_img).convert('RGB'))
+                # Конвертация на месте, без дополнительной BGR-копии
+                cv2.cvtColor(image_np, cv2.COLOR_RGB2BGR, dst=image_np)
+            except Exception as e:
+                raise ValueError(f"Не удалось прочитать изображение: {e}")
+
+        return image_np
+
     def process_image(self, image_path: str, method: str = "blur") -> Tuple[str, List[Dict]]:
         """
-        Основная функция обработки изображения
+        Основная функция обработки изображения.
+        Возвращает путь к результату (равен image_path, если изменений нет)
+        и список объектов. При ошибке обработки выбрасывает исключение.
+        """
+        return self._process(image_path, method, objects=None)
+
+    def reprocess_image(self, original_path: str, method: str, objects: Optional[List[Dict]]) -> Tuple[str, List[Dict]]:
+        """
+        Повторная обработка сохранённого оригинала (POST /image/{id}/reprocess).
+        objects — рамки из БД и/или пользователя: детекция не выполняется,
+        кадр декодируется один раз, меняются только области рамок.
+        objects=None — у записи нет сохранённой детекции, она выполняется как при загрузке.
         """
+        return self._process(original_path, method, objects=objects)
+
+    def _process(self, image_path: str, method: str, objects: Optional[List[Dict]]) -> Tuple[str, List[Dict]]:
         try:
             # Чтение изображения
             if not os.path.exists(image_path):
                 raise FileNotFoundError(f"Файл не найден: {image_path}")
 
-            image_np = cv2.imread(image_path)
-            if image_np is None:
-                # Если OpenCV не смог, пробуем через PIL
-                try:
-                    from PIL import Image
-                    pil_img = Image.open(image_path).convert('RGB')
-                    image_np = np.array(pil_img)
-                    image_np = cv2.cvtColor(image_np, cv2.COLOR_RGB2BGR)
-                except Exception as e:
-                    raise ValueError(f"Не удалось прочитать изображение: {e}")
-
-            logger.info(f"📷 Загружено изображение: {image_path}, размер: {image_np.shape}")
-
-            # Детекция объектов
-            objects = self.detect_objects(image_np)
-            logger.info(f"🎯 Обнаружено объектов: {len(objects)}")
-
-            # Применение обработки
-            if method == "blur" and objects:
-                logger.info("🔍 Применяю размытие...")
-                processed_image = self.apply_blur(image_np, objects)
-            else:
-                processed_image = image_np
-
-            # Сохранение результата
+            with metrics.stage("decode"):
+                image_np = self.load_image(image_path)
+            height, width = image_np.shape[:2]
+            tiled = height * width > TILE_PIXEL_THRESHOLD
+
+            logger.info(
+                f"📷 Загружено изображение: {image_path}, размер: {image_np.shape}"
+                f"{', тайловый режим' if tiled else ''}"
+            )
+
+            # Детекция объектов (пропускается, если рамки уже известны)
+            if objects is None:
+                report_progress("detecting")
+                objects = self.detect_with_cache(image_np, tiled)
+                logger.info(f"🎯 Обнаружено объектов: {len(objects)}")
+
+            # Быстрый путь: менять нечего — оригинал остаётся как есть,
+            # без повторного кодирования и без второго файла на диске
+            if not objects or method not in ANONYMIZE_METHODS:
+                logger.info("⏭ Изменений нет, кодирование пропущено")
+                metrics.ENCODE_SKIPPED.inc()
+                return image_path, objects
+
+            # Применение обработки. Исходный кадр больше не нужен — меняем на месте
+            logger.info(f"🔍 Применяю {method}...")
+            report_progress("blurring")
+            with metrics.stage("blur"):
+                processed_image = self.anonymize(image_np, objects, method, in_place=True)
+
+            # Сохранение результата (формат и качество — из настроек кодировщика)
             original_path = Path(image_path)
-            output_filename = f"processed_{original_path.name}"
-            output_path = original_path.parent / output_filename
-
-            success = cv2.imwrite(str(output_path), processed_image)
-            if not success:
-                raise IOError(f"Не удалось сохранить обработанное изображение: {output_path}")
+            output_stem = original_path.parent / f"processed_{original_path.stem}"
+            with metrics.stage("encode"):
+                output_path, _ = EncoderService.encode(processed_image, output_stem, image_path)
 
-            logger.info(f"💾 Сохранено: {output_path}")
+            logger.info(f"💾 Сохранено: {output_path}, пиковый RSS: {get_peak_rss_mb():.1f} МБ")
 
             return str(output_path), objects
 
         except Exception as e:
             logger.error(f"❌ Ошибка обработки изображения: {e}", exc_info=True)
-            return image_path, []
+            raise
 
 
 # Глобальный экземпляр
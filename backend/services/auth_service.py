@@ -7,7 +7,8 @@ from jwt.exceptions import InvalidTokenError
 import jwt
 from datetime import datetime, timedelta
 
-from core import SECRET_KEY, ALGORITHM, ACCESS_TOKEN_EXPIRE_MINUTES, REFRESH_TOKEN_EXPIRE_DAYS
+from core import (SECRET_KEY, ALGORITHM, ACCESS_TOKEN_EXPIRE_MINUTES, REFRESH_TOKEN_EXPIRE_DAYS,
+                  STREAM_TOKEN_EXPIRE_SECONDS)
 from schemas.user import UserCreate, UserResponse
 from repositories.user_repository import UserRepository
 from repositories.token_repository import TokenRepository
@@ -92,6 +93,13 @@ class AuthService:
         to_encode.update({"exp": expire, "type": "access"})
         return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
 
+    @staticmethod
+    def create_stream_token(user_email: str) -> str:
+        """Короткоживущий токен только для подписки на SSE (EventSource не передаёт заголовки)."""
+        expire = datetime.utcnow() + timedelta(seconds=STREAM_TOKEN_EXPIRE_SECONDS)
+        payload = {"sub": user_email, "type": "stream", "exp": expire}
+        return jwt.encode(payload, SECRET_KEY, algorithm=ALGORITHM)
+
     @staticmethod
     def create_refresh_token(db: Session, user_id: int, user_email: str) -> str:
         jti = str(uuid.uuid4())
@@ -0,0 +1,289 @@
+"""
+Кеш результатов детекции по перцептивному хешу (dHash) для почти одинаковых
+изображений: серии снимков и повторные экспорты одного кадра отличаются
+несколькими байтами, поэтому точный хеш содержимого их не находит.
+
+  - dHash: кадр уменьшается до 9x8 (INTER_AREA), переводится в серый, бит —
+    «правый пиксель ярче левого». 64 бита, сравнение по расстоянию Хэмминга.
+  - Память: кольцевой буфер на DETECTION_CACHE_SIZE записей, поиск — XOR и
+    popcount по массиву хешей NumPy за один проход.
+  - SQLite (таблица detection_hashes): общий для процессов пула и переживает
+    перезапуск. Кандидаты выбираются по индексу 5 полос хеша (12–13 бит) без
+    ограничения числа, точное расстояние считается в Python; найденная запись
+    попадает в память под своим хешем.
+  - Рядом с dHash хранится content_digest — SHA-256 декодированных пикселей и
+    настроек детектора. Рамки из кеша используются только при совпадении
+    digest (CachedDetection.reusable): детекция детерминирована, результат тот же.
+    Совпадение dHash, даже с расстоянием 0, тождества кадров не доказывает —
+    маленькое новое или сдвинувшееся лицо почти не меняет градиенты 9x8, —
+    поэтому похожий, но не тот же кадр всегда проходит полную детекцию
+    (исход rejected).
+
+Исходы поиска (hit / miss / rejected) и сэкономленное время детекции —
+в метриках datacleaner_cache_requests_total{cache="detection"} и
+datacleaner_detection_cache_saved_seconds_total. В процессах пула исходы
+копятся в lookup_outcomes и переносятся в реестр HTTP-воркера, как этапы.
+"""
+import hashlib
+import json
+import logging
+import os
+import threading
+from contextvars import ContextVar
+from dataclasses import dataclass, replace
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+import cv2
+import numpy as np
+from sqlalchemy import insert, or_, select, text
+from sqlalchemy.exc import SQLAlchemyError
+
+from core import engine, metrics
+
+logger = logging.getLogger(__name__)
+
+DETECTION_CACHE_ENABLED = os.getenv("DETECTION_CACHE_ENABLED", "true").lower() == "true"
+# Записей в памяти процесса
+DETECTION_CACHE_SIZE = int(os.getenv("DETECTION_CACHE_SIZE", "2048"))
+# Максимальное расстояние Хэмминга, в пределах которого ищется ближайшая запись
+# (повторный JPEG даёт 0–4 бита); рамки переиспользуются только при расстоянии 0.
+# Поиск в SQLite по 5 полосам гарантированно находит совпадения до 4 бит
+DETECTION_CACHE_MAX_DISTANCE = int(os.getenv("DETECTION_CACHE_MAX_DISTANCE", "4"))
+DETECTION_CACHE_PERSIST = os.getenv("DETECTION_CACHE_PERSIST", "true").lower() == "true"
+# Записей в таблице detection_hashes; более старые удаляются
+DETECTION_CACHE_DB_MAX_ROWS = int(os.getenv("DETECTION_CACHE_DB_MAX_ROWS", "100000"))
+# Допустимое расхождение пропорций кадров (рамки масштабируются к новому размеру)
+DETECTION_CACHE_ASPECT_TOLERANCE = float(os.getenv("DETECTION_CACHE_ASPECT_TOLERANCE", "0.02"))
+
+# Ширины полос хеша (бит), в сумме 64
+_BAND_WIDTHS = (13, 13, 13, 13, 12)
+# Очистка старых записей SQLite — раз в столько вставок
+_PRUNE_EVERY = 256
+_POPCOUNT8 = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+# Исходы поиска в процессе пула [(result, saved_seconds), ...] — см. InferencePool
+lookup_outcomes: ContextVar[Optional[List[Tuple[str, float]]]] = ContextVar(
+    "detection_cache_outcomes", default=None
+)
+
+
+def dhash(image_np: np.ndarray) -> int:
+    """64-битный разностный хеш кадра (BGR или серого)."""
+    small = cv2.resize(image_np, (9, 8), interpolation=cv2.INTER_AREA)
+    if small.ndim == 3:
+        small = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+    bits = small[:, 1:] > small[:, :-1]
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+
+def content_digest(image_np: np.ndarray, detector: str) -> str:
+    """SHA-256 пикселей кадра (с формой и dtype) и подписи настроек детектора."""
+    digest = hashlib.sha256(f"{image_np.shape}|{image_np.dtype.str}|{detector}".encode())
+    digest.update(np.ascontiguousarray(image_np).data)
+    return digest.hexdigest()
+
+
+def hamming(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+def _to_signed(value: int) -> int:
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+
+def _bands(value: int) -> List[int]:
+    bands, shift = [], 0
+    for width in _BAND_WIDTHS:
+        bands.append((value >> shift) & ((1 << width) - 1))
+        shift += width
+    return bands
+
+
+@dataclass(frozen=True)
+class CachedDetection:
+    width: int
+    height: int
+    objects: List[Dict]
+    detect_ms: int
+    distance: int = 0
+    digest: Optional[str] = None
+
+    def matches(self, width: int, height: int) -> bool:
+        """Те же пропорции кадра (повторный экспорт мог изменить размер)."""
+        return abs(self.width / self.height - width / height) <= DETECTION_CACHE_ASPECT_TOLERANCE * width / height
+
+    def reusable(self, digest: str) -> bool:
+        """Можно ли пропустить детекцию: те же пиксели и те же настройки детектора."""
+        return self.digest is not None and self.digest == digest
+
+
+class DetectionCache:
+    """Индекс dHash -> рамки: кольцевой буфер в памяти и таблица SQLite."""
+
+    def __init__(
+            self,
+            size: int = DETECTION_CACHE_SIZE,
+            max_distance: int = DETECTION_CACHE_MAX_DISTANCE,
+            persist: bool = DETECTION_CACHE_PERSIST,
+            enabled: bool = DETECTION_CACHE_ENABLED,
+    ):
+        self.enabled = enabled
+        self.max_distance = max_distance
+        self.persist = persist
+        self._hashes = np.zeros(size, dtype=np.uint64)
+        self._entries: List[Optional[CachedDetection]] = [None] * size
+        self._next = 0
+        self._count = 0
+        self._inserts = 0
+        self._lock = threading.Lock()
+        # Исходы, учтённые в этом процессе (для /admin/runtime)
+        self._outcomes = {"hit": 0, "miss": 0, "rejected": 0}
+        self._saved_seconds = 0.0
+
+    def lookup(self, key: int, width: int, height: int, digest: str) -> Optional[CachedDetection]:
+        """
+        Запись с тем же digest, иначе ближайшая в пределах max_distance с теми же
+        пропорциями кадра (её рамки не используются — только учёт исхода).
+        """
+        entry = self._lookup_memory(key, width, height, digest)
+        if (entry is None or not entry.reusable(digest)) and self.persist:
+            found = self._lookup_db(key, width, height, digest)
+            if found is not None and (entry is None or found[1].reusable(digest)):
+                row_key, entry = found
+                # Под хешем исходного кадра, а не искомого
+                self._remember(row_key, replace(entry, distance=0))
+        return entry
+
+    def store(self, key: int, width: int, height: int, objects: List[Dict], detect_ms: int, digest: str) -> None:
+        """Результат полной детекции кадра."""
+        self._remember(key, CachedDetection(width, height, objects, detect_ms, digest=digest))
+        if not self.persist:
+            return
+
+        from models import DetectionHash
+
+        try:
+            with engine.begin() as conn:
+                conn.execute(insert(DetectionHash).values(
+                    dhash=_to_signed(key),
+                    **{f"band{i}": band for i, band in enumerate(_bands(key))},
+                    width=width,
+                    height=height,
+                    content_hash=digest,
+                    objects=json.dumps(objects),
+                    detect_ms=detect_ms,
+                    created_at=datetime.utcnow(),
+                ))
+                self._inserts += 1
+                if self._inserts % _PRUNE_EVERY == 0:
+                    conn.execute(
+                        text("DELETE FROM detection_hashes WHERE id <= (SELECT MAX(id) FROM detection_hashes) - :keep"),
+                        {"keep": DETECTION_CACHE_DB_MAX_ROWS},
+                    )
+        except SQLAlchemyError as e:
+            logger.warning(f"Кеш детекции: не удалось сохранить хеш: {e}")
+
+    def count(self, result: str, saved_seconds: float = 0.0) -> None:
+        """Учёт исхода поиска в метриках этого процесса."""
+        metrics.CACHE_REQUESTS.inc(cache="detection", result=result)
+        if saved_seconds > 0:
+            metrics.DETECTION_CACHE_SAVED_SECONDS.inc(saved_seconds)
+        with self._lock:
+            self._outcomes[result] = self._outcomes.get(result, 0) + 1
+            self._saved_seconds += saved_seconds
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = sum(self._outcomes.values())
+            return {
+                "enabled": self.enabled,
+                "entries": self._count,
+                "max_distance": self.max_distance,
+                "hits": self._outcomes["hit"],
+                "misses": self._outcomes["miss"],
+                "rejected": self._outcomes["rejected"],
+                "reuse_rate": round(self._outcomes["hit"] / lookups, 4) if lookups else 0.0,
+                "saved_seconds": round(self._saved_seconds, 3),
+            }
+
+    def clear(self) -> None:
+        """Очистка памяти процесса (таблица SQLite не трогается)."""
+        with self._lock:
+            self._entries = [None] * len(self._entries)
+            self._next = self._count = 0
+
+    def _remember(self, key: int, entry: CachedDetection) -> None:
+        with self._lock:
+            index = self._next
+            self._hashes[index] = key
+            self._entries[index] = entry
+            self._next = (index + 1) % len(self._entries)
+            self._count = min(self._count + 1, len(self._entries))
+
+    def _lookup_memory(self, key: int, width: int, height: int, digest: str) -> Optional[CachedDetection]:
+        with self._lock:
+            if not self._count:
+                return None
+            xor = self._hashes[:self._count] ^ np.uint64(key)
+            distances = _POPCOUNT8[xor.view(np.uint8)].reshape(-1, 8).sum(axis=1)
+            candidates = np.flatnonzero(distances <= self.max_distance)
+            nearest = None
+            for index in candidates[np.argsort(distances[candidates], kind="stable")]:
+                entry = self._entries[index]
+                if entry.reusable(digest):
+                    return replace(entry, distance=int(distances[index]))
+                if nearest is None and entry.matches(width, height):
+                    nearest = replace(entry, distance=int(distances[index]))
+        return nearest
+
+    def _lookup_db(self, key: int, width: int, height: int, digest: str) -> Optional[Tuple[int, CachedDetection]]:
+        """Запись SQLite с тем же digest (иначе ближайшая) и её хеш."""
+        from models import DetectionHash
+
+        bands = [getattr(DetectionHash, f"band{i}") == band for i, band in enumerate(_bands(key))]
+        try:
+            with engine.connect() as conn:
+                # Все кандидаты по полосам (без LIMIT: при 100k записей случайные совпадения
+                # полос вытеснили бы старые настоящие); рамки читаются только у лучшего
+                rows = conn.execute(
+                    select(DetectionHash.id, DetectionHash.dhash, DetectionHash.width, DetectionHash.height,
+                           DetectionHash.content_hash)
+                    .where(or_(*bands))
+                ).all()
+                best = None
+                for row in rows:
+                    row_key = row.dhash & ((1 << 64) - 1)
+                    distance = hamming(key, row_key)
+                    entry = CachedDetection(row.width, row.height, [], 0, distance, row.content_hash)
+                    if distance > self.max_distance or not (entry.reusable(digest) or entry.matches(width, height)):
+                        continue
+                    # Сначала тот же кадр, затем ближайший, затем самый свежий
+                    rank = (not entry.reusable(digest), distance, -row.id)
+                    if best is None or rank < best[0]:
+                        best = (rank, row.id, row_key, entry)
+                if best is None:
+                    return None
+                _, row_id, row_key, entry = best
+                found = conn.execute(
+                    select(DetectionHash.objects, DetectionHash.detect_ms).where(DetectionHash.id == row_id)
+                ).first()
+        except SQLAlchemyError as e:
+            logger.warning(f"Кеш детекции: поиск в БД недоступен: {e}")
+            return None
+        if found is None:
+            return None
+        return row_key, replace(entry, objects=json.loads(found.objects), detect_ms=found.detect_ms)
+
+
+def record(result: str, saved_seconds: float = 0.0) -> None:
+    """Исход поиска: в процессе пула — в lookup_outcomes, иначе сразу в метрики."""
+    outcomes = lookup_outcomes.get()
+    if outcomes is not None:
+        outcomes.append((result, saved_seconds))
+    else:
+        detection_cache.count(result, saved_seconds)
+
+
+# Глобальный экземпляр (в каждом процессе свой; общая часть — таблица SQLite)
+detection_cache = DetectionCache()
@@ -0,0 +1,150 @@
+import logging
+import os
+import struct
+from pathlib import Path
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
+
+if TYPE_CHECKING:
+    import numpy as np
+
+# cv2 импортируется внутри методов: модуль подключается при импорте сервисов,
+# а OpenCV нужен только при фактическом кодировании
+
+logger = logging.getLogger(__name__)
+
+# === Настройки кодирования результата ===
+# OUTPUT_FORMAT: auto — JPEG для всех форматов кроме WebP (PNG/BMP/TIFF больше
+# не хранятся без сжатия), keep — формат исходного файла, либо явно jpeg/png/webp/avif
+OUTPUT_FORMAT = os.getenv("OUTPUT_FORMAT", "auto").lower()
+JPEG_QUALITY = int(os.getenv("JPEG_QUALITY", "90"))
+JPEG_PROGRESSIVE = os.getenv("JPEG_PROGRESSIVE", "true").lower() == "true"
+WEBP_QUALITY = int(os.getenv("WEBP_QUALITY", "85"))
+AVIF_QUALITY = int(os.getenv("AVIF_QUALITY", "60"))
+PNG_COMPRESSION = int(os.getenv("PNG_COMPRESSION", "3"))  # 0-9, выше — медленнее и меньше
+# Переносить EXIF исходного JPEG в результат (ориентация сбрасывается, GPS удаляется)
+PRESERVE_EXIF = os.getenv("PRESERVE_EXIF", "false").lower() == "true"
+
+# Тег ориентации и ссылка на GPS IFD в EXIF
+_EXIF_ORIENTATION = 0x0112
+_EXIF_GPS_IFD = 0x8825
+
+# Формат -> (расширение, MIME-тип)
+FORMATS: Dict[str, Tuple[str, str]] = {
+    "jpeg": (".jpg", "image/jpeg"),
+    "png": (".png", "image/png"),
+    "webp": (".webp", "image/webp"),
+    "avif": (".avif", "image/avif"),
+}
+
+# Расширение исходного файла -> формат
+_EXTENSION_FORMATS = {
+    ".jpg": "jpeg", ".jpeg": "jpeg", ".jpe": "jpeg",
+    ".png": "png", ".webp": "webp", ".avif": "avif",
+}
+
+
+def content_type_for(path: str) -> str:
+    """MIME-тип по расширению сохранённого файла."""
+    fmt = _EXTENSION_FORMATS.get(Path(path).suffix.lower(), "jpeg")
+    return FORMATS[fmt][1]
+
+
+class EncoderService:
+    """Кодирование обработанного кадра с настраиваемым форматом и качеством."""
+
+    @staticmethod
+    def choose_format(source_ext: str) -> str:
+        """Выбор выходного формата по настройке OUTPUT_FORMAT и расширению оригинала."""
+        import cv2
+
+        source_format = _EXTENSION_FORMATS.get(source_ext.lower())
+
+        if OUTPUT_FORMAT == "keep":
+            fmt = source_format or "jpeg"
+        elif OUTPUT_FORMAT == "auto":
+            fmt = "webp" if source_format == "webp" else "jpeg"
+        else:
+            fmt = OUTPUT_FORMAT if OUTPUT_FORMAT in FORMATS else "jpeg"
+
+        # Сборка OpenCV может не поддерживать WebP/AVIF — откатываемся на JPEG
+        if not cv2.haveImageWriter(f"probe{FORMATS[fmt][0]}"):
+            logger.warning(f"Кодировщик {fmt} недоступен в сборке OpenCV, используется JPEG")
+            fmt = "jpeg"
+        return fmt
+
+    @staticmethod
+    def encode_params(fmt: str) -> List[int]:
+        """Параметры cv2.imencode для формата."""
+        import cv2
+
+        if fmt == "jpeg":
+            return [
+                cv2.IMWRITE_JPEG_QUALITY, JPEG_QUALITY,
+                cv2.IMWRITE_JPEG_PROGRESSIVE, int(JPEG_PROGRESSIVE),
+                cv2.IMWRITE_JPEG_OPTIMIZE, 1,
+            ]
+        if fmt == "webp":
+            return [cv2.IMWRITE_WEBP_QUALITY, WEBP_QUALITY]
+        if fmt == "avif":
+            return [cv2.IMWRITE_AVIF_QUALITY, AVIF_QUALITY]
+        if fmt == "png":
+            return [cv2.IMWRITE_PNG_COMPRESSION, PNG_COMPRESSION]
+        return []
+
+    @staticmethod
+    def encode(image_np: "np.ndarray", output_stem: Path, source_path: str) -> Tuple[Path, str]:
+        """
+        Кодирует кадр и сохраняет рядом с оригиналом.
+        Возвращает путь к файлу и фактический MIME-тип результата.
+        """
+        import cv2
+
+        fmt = EncoderService.choose_format(Path(source_path).suffix)
+        extension, content_type = FORMATS[fmt]
+
+        success, buffer = cv2.imencode(extension, image_np, EncoderService.encode_params(fmt))
+        if not success:
+            raise IOError(f"Не удалось закодировать изображение в {fmt}")
+        data = buffer.tobytes()
+
+        if fmt == "jpeg" and PRESERVE_EXIF:
+            exif = _read_exif(source_path)
+            if exif:
+                data = _insert_exif(data, exif)
+
+        output_path = output_stem.with_suffix(extension)
+        with open(output_path, "wb") as out:
+            out.write(data)
+
+        logger.debug(f"Закодировано в {fmt}: {len(data)} байт")
+        return output_path, content_type
+
+
+def _read_exif(source_path: str) -> Optional[bytes]:
+    """
+    EXIF оригинала для переноса в результат. Ориентация уже применена к пикселям
+    при декодировании, поэтому тег сбрасывается в 1; GPS удаляется.
+    """
+    from PIL import Image
+
+    try:
+        with Image.open(source_path) as img:
+            exif = img.getexif()
+    except Exception:
+        return None
+    if not exif:
+        return None
+
+    exif[_EXIF_ORIENTATION] = 1
+    exif.pop(_EXIF_GPS_IFD, None)
+    return exif.tobytes()
+
+
+def _insert_exif(jpeg: bytes, exif: bytes) -> bytes:
+    """Вставляет APP1-сегмент EXIF сразу после SOI без перекодирования JPEG."""
+    if not exif.startswith(b"Exif\x00\x00"):
+        exif = b"Exif\x00\x00" + exif
+    if len(exif) + 2 > 0xFFFF:
+        return jpeg
+    segment = b"\xff\xe1" + struct.pack(">H", len(exif) + 2) + exif
+    return jpeg[:2] + segment + jpeg[2:]
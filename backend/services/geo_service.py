@@ -14,10 +14,13 @@ GeoService — интеграция с ip-api.com для геолокации п
 import os
 import logging
 import asyncio
+import time
 from typing import Optional
 
 import httpx
 
+from core import metrics
+
 logger = logging.getLogger(__name__)
 
 # ── Конфигурация из переменных окружения ────────────────────────────────────
@@ -86,7 +89,15 @@ async def get_geo_info(ip: Optional[str] = None) -> dict:
     for attempt in range(1, IPAPI_MAX_RETRIES + 1):
         try:
             async with httpx.AsyncClient(timeout=IPAPI_TIMEOUT) as client:
-                response = await client.get(url)
+                started = time.perf_counter()
+                try:
+                    response = await client.get(url)
+                except Exception:
+                    metrics.GEO_UPSTREAM_SECONDS.observe(time.perf_counter() - started, outcome="error")
+                    raise
+                metrics.GEO_UPSTREAM_SECONDS.observe(
+                    time.perf_counter() - started, outcome=str(response.status_code)
+                )
 
                 # Ограничение частоты (rate limiting)
                 if response.status_code == 429:
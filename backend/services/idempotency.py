@@ -0,0 +1,159 @@
+"""
+Идемпотентность загрузок: заголовок Idempotency-Key у POST /image/ и
+завершения возобновляемой загрузки.
+
+  - Первый запрос с ключом занимает его записью pending (уникальный индекс
+    user_id + key, параллельный дубль получает 409 с Retry-After).
+  - Завершение (status=completed, image_id, JSON ответа) фиксируется в той же
+    транзакции, что и запись изображения: после сбоя между обработкой и
+    ответом клиент получает результат повтором, а не вторую загрузку.
+  - Повтор завершённого ключа возвращает ответ по текущей записи изображения
+    (свежая ссылка S3) или сохранённый JSON, если изображение уже удалено.
+  - Ключ с другим содержимым — 422; ошибка обработки освобождает ключ.
+  - pending старше IDEMPOTENCY_PENDING_TIMEOUT считается брошенным (процесс
+    упал) и перехватывается следующим запросом. Ключи хранятся
+    IDEMPOTENCY_TTL_HOURS, очистка — python manage.py reconcile.
+"""
+import hashlib
+import logging
+import os
+from datetime import datetime, timedelta
+from typing import BinaryIO, Optional, Tuple
+
+import orjson
+from fastapi import HTTPException, status
+from sqlalchemy import delete, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from core import metrics
+from models.idempotency_key import IdempotencyKey
+from models.image import Image as ImageModel
+
+logger = logging.getLogger(__name__)
+
+IDEMPOTENCY_TTL_HOURS = int(os.getenv("IDEMPOTENCY_TTL_HOURS", "24"))
+# Секунд до перехвата незавершённого ключа (дольше самой долгой обработки)
+IDEMPOTENCY_PENDING_TIMEOUT = int(os.getenv("IDEMPOTENCY_PENDING_TIMEOUT", "900"))
+
+# Заголовок ответа-повтора
+REPLAYED_HEADER = "Idempotent-Replayed"
+
+
+def request_fingerprint(fileobj: BinaryIO, *params) -> str:
+    """SHA-256 параметров и содержимого файла (позиция файла возвращается в начало)."""
+    digest = hashlib.sha256()
+    for param in params:
+        digest.update(str(param).encode())
+        digest.update(b"\0")
+    fileobj.seek(0)
+    for chunk in iter(lambda: fileobj.read(1024 * 1024), b""):
+        digest.update(chunk)
+    fileobj.seek(0)
+    return digest.hexdigest()
+
+
+class IdempotencyService:
+
+    @staticmethod
+    def begin(db: Session, user_id: int, key: str, fingerprint: str) -> Tuple[Optional[IdempotencyKey], Optional[dict]]:
+        """
+        Занимает ключ. (claim, None) — запрос выполняется и завершается через
+        complete/abandon; (None, response) — повтор завершённого запроса.
+        """
+        now = datetime.utcnow()
+        record = IdempotencyService._get(db, user_id, key)
+        if record is not None and record.created_at < now - timedelta(hours=IDEMPOTENCY_TTL_HOURS):
+            db.delete(record)
+            db.commit()
+            record = None
+
+        if record is None:
+            record = IdempotencyKey(user_id=user_id, key=key, fingerprint=fingerprint, created_at=now)
+            db.add(record)
+            try:
+                db.commit()
+                return record, None
+            except IntegrityError:
+                # Параллельный запрос с тем же ключом успел первым
+                db.rollback()
+                record = IdempotencyService._get(db, user_id, key)
+                if record is None:
+                    raise IdempotencyService._in_progress()
+
+        if record.fingerprint != fingerprint:
+            raise HTTPException(
+                status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                detail="Idempotency-Key уже использован для другого запроса",
+            )
+        if record.status == "completed":
+            return None, IdempotencyService._replay(db, record)
+
+        stale_before = now - timedelta(seconds=IDEMPOTENCY_PENDING_TIMEOUT)
+        if record.created_at < stale_before:
+            # Брошенный ключ: перехватывает только один из параллельных запросов
+            taken = db.execute(
+                update(IdempotencyKey)
+                .where(IdempotencyKey.id == record.id, IdempotencyKey.status == "pending",
+                       IdempotencyKey.created_at < stale_before)
+                .values(created_at=now)
+            ).rowcount
+            db.commit()
+            if taken:
+                logger.warning(f"Перехвачен незавершённый Idempotency-Key пользователя {user_id}")
+                return record, None
+        raise IdempotencyService._in_progress()
+
+    @staticmethod
+    def complete(record: IdempotencyKey, image: ImageModel, response: dict) -> None:
+        """Отмечает ключ завершённым; фиксируется вызывающим вместе с записью изображения."""
+        record.status = "completed"
+        record.image_id = image.id
+        record.response = orjson.dumps(response).decode()
+
+    @staticmethod
+    def abandon(db: Session, record: IdempotencyKey) -> None:
+        """Освобождает ключ после ошибки: повтор выполнит запрос заново."""
+        try:
+            db.rollback()
+            db.execute(
+                delete(IdempotencyKey)
+                .where(IdempotencyKey.id == record.id, IdempotencyKey.status == "pending")
+            )
+            db.commit()
+        except Exception as e:
+            logger.error(f"Не удалось освободить Idempotency-Key {record.id}: {e}")
+
+    @staticmethod
+    def purge_expired(db: Session, now: Optional[datetime] = None, dry_run: bool = False) -> int:
+        """Удаляет ключи старше IDEMPOTENCY_TTL_HOURS. Возвращает их число."""
+        cutoff = (now or datetime.utcnow()) - timedelta(hours=IDEMPOTENCY_TTL_HOURS)
+        if dry_run:
+            return db.query(IdempotencyKey).filter(IdempotencyKey.created_at < cutoff).count()
+        count = db.execute(delete(IdempotencyKey).where(IdempotencyKey.created_at < cutoff)).rowcount
+        db.commit()
+        return count
+
+    @staticmethod
+    def _get(db: Session, user_id: int, key: str) -> Optional[IdempotencyKey]:
+        return db.query(IdempotencyKey).filter(
+            IdempotencyKey.user_id == user_id, IdempotencyKey.key == key
+        ).first()
+
+    @staticmethod
+    def _replay(db: Session, record: IdempotencyKey) -> dict:
+        from .image_service import _build_image_response
+
+        metrics.IDEMPOTENT_REPLAYS.inc()
+        image = db.get(ImageModel, record.image_id) if record.image_id else None
+        if image is not None:
+            return _build_image_response(image)
+        return orjson.loads(record.response or "{}")
+
+    @staticmethod
+    def _in_progress() -> HTTPException:
+        return HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Запрос с этим Idempotency-Key ещё выполняется",
+            headers={"Retry-After": "5"},
+        )
@@ -3,60 +3,198 @@ import logging
 import math
 import os
 import shutil
+import time
 import uuid
-from datetime import date
+from datetime import date, datetime, timedelta
+from functools import lru_cache
+from operator import attrgetter
 from pathlib import Path
-from typing import Optional
+from types import SimpleNamespace
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import orjson
 
 from fastapi import HTTPException, UploadFile, status
-from sqlalchemy import asc, desc, func
-from sqlalchemy.orm import Session
+from sqlalchemy import asc, desc, func, update
+from sqlalchemy.orm import Session, defer
 
-from core import UPLOADS_DIR
+from core import UPLOADS_DIR, MAX_FILE_SIZE, MAX_IMAGE_PIXELS, FREE_USER_UPLOAD_LIMIT, metrics
+from core.http_cache import etag_matches, weak_etag
 from models.image import Image as ImageModel
 from models.user import User
-from schemas.image import ImageResponse, PaginatedImageResponse
-from .ai_service import ai_service
-from .storage_service import StorageService
+from repositories.stats_repository import StatsRepository, USAGE_BUCKETS, USAGE_FIELDS
+from .encoder_service import content_type_for
+from .idempotency import IdempotencyService
+from .progress import ProgressTracker, current_reporter, progress_broker
+from .storage_service import PRESIGNED_URL_EXPIRE, StorageService
 
 logger = logging.getLogger(__name__)
 
+# Период статистики по умолчанию (дней) для каждой группировки
+USAGE_DEFAULT_DAYS = {"day": 30, "week": 12 * 7, "month": 365}
+# Максимум точек во временном ряду /image/stats
+USAGE_MAX_POINTS = int(os.getenv("USAGE_MAX_POINTS", "1000"))
+
+# Типы обработки при загрузке и повторной обработке
+PROCESS_TYPES = ("blur", "pixelate", "none")
+
 ALLOWED_CONTENT_TYPES = {
     "image/jpeg", "image/jpg", "image/png", "image/gif",
     "image/webp", "image/bmp", "image/tiff"
 }
-MAX_FILE_SIZE = 10 * 1024 * 1024  # 10 МБ
 
 
-def _build_image_response(img: ImageModel) -> dict:
-    """Строит словарь ответа для одного изображения, генерируя URL."""
-    detected_objects = []
-    if img.detected_objects:
+def _image_url(img: ImageModel) -> str:
+    """
+    Pre-signed URL S3 или локальный /uploads/ для старых записей, при ошибке
+    подписи и пока хранилище недоступно (если локальная копия сохранилась).
+    """
+    if img.s3_key and (StorageService.healthy() or not (UPLOADS_DIR / img.filename).exists()):
         try:
-            detected_objects = json.loads(img.detected_objects)
-        except Exception:
-            detected_objects = []
-
-    if img.s3_key:
-        try:
-            url = StorageService.get_presigned_url(img.s3_key)
+            return StorageService.get_presigned_url(img.s3_key)
         except Exception as e:
             logger.warning(f"Не удалось получить pre-signed URL для {img.s3_key}: {e}")
-            url = f"/uploads/{img.filename}"
-    else:
-        url = f"/uploads/{img.filename}"
-
-    return {
-        "id": img.id,
-        "filename": img.filename,
-        "original_name": img.original_name,
-        "created_at": img.created_at.isoformat(),
-        "url": url,
-        "processed": getattr(img, "processed", False),
-        "detected_objects": detected_objects,
-        "detected_count": getattr(img, "detected_count", len(detected_objects)),
-        "s3_key": img.s3_key,
-    }
+    return f"/uploads/{img.filename}"
+
+
+def _image_detected_objects(img: ImageModel) -> list:
+    if not img.detected_objects:
+        return []
+    try:
+        return orjson.loads(img.detected_objects)
+    except orjson.JSONDecodeError:
+        return []
+
+
+# Поля ImageResponse -> функция получения значения из модели
+_IMAGE_FIELD_GETTERS: Dict[str, Callable[[ImageModel], Any]] = {
+    "id": attrgetter("id"),
+    "filename": attrgetter("filename"),
+    "original_name": attrgetter("original_name"),
+    "created_at": lambda img: img.created_at.isoformat(),
+    "url": _image_url,
+    "processed": lambda img: bool(img.processed),
+    "detected_objects": _image_detected_objects,
+    "detected_count": lambda img: img.detected_count or 0,
+    "s3_key": attrgetter("s3_key"),
+    "method": lambda img: img.method or "blur",
+}
+
+
+@lru_cache(maxsize=64)
+def image_serializer(fields: Optional[Tuple[str, ...]] = None) -> Callable[[ImageModel], dict]:
+    """
+    Сериализатор изображения в словарь ответа для набора полей (None — все).
+    Пары (поле, getter) собираются один раз на набор; дорогие поля — url
+    (подпись S3) и detected_objects (разбор JSON) — вычисляются, только если
+    запрошены. Результат отдаётся через ORJSONResponse без повторной
+    валидации Pydantic.
+    """
+    getters = tuple((name, _IMAGE_FIELD_GETTERS[name]) for name in (fields or _IMAGE_FIELD_GETTERS))
+
+    def serialize(img: ImageModel) -> dict:
+        return {name: getter(img) for name, getter in getters}
+    return serialize
+
+
+def _build_image_response(img: ImageModel) -> dict:
+    """Строит словарь ответа для одного изображения, генерируя URL."""
+    return image_serializer()(img)
+
+
+def _url_epoch(fields: Optional[Tuple[str, ...]]) -> Optional[int]:
+    """
+    Номер окна в половину срока pre-signed URL: ETag ответа с url меняется
+    раньше, чем истекают подписанные ссылки в закэшированной копии клиента,
+    и при смене доступности хранилища (ссылки S3 <-> /uploads/).
+    """
+    if fields is not None and "url" not in fields:
+        return None
+    window = int(time.time() // max(PRESIGNED_URL_EXPIRE // 2, 1))
+    return window if StorageService.healthy() else -window
+
+
+def image_etag(img: ImageModel, fields: Optional[Tuple[str, ...]] = None) -> str:
+    """Weak ETag карточки изображения по (id, updated_at)."""
+    return weak_etag("image", img.id, img.updated_at, fields, _url_epoch(fields))
+
+
+@metrics.timed("validation")
+def _validate_upload(file: UploadFile) -> str:
+    """Проверяет тип, размер и разрешение файла. Возвращает content_type."""
+    # Валидация типа файла
+    content_type = file.content_type or ""
+    if content_type not in ALLOWED_CONTENT_TYPES and not content_type.startswith("image/"):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Допустимы только изображения. Получен тип: {content_type}"
+        )
+
+    # Валидация размера
+    file.file.seek(0, 2)
+    file_size = file.file.tell()
+    file.file.seek(0)
+    if file_size > MAX_FILE_SIZE:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Размер файла превышает {MAX_FILE_SIZE // 1024 // 1024} МБ"
+        )
+
+    # Валидация числа пикселей по заголовку (без декодирования)
+    _check_image_pixels(file)
+    return content_type
+
+
+def _check_image_pixels(file: UploadFile) -> None:
+    """Отклоняет изображения, которые после декодирования превысят MAX_IMAGE_PIXELS."""
+    from PIL import Image as PILImage
+
+    try:
+        with PILImage.open(file.file) as header:
+            width, height = header.size
+    except PILImage.DecompressionBombError:
+        width, height = MAX_IMAGE_PIXELS + 1, 1
+    except Exception:
+        # Формат не распознан PIL — решение примет декодер в AI сервисе
+        width = height = 0
+    finally:
+        file.file.seek(0)
+
+    if width * height > MAX_IMAGE_PIXELS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Разрешение изображения превышает {MAX_IMAGE_PIXELS // 1_000_000} Мп"
+        )
+
+
+def original_path_for(filename: str) -> Optional[Path]:
+    """Локальный оригинал записи: сам файл или {stem}.* для processed_{stem}; None — не сохранился."""
+    if not filename.startswith("processed_"):
+        path = UPLOADS_DIR / filename
+        return path if path.exists() else None
+    original_stem = Path(filename).stem.replace("processed_", "", 1)
+    return next(iter(UPLOADS_DIR.glob(f"{original_stem}.*")), None)
+
+
+def _validate_process_type(process_type: str) -> None:
+    if process_type not in PROCESS_TYPES:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=f"Тип обработки должен быть одним из: {', '.join(PROCESS_TYPES)}",
+        )
+
+
+def remove_local_files(filename: str) -> None:
+    """Удаляет локальный файл изображения и оригинал, если файл — результат обработки."""
+    try:
+        (UPLOADS_DIR / filename).unlink(missing_ok=True)
+        if filename.startswith("processed_"):
+            # Расширение оригинала может отличаться от результата (PNG -> JPEG)
+            original_stem = Path(filename).stem.replace("processed_", "", 1)
+            for original_path in UPLOADS_DIR.glob(f"{original_stem}.*"):
+                original_path.unlink(missing_ok=True)
+    except Exception as e:
+        logger.error(f"Ошибка удаления локального файла: {e}")
 
 
 class ImageService:
@@ -66,34 +204,100 @@ class ImageService:
             file: UploadFile,
             current_user,
             db: Session,
-            process_type: str = "blur"
+            process_type: str = "blur",
+            is_cancelled: Optional[Callable[[], bool]] = None,
+            upload_id: Optional[str] = None,
+            idempotency=None,
     ) -> dict:
-        """Загрузка и обработка изображения с AI, затем сохранение в S3."""
-
-        # Валидация типа файла
-        content_type = file.content_type or ""
-        if content_type not in ALLOWED_CONTENT_TYPES and not content_type.startswith("image/"):
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail=f"Допустимы только изображения. Получен тип: {content_type}"
-            )
-
-        # Валидация размера
-        file.file.seek(0, 2)
-        file_size = file.file.tell()
-        file.file.seek(0)
-        if file_size > MAX_FILE_SIZE:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail=f"Размер файла превышает {MAX_FILE_SIZE // 1024 // 1024} МБ"
+        """
+        Загрузка и обработка изображения с AI, затем сохранение в S3.
+        is_cancelled — проверка отключения клиента, пока задача ждёт в очереди обработки.
+        upload_id — идентификатор загрузки от клиента для событий прогресса
+        (GET /image/events); по умолчанию генерируется.
+        idempotency — занятый Idempotency-Key (IdempotencyService.begin): завершается
+        в транзакции записи изображения, при ошибке освобождается.
+        """
+        try:
+            _validate_process_type(process_type)
+            content_type = _validate_upload(file)
+
+            # Квота free_user резервируется до обработки и возвращается, если загрузка не удалась
+            reserved = ImageService._reserve_upload_quota(db, current_user)
+        except BaseException:
+            if idempotency is not None:
+                IdempotencyService.abandon(db, idempotency)
+            raise
+        progress = ProgressTracker(progress_broker, current_user.id, upload_id or str(uuid.uuid4()))
+        reporter_token = current_reporter.set(progress)
+        try:
+            return ImageService._store_upload(
+                file, current_user, db, process_type, is_cancelled, content_type, progress, idempotency,
             )
+        except BaseException as e:
+            if reserved:
+                ImageService._release_upload_quota(db, current_user.id)
+            if idempotency is not None:
+                IdempotencyService.abandon(db, idempotency)
+            progress("failed", detail=getattr(e, "detail", None) or str(e) or type(e).__name__)
+            raise
+        finally:
+            current_reporter.reset(reporter_token)
 
-        # Проверка лимита для free_user
-        if current_user.role == "free_user" and current_user.upload_count >= 3:
+    @staticmethod
+    def _reserve_upload_quota(db: Session, current_user) -> bool:
+        """
+        Атомарно занимает одну загрузку из квоты free_user одним UPDATE:
+        параллельные запросы не могут превысить лимит. Резерв фиксируется
+        сразу — держать транзакцию SQLite открытой на время AI обработки
+        значило бы блокировать запись для всех остальных запросов.
+        """
+        if current_user.role != "free_user":
+            return False
+
+        result = db.execute(
+            update(User)
+            .where(User.id == current_user.id, User.upload_count < FREE_USER_UPLOAD_LIMIT)
+            .values(upload_count=User.upload_count + 1)
+        )
+        db.commit()
+        if result.rowcount == 0:
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN,
                 detail="Лимит загрузок исчерпан. Перейдите на Pro."
             )
+        return True
+
+    @staticmethod
+    def _release_upload_quota(db: Session, user_id: int) -> None:
+        """Возврат зарезервированной загрузки (компенсация при ошибке)."""
+        try:
+            db.rollback()
+            db.execute(
+                update(User)
+                .where(User.id == user_id, User.upload_count > 0)
+                .values(upload_count=User.upload_count - 1)
+            )
+            db.commit()
+        except Exception as e:
+            logger.error(f"Не удалось вернуть квоту загрузки пользователю {user_id}: {e}")
+
+    @staticmethod
+    def _store_upload(
+            file: UploadFile,
+            current_user,
+            db: Session,
+            process_type: str,
+            is_cancelled: Optional[Callable[[], bool]],
+            content_type: str,
+            progress: ProgressTracker,
+            idempotency=None,
+    ) -> dict:
+        """
+        Сохранение оригинала, AI обработка, загрузка в S3 и запись в БД — именно
+        в таком порядке: после сбоя на любом шаге остаются только файлы и объекты
+        S3 без записи (их удаляет python manage.py reconcile), но не запись,
+        указывающая в никуда.
+        """
 
         # Генерация уникального имени файла
         file_extension = Path(file.filename or "image").suffix.lower() or ".jpg"
@@ -101,29 +305,48 @@ class ImageService:
         original_filename = f"{unique_id}{file_extension}"
         original_path = UPLOADS_DIR / original_filename
 
-        # Сохраняем оригинал локально для AI обработки
-        with open(original_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
+        # Сохраняем оригинал локально для AI обработки; под итоговым именем
+        # появляется только полностью записанный файл
+        partial_path = original_path.with_name(f"{original_filename}.tmp")
+        with metrics.stage("disk_write"):
+            with open(partial_path, "wb") as buffer:
+                shutil.copyfileobj(file.file, buffer)
+            os.replace(partial_path, original_path)
+        progress("stored")
 
         # AI обработка
         processed_filename = original_filename
         detected_objects = []
         is_processed = False
+        processing_ms = 0
 
         if process_type != "none":
+            from .inference_pool import inference_pool
+            from .scheduler import processing_scheduler, SchedulingError
+
             try:
                 logger.info(f"Начинаю AI обработку: {original_path}")
-                processed_path_str, detected_objects = ai_service.process_image(
-                    image_path=str(original_path),
-                    method=process_type
-                )
-                processed_path = Path(processed_path_str)
-                if processed_path.exists() and processed_path_str != str(original_path):
-                    processed_filename = processed_path.name
-                    is_processed = True
-                    logger.info(f"AI обработка завершена: {len(detected_objects)} объектов")
-                else:
-                    logger.warning("AI не применил изменения, используем оригинал")
+                # Слот обработки выдаётся по приоритету роли и по кругу между пользователями
+                with processing_scheduler.slot(current_user.id, current_user.role, is_cancelled):
+                    started = time.perf_counter()
+                    processed_path_str, detected_objects = inference_pool.process_image(
+                        image_path=str(original_path),
+                        method=process_type
+                    )
+                    processing_ms = round((time.perf_counter() - started) * 1000)
+                # processed=True означает «просканировано»: при 0 объектов
+                # AI возвращает путь к оригиналу, второй файл не создаётся
+                processed_filename = Path(processed_path_str).name
+                is_processed = True
+                logger.info(f"AI обработка завершена: {len(detected_objects)} объектов")
+            except SchedulingError as e:
+                # Клиент отключился или очередь слишком длинная — загрузка не сохраняется
+                original_path.unlink(missing_ok=True)
+                raise HTTPException(
+                    status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                    detail="Сервис обработки перегружен. Попробуйте позже",
+                    headers={"Retry-After": "30"},
+                ) from e
             except Exception as e:
                 logger.error(f"Ошибка AI обработки: {e}")
                 detected_objects = []
@@ -135,55 +358,192 @@ class ImageService:
         s3_key = None
         processed_local_path = UPLOADS_DIR / processed_filename
         try:
-            s3_key = f"{current_user.id}/{processed_filename}"
-            StorageService.upload_file(
-                local_path=str(processed_local_path),
-                s3_key=s3_key,
-                content_type=content_type if content_type.startswith("image/") else "image/jpeg",
-            )
+            with metrics.stage("s3_upload"):
+                s3_key = f"{current_user.id}/{processed_filename}"
+                if processed_filename == original_filename:
+                    # Оригинал не менялся — отправляем байты прямо из буфера запроса
+                    StorageService.upload_fileobj(
+                        fileobj=file.file,
+                        s3_key=s3_key,
+                        content_type=content_type if content_type.startswith("image/") else "image/jpeg",
+                    )
+                else:
+                    # MIME-тип по фактическому формату файла, а не по заявленному клиентом
+                    StorageService.upload_file(
+                        local_path=str(processed_local_path),
+                        s3_key=s3_key,
+                        content_type=content_type_for(processed_filename),
+                    )
             logger.info(f"Файл загружен в S3: {s3_key}")
         except Exception as e:
             logger.warning(f"Не удалось загрузить в S3 (будет использован локальный файл): {e}")
             s3_key = None
+        progress("uploaded", storage="s3" if s3_key else "local")
 
-        # Сохраняем запись в БД
+        # Сохраняем запись в БД вместе с обновлением счётчиков статистики
+        now = datetime.utcnow()
         db_image = ImageModel(
             filename=processed_filename,
             original_name=file.filename,
             user_id=current_user.id,
+            # Явно, чтобы день в usage_daily совпадал с датой записи
+            created_at=now,
+            updated_at=now,
             processed=is_processed,
+            method=process_type,
             detected_objects=detected_objects_json,
             detected_count=detected_count,
             s3_key=s3_key,
+            file_size=processed_local_path.stat().st_size if processed_local_path.exists() else 0,
+            processing_ms=processing_ms,
         )
         db.add(db_image)
-        db.commit()
-        db.refresh(db_image)
+        StatsRepository(db).record_images([db_image])
+        db.flush()
+        response = _build_image_response(db_image)
+        if idempotency is not None:
+            IdempotencyService.complete(idempotency, db_image, response)
+        with metrics.stage("db_commit"):
+            db.commit()
+
+        progress.image_id = db_image.id
+        progress("done", processed=is_processed, detected_count=detected_count)
+        return response
+
+    @staticmethod
+    def reprocess_image(
+            image_id: int,
+            current_user,
+            db: Session,
+            method: Optional[str] = None,
+            boxes: Optional[List[List[int]]] = None,
+            replace_boxes: bool = False,
+            is_cancelled: Optional[Callable[[], bool]] = None,
+            upload_id: Optional[str] = None,
+    ) -> dict:
+        """
+        Повторная обработка без повторной загрузки: другой метод и/или рамки
+        пользователя. Используется сохранённый локальный оригинал и рамки из
+        detected_objects; при переданных boxes детекция не выполняется.
+        Кадр декодируется один раз, меняются только области рамок, результат
+        перезаписывает объект S3. Квота загрузок не расходуется.
+        """
+        query = db.query(ImageModel).filter(ImageModel.id == image_id)
+        if getattr(current_user, "role", "user") != "admin":
+            query = query.filter(ImageModel.user_id == current_user.id)
+        image = query.first()
+        if not image:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Изображение не найдено"
+            )
 
-        # Увеличиваем счётчик загрузок для free_user
-        if current_user.role == "free_user":
-            db_user = db.query(User).filter(User.id == current_user.id).first()
-            if db_user:
-                db_user.upload_count += 1
-                db.commit()
+        method = method or image.method or "blur"
+        _validate_process_type(method)
+        for box in boxes or []:
+            if len(box) != 4 or min(box[:2]) < 0 or box[2] <= box[0] or box[3] <= box[1]:
+                raise HTTPException(
+                    status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                    detail="Рамка должна быть [x1, y1, x2, y2] с x2 > x1, y2 > y1 и неотрицательными x1, y1",
+                )
+
+        original_path = original_path_for(image.filename)
+        if original_path is None:
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail="Оригинал изображения не сохранился — загрузите изображение заново",
+            )
 
-        return _build_image_response(db_image)
+        # Рамки: сохранённые детекции и/или пользовательские; None — детекция ещё не выполнялась
+        objects = _image_detected_objects(image) if image.processed else None
+        if boxes is not None:
+            manual = [{"class": "manual", "confidence": 1.0, "bbox": box} for box in boxes]
+            objects = manual if replace_boxes else (objects or []) + manual
+
+        from .inference_pool import inference_pool
+        from .scheduler import processing_scheduler, SchedulingError
+
+        progress = ProgressTracker(progress_broker, current_user.id, upload_id or f"reprocess-{image.id}")
+        progress.image_id = image.id
+        reporter_token = current_reporter.set(progress)
+        try:
+            with processing_scheduler.slot(current_user.id, current_user.role, is_cancelled):
+                started = time.perf_counter()
+                if objects is None:
+                    output_path_str, objects = inference_pool.process_image(str(original_path), method)
+                else:
+                    output_path_str, objects = inference_pool.reprocess_image(str(original_path), method, objects)
+                processing_ms = round((time.perf_counter() - started) * 1000)
+        except SchedulingError as e:
+            progress("failed", detail="scheduler")
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Сервис обработки перегружен. Попробуйте позже",
+                headers={"Retry-After": "30"},
+            ) from e
+        except Exception as e:
+            progress("failed", detail=str(e))
+            raise
+        finally:
+            current_reporter.reset(reporter_token)
+
+        # Перезапись объекта S3; ключ меняется, только если результат стал оригиналом или наоборот
+        output_path = Path(output_path_str)
+        old_s3_key = image.s3_key
+        s3_key = f"{image.user_id}/{output_path.name}"
+        try:
+            with metrics.stage("s3_upload"):
+                StorageService.upload_file(
+                    local_path=str(output_path),
+                    s3_key=s3_key,
+                    content_type=content_type_for(output_path.name),
+                )
+        except Exception as e:
+            logger.warning(f"Не удалось загрузить в S3 (будет использован локальный файл): {e}")
+            s3_key = None
+        progress("uploaded", storage="s3" if s3_key else "local")
+        old_filename = image.filename
+
+        # Счётчики: старое состояние записи вычитается, новое прибавляется
+        stats = StatsRepository(db)
+        stats.record_images([SimpleNamespace(
+            user_id=image.user_id, created_at=image.created_at, processed=image.processed,
+            detected_count=image.detected_count, file_size=image.file_size, processing_ms=image.processing_ms,
+        )], sign=-1)
+        image.filename = output_path.name
+        image.s3_key = s3_key
+        image.replication_attempts = 0
+        image.method = method
+        image.processed = True
+        image.detected_objects = json.dumps(objects, ensure_ascii=False) if objects else None
+        image.detected_count = len(objects)
+        image.file_size = output_path.stat().st_size
+        image.processing_ms = (image.processing_ms or 0) + processing_ms
+        stats.record_images([image])
+        with metrics.stage("db_commit"):
+            db.commit()
+        db.refresh(image)
+
+        # Прежние объект S3 и результат обработки удаляются только после фиксации
+        # записи: сбой раньше оставляет лишний файл, а не запись без файла
+        if old_s3_key and old_s3_key != s3_key:
+            StorageService.delete_file(old_s3_key)
+        if old_filename != output_path.name and old_filename.startswith("processed_"):
+            (UPLOADS_DIR / old_filename).unlink(missing_ok=True)
+
+        progress("done", processed=True, detected_count=image.detected_count)
+        return _build_image_response(image)
 
     @staticmethod
-    def get_user_images(
-            current_user,
+    def filtered_query(
             db: Session,
+            current_user,
             search: Optional[str] = None,
             processed: Optional[bool] = None,
             date_from: Optional[date] = None,
             date_to: Optional[date] = None,
-            sort_by: str = "created_at",
-            sort_order: str = "desc",
-            page: int = 1,
-            limit: int = 10,
-    ) -> PaginatedImageResponse:
-        """Возвращает изображения с фильтрацией, сортировкой и пагинацией."""
-
+    ):
+        """Запрос изображений с фильтрами списка (используется и для массового удаления)."""
         query = db.query(ImageModel)
 
         # Ограничение по роли
@@ -208,8 +568,45 @@ class ImageService:
         if date_to:
             query = query.filter(func.date(ImageModel.created_at) <= date_to)
 
-        # Подсчёт общего числа записей
-        total = query.count()
+        return query
+
+    @staticmethod
+    def get_user_images(
+            current_user,
+            db: Session,
+            search: Optional[str] = None,
+            processed: Optional[bool] = None,
+            date_from: Optional[date] = None,
+            date_to: Optional[date] = None,
+            sort_by: str = "created_at",
+            sort_order: str = "desc",
+            page: int = 1,
+            limit: int = 10,
+            fields: Optional[Tuple[str, ...]] = None,
+            if_none_match: Optional[str] = None,
+    ) -> Tuple[str, Optional[dict]]:
+        """
+        Возвращает изображения с фильтрацией, сортировкой и пагинацией.
+        fields — поля элементов (None — все поля ImageResponse).
+
+        Результат — (ETag, ответ). ETag строится из числа записей, max(id) и
+        max(updated_at) выборки и параметров запроса; если он совпал с
+        if_none_match, страница не читается и ответ — None (304).
+        """
+
+        query = ImageService.filtered_query(db, current_user, search, processed, date_from, date_to)
+
+        # Число записей и состояние выборки — одним агрегирующим запросом
+        total, max_id, max_updated_at = query.with_entities(
+            func.count(ImageModel.id), func.max(ImageModel.id), func.max(ImageModel.updated_at),
+        ).one()
+        etag = weak_etag(
+            "images", current_user.id, current_user.role, total, max_id, max_updated_at,
+            search, processed, date_from, date_to, sort_by, sort_order, page, limit, fields,
+            _url_epoch(fields),
+        )
+        if etag_matches(if_none_match, etag):
+            return etag, None
 
         # Сортировка
         sort_column_map = {
@@ -227,19 +624,21 @@ class ImageService:
         limit = max(1, min(limit, 100))
         page = max(1, page)
         offset = (page - 1) * limit
+        if fields is not None and "detected_objects" not in fields:
+            # JSON объектов не читается из БД, если не нужен в ответе
+            query = query.options(defer(ImageModel.detected_objects))
         images = query.offset(offset).limit(limit).all()
 
         pages = math.ceil(total / limit) if total > 0 else 1
 
-        items = [_build_image_response(img) for img in images]
-
-        return PaginatedImageResponse(
-            items=items,
-            total=total,
-            page=page,
-            limit=limit,
-            pages=pages,
-        )
+        serialize = image_serializer(fields)
+        return etag, {
+            "items": [serialize(img) for img in images],
+            "total": total,
+            "page": page,
+            "limit": limit,
+            "pages": pages,
+        }
 
     @staticmethod
     def delete_image(image_id: int, current_user, db: Session) -> dict:
@@ -263,19 +662,53 @@ class ImageService:
                 logger.error(f"Ошибка удаления из S3: {e}")
 
         # Удаляем локальные файлы
-        try:
-            file_path = UPLOADS_DIR / image.filename
-            if file_path.exists():
-                file_path.unlink()
-            if image.filename.startswith("processed_"):
-                original_name = image.filename.replace("processed_", "", 1)
-                original_path = UPLOADS_DIR / original_name
-                if original_path.exists():
-                    original_path.unlink()
-        except Exception as e:
-            logger.error(f"Ошибка удаления локального файла: {e}")
+        remove_local_files(image.filename)
 
+        StatsRepository(db).record_images([image], sign=-1)
         db.delete(image)
         db.commit()
 
         return {"message": "Изображение успешно удалено"}
+
+    @staticmethod
+    def get_usage_stats(
+            db: Session,
+            user_id: Optional[int],
+            bucket: str = "day",
+            date_from: Optional[date] = None,
+            date_to: Optional[date] = None,
+    ) -> dict:
+        """Временной ряд загрузок, объектов и времени обработки из дневной сводки."""
+        if bucket not in USAGE_BUCKETS:
+            raise HTTPException(
+                status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                detail=f"bucket должен быть одним из: {', '.join(USAGE_BUCKETS)}",
+            )
+        date_to = date_to or datetime.utcnow().date()
+        date_from = date_from or date_to - timedelta(days=USAGE_DEFAULT_DAYS[bucket] - 1)
+        if date_from > date_to:
+            raise HTTPException(
+                status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                detail="date_from не может быть позже date_to",
+            )
+        span_days = (date_to - date_from).days + 1
+        points = {"day": span_days, "week": span_days // 7 + 1, "month": span_days // 28 + 1}[bucket]
+        if points > USAGE_MAX_POINTS:
+            raise HTTPException(
+                status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                detail=f"Слишком большой период для группировки {bucket} (макс. {USAGE_MAX_POINTS} точек)",
+            )
+
+        items = StatsRepository(db).usage_series(user_id, date_from, date_to, bucket)
+        totals = {field: sum(item[field] for item in items) for field in USAGE_FIELDS}
+        for row in items + [totals]:
+            row["avg_processing_ms"] = round(row["processing_ms"] / row["processed"], 1) if row["processed"] else 0.0
+
+        return {
+            "bucket": bucket,
+            "date_from": date_from,
+            "date_to": date_to,
+            "user_id": user_id,
+            "items": items,
+            "totals": totals,
+        }
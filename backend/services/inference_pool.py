@@ -0,0 +1,236 @@
+"""
+Пул процессов для CPU-bound обработки изображений (OpenCV).
+
+INFERENCE_WORKERS=0 — обработка в процессе HTTP-воркера (режим по умолчанию).
+INFERENCE_WORKERS>0 — каждый HTTP-воркер держит собственный пул из стольких
+процессов (shared-nothing). Процессы создаются через fork от воркера, в котором
+каскад уже загружен, поэтому его страницы делятся copy-on-write.
+
+Через границу процессов передаются только путь к файлу и метод — кадры не
+сериализуются.
+Этапы обработки (detecting, blurring) процессы пула пишут в общую очередь,
+созданную до fork; поток-слушатель родителя передаёт их трекеру прогресса
+загрузки.
+"""
+import logging
+import multiprocessing
+import os
+import signal
+import threading
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, Dict, List, Optional, Tuple
+
+from core import metrics
+
+logger = logging.getLogger(__name__)
+
+INFERENCE_WORKERS = int(os.getenv("INFERENCE_WORKERS", "0"))
+# Потоков OpenCV на процесс пула: при N процессах на N ядрах больше 1 — переподписка
+INFERENCE_OPENCV_THREADS = int(os.getenv("INFERENCE_OPENCV_THREADS", "1"))
+
+
+# Очередь этапов прогресса в процессе пула (задаётся в _init_worker)
+_progress_queue = None
+# Сколько ждать доставки последних этапов задачи слушателем, секунд
+PROGRESS_DRAIN_TIMEOUT = 1.0
+
+
+def _init_worker(opencv_threads: int, progress_queue=None) -> None:
+    """Инициализация процесса пула (выполняется один раз после fork)."""
+    global _progress_queue
+    _progress_queue = progress_queue
+    from core import engine
+    from services.ai_service import ai_service
+
+    # Ctrl+C и SIGTERM обрабатывает родитель, пул останавливается через shutdown()
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    # Соединения SQLite, унаследованные от родителя, в дочернем процессе использовать нельзя
+    engine.dispose(close=False)
+    ai_service.ensure_loaded()
+    # Параллелизм даёт пул процессов — OpenCV внутри процесса однопоточный
+    ai_service.configure_runtime("process", threads=opencv_threads)
+
+
+def _process_image(
+        image_path: str,
+        method: str,
+        progress_key: Optional[str] = None,
+        objects: Optional[List[Dict]] = None,
+) -> Tuple[str, List[Dict], List[Tuple[str, float]], List[Tuple[str, float]]]:
+    """
+    Выполняется в процессе пула. Возвращает результат, времена этапов и
+    исходы кеша детекции (метрики процесса пула в /metrics не попадают).
+    objects — известные рамки (повторная обработка без детекции).
+    """
+    from services.ai_service import ai_service
+    from services.detection_cache import lookup_outcomes
+    from services.progress import current_reporter
+
+    stages: List[Tuple[str, float]] = []
+    outcomes: List[Tuple[str, float]] = []
+    token = metrics.request_stages.set(stages)
+    outcomes_token = lookup_outcomes.set(outcomes)
+    reporter_token = None
+    if progress_key is not None and _progress_queue is not None:
+        reporter_token = current_reporter.set(lambda stage: _progress_queue.put((progress_key, stage)))
+    try:
+        if objects is None:
+            output_path, objects = ai_service.process_image(image_path=image_path, method=method)
+        else:
+            output_path, objects = ai_service.reprocess_image(image_path, method, objects)
+    finally:
+        metrics.request_stages.reset(token)
+        lookup_outcomes.reset(outcomes_token)
+        if reporter_token is not None:
+            current_reporter.reset(reporter_token)
+            # Маркер конца задачи: родитель дожидается доставки всех её этапов
+            _progress_queue.put((progress_key, None))
+    return output_path, objects, stages, outcomes
+
+
+def _warmup() -> int:
+    return os.getpid()
+
+
+class InferencePool:
+    """Ленивый пул процессов, привязанный к PID создавшего его процесса."""
+
+    def __init__(self, workers: int = INFERENCE_WORKERS, opencv_threads: int = INFERENCE_OPENCV_THREADS):
+        self.workers = workers
+        self.opencv_threads = opencv_threads
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._owner_pid: Optional[int] = None
+        self._lock = threading.Lock()
+        self._progress_queue = None
+        # ключ задачи -> (трекер прогресса, событие «все этапы доставлены»)
+        self._reporters: Dict[str, Tuple[Callable[[str], None], threading.Event]] = {}
+
+    @property
+    def enabled(self) -> bool:
+        return self.workers > 0
+
+    def configure(self, workers: int, opencv_threads: Optional[int] = None) -> None:
+        """Изменение размера пула (используется лаунчером до старта воркеров)."""
+        self.shutdown()
+        self.workers = workers
+        if opencv_threads is not None:
+            self.opencv_threads = opencv_threads
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            # Пул, созданный до fork, в дочернем процессе неработоспособен
+            if self._executor is None or self._owner_pid != os.getpid():
+                context = multiprocessing.get_context("fork")
+                if self._progress_queue is None or self._owner_pid != os.getpid():
+                    self._progress_queue = context.SimpleQueue()
+                    threading.Thread(
+                        target=self._forward_progress, args=(self._progress_queue,),
+                        name="inference-progress", daemon=True,
+                    ).start()
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=context,
+                    initializer=_init_worker,
+                    initargs=(self.opencv_threads, self._progress_queue),
+                )
+                self._owner_pid = os.getpid()
+                logger.info(f"Пул инференса: {self.workers} процессов, OpenCV потоков на процесс: {self.opencv_threads}")
+            return self._executor
+
+    def _forward_progress(self, queue) -> None:
+        """Поток-слушатель: этапы из процессов пула -> трекеры загрузок."""
+        while True:
+            item = queue.get()
+            if item is None:
+                return
+            key, stage = item
+            entry = self._reporters.get(key)
+            if entry is None:
+                continue
+            reporter, drained = entry
+            if stage is None:
+                drained.set()
+                continue
+            try:
+                reporter(stage)
+            except Exception as e:
+                logger.warning(f"Ошибка публикации этапа {stage}: {e}")
+
+    def start(self) -> None:
+        """Запускает все процессы пула заранее, чтобы первый запрос не ждал fork и прогрев."""
+        if not self.enabled:
+            return
+        executor = self._get_executor()
+        for future in [executor.submit(_warmup) for _ in range(self.workers)]:
+            future.result()
+
+    def process_image(self, image_path: str, method: str = "blur") -> Tuple[str, List[Dict]]:
+        """Обработка изображения в пуле (или в текущем процессе, если пул выключен)."""
+        if not self.enabled:
+            from services.ai_service import ai_service
+            return ai_service.process_image(image_path=image_path, method=method)
+        return self._run(image_path, method, None)
+
+    def reprocess_image(self, original_path: str, method: str, objects: List[Dict]) -> Tuple[str, List[Dict]]:
+        """Повторная обработка оригинала по известным рамкам, без детекции."""
+        if not self.enabled:
+            from services.ai_service import ai_service
+            return ai_service.reprocess_image(original_path, method, objects)
+        return self._run(original_path, method, objects)
+
+    def _run(self, image_path: str, method: str, objects: Optional[List[Dict]]) -> Tuple[str, List[Dict]]:
+        from services.progress import current_reporter
+
+        reporter = current_reporter.get()
+        progress_key = drained = None
+        if reporter is not None:
+            progress_key, drained = uuid.uuid4().hex, threading.Event()
+            self._reporters[progress_key] = (reporter, drained)
+        try:
+            output_path, objects, stages, outcomes = self._get_executor().submit(
+                _process_image, image_path, method, progress_key, objects
+            ).result()
+            if drained is not None:
+                # Этапы задачи доставляются раньше следующих этапов загрузки (uploaded, done)
+                drained.wait(PROGRESS_DRAIN_TIMEOUT)
+        except BrokenProcessPool:
+            # Процесс пула упал (OOM, segfault в OpenCV) — пересоздаём пул к следующему запросу
+            logger.error("❌ Пул инференса повреждён, будет пересоздан")
+            with self._lock:
+                self._executor = None
+            raise
+        finally:
+            if progress_key is not None:
+                self._reporters.pop(progress_key, None)
+
+        # Метрики этапов из дочернего процесса переносим в реестр HTTP-воркера
+        request_stages = metrics.request_stages.get()
+        for name, seconds in stages:
+            metrics.STAGE_SECONDS.observe(seconds, stage=name)
+            if request_stages is not None:
+                request_stages.append((name, seconds))
+        if outcomes:
+            from services.detection_cache import detection_cache
+            for result, saved_seconds in outcomes:
+                detection_cache.count(result, saved_seconds)
+        if output_path == image_path:
+            metrics.ENCODE_SKIPPED.inc()
+        return output_path, objects
+
+    def shutdown(self, wait: bool = True) -> None:
+        """Останавливает пул, дожидаясь завершения принятых задач."""
+        with self._lock:
+            executor, self._executor = self._executor, None
+            queue = self._progress_queue if self._owner_pid == os.getpid() else None
+            self._progress_queue = None
+        if executor is not None and self._owner_pid == os.getpid():
+            executor.shutdown(wait=wait, cancel_futures=not wait)
+        if queue is not None:
+            queue.put(None)  # остановка потока-слушателя
+
+
+# Глобальный экземпляр
+inference_pool = InferencePool()
@@ -0,0 +1,131 @@
+"""
+Прогресс обработки изображений: pub/sub в памяти процесса для SSE
+(GET /image/events).
+
+  - У пользователя одна подписка (одно SSE-соединение): новое соединение
+    закрывает предыдущее событием replaced.
+  - Публикация идёт из потоков пула Starlette (синхронная загрузка), доставка —
+    в event loop подписчика через call_soon_threadsafe. Без подписчика
+    публикация — один поиск в словаре.
+  - Очередь подписки ограничена PROGRESS_QUEUE_SIZE: медленный клиент теряет
+    самые старые события, а не копит память.
+
+Этапы одной загрузки: stored → detecting → blurring → uploaded → done
+(или failed). ImageService публикует их через ProgressTracker, AIService —
+через report(), который находит трекер текущей загрузки в ContextVar
+(в процессах пула инференса этапы пересылает InferencePool).
+
+Подписки не разделяются между процессами: при WEB_WORKERS > 1 события
+приходят, только если SSE-соединение и загрузка попали в один воркер.
+"""
+import asyncio
+import logging
+import os
+import threading
+import time
+from contextvars import ContextVar
+from typing import Callable, Dict, Optional
+
+from core import metrics
+
+logger = logging.getLogger(__name__)
+
+PROGRESS_QUEUE_SIZE = int(os.getenv("PROGRESS_QUEUE_SIZE", "100"))
+# Интервал комментариев keep-alive в SSE-потоке (секунд)
+PROGRESS_KEEPALIVE = float(os.getenv("PROGRESS_KEEPALIVE", "15"))
+
+STAGES = ("stored", "detecting", "blurring", "uploaded", "done", "failed")
+
+# Трекер загрузки, в рамках которой выполняется обработка (для report() из AIService)
+current_reporter: ContextVar[Optional[Callable[[str], None]]] = ContextVar("current_reporter", default=None)
+
+
+def report(stage: str) -> None:
+    """Этап обработки из AIService; без активной загрузки ничего не делает."""
+    reporter = current_reporter.get()
+    if reporter is not None:
+        reporter(stage)
+
+
+class Subscription:
+    """Очередь событий одного SSE-соединения."""
+
+    # Событие закрытия: соединение заменено новым
+    REPLACED = {"event": "replaced"}
+
+    def __init__(self, user_id: int, loop: asyncio.AbstractEventLoop):
+        self.user_id = user_id
+        self.loop = loop
+        self.queue: "asyncio.Queue[dict]" = asyncio.Queue(maxsize=PROGRESS_QUEUE_SIZE)
+
+    def put(self, event: dict) -> None:
+        """Выполняется в event loop подписчика."""
+        if self.queue.full():
+            self.queue.get_nowait()
+            metrics.PROGRESS_EVENTS_DROPPED.inc()
+        self.queue.put_nowait(event)
+
+
+class ProgressBroker:
+
+    def __init__(self):
+        self._subscribers: Dict[int, Subscription] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._subscribers)
+
+    def subscribe(self, user_id: int) -> Subscription:
+        """Вызывается из event loop. Предыдущая подписка пользователя закрывается."""
+        subscription = Subscription(user_id, asyncio.get_running_loop())
+        with self._lock:
+            previous = self._subscribers.get(user_id)
+            self._subscribers[user_id] = subscription
+        if previous is not None:
+            self._deliver(previous, Subscription.REPLACED)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        with self._lock:
+            if self._subscribers.get(subscription.user_id) is subscription:
+                del self._subscribers[subscription.user_id]
+
+    def publish(self, user_id: int, event: dict) -> None:
+        """Потокобезопасная публикация события пользователю."""
+        with self._lock:
+            subscription = self._subscribers.get(user_id)
+        if subscription is not None:
+            self._deliver(subscription, event)
+
+    @staticmethod
+    def _deliver(subscription: Subscription, event: dict) -> None:
+        try:
+            subscription.loop.call_soon_threadsafe(subscription.put, event)
+        except RuntimeError:
+            # Event loop подписчика уже закрыт (остановка воркера)
+            pass
+
+
+class ProgressTracker:
+    """Публикация этапов одной загрузки; передаётся в AIService через current_reporter."""
+
+    def __init__(self, broker: ProgressBroker, user_id: int, upload_id: str):
+        self.broker = broker
+        self.user_id = user_id
+        self.upload_id = upload_id
+        self.image_id: Optional[int] = None
+        self.started = time.monotonic()
+
+    def __call__(self, stage: str, **data) -> None:
+        self.broker.publish(self.user_id, {
+            "upload_id": self.upload_id,
+            "image_id": self.image_id,
+            "stage": stage,
+            "elapsed_ms": round((time.monotonic() - self.started) * 1000),
+            **data,
+        })
+
+
+# Глобальный экземпляр
+progress_broker = ProgressBroker()
+metrics.PROGRESS_SUBSCRIBERS.set_function(lambda: len(progress_broker))
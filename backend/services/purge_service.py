@@ -0,0 +1,238 @@
+"""
+Массовое удаление изображений: по фильтру или списку id, политика хранения
+(retention) по ролям и каскадное удаление пользователя.
+
+Удаление идёт порциями по PURGE_CHUNK_SIZE записей (keyset по id):
+  1. из БД читаются только id, filename и s3_key порции;
+  2. объекты S3 удаляются пакетами DeleteObjects (до 1000 ключей за запрос);
+  3. локальные файлы удаляются с диска;
+  4. записи порции удаляются одним DELETE ... WHERE id IN (...) и фиксируются.
+Короткие транзакции не блокируют запись в SQLite для остальных запросов.
+
+Большие удаления выполняются в фоновом потоке как задача (PurgeJob) с
+прогрессом, доступным через API. Реестр задач — в памяти процесса.
+"""
+import logging
+import os
+import threading
+import uuid
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional
+
+from sqlalchemy import delete, select
+from sqlalchemy.orm import Query, Session
+
+from core import SessionLocal
+from models.idempotency_key import IdempotencyKey
+from models.image import Image as ImageModel
+from models.refresh_token import RefreshToken
+from models.upload_session import UploadSession
+from models.usage_daily import UsageDaily
+from models.user import User
+from repositories.stats_repository import StatsRepository
+from .image_service import remove_local_files
+from .storage_service import StorageService
+
+logger = logging.getLogger(__name__)
+
+PURGE_CHUNK_SIZE = int(os.getenv("PURGE_CHUNK_SIZE", "500"))
+# Удаления не больше этого числа записей выполняются прямо в запросе
+BULK_DELETE_SYNC_LIMIT = int(os.getenv("BULK_DELETE_SYNC_LIMIT", "200"))
+# Хранить в реестре не больше стольких завершённых задач
+PURGE_JOB_HISTORY = int(os.getenv("PURGE_JOB_HISTORY", "100"))
+
+# Политика хранения по умолчанию: роль -> дней (RETENTION_DAYS_<ROLE>, 0 — бессрочно)
+RETENTION_ROLES = ("free_user", "pro_user", "admin")
+
+
+def default_retention_days() -> Dict[str, int]:
+    policy = {}
+    for role in RETENTION_ROLES:
+        days = int(os.getenv(f"RETENTION_DAYS_{role.upper()}", "0"))
+        if days > 0:
+            policy[role] = days
+    return policy
+
+
+class PurgeJob:
+    """Фоновая задача удаления с прогрессом."""
+
+    def __init__(self, kind: str, owner_id: int, params: Dict):
+        self.id = str(uuid.uuid4())
+        self.kind = kind
+        self.owner_id = owner_id
+        self.params = params
+        self.status = "pending"  # pending | running | completed | failed
+        self.total = 0
+        self.deleted = 0
+        self.failed = 0
+        self.error: Optional[str] = None
+        self.created_at = datetime.utcnow()
+        self.finished_at: Optional[datetime] = None
+
+    def to_dict(self) -> Dict:
+        return {
+            "id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "params": self.params,
+            "total": self.total,
+            "deleted": self.deleted,
+            "failed": self.failed,
+            "progress": round(self.deleted / self.total, 3) if self.total else (1.0 if self.status == "completed" else 0.0),
+            "error": self.error,
+            "created_at": self.created_at.isoformat(),
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+        }
+
+
+_jobs: "OrderedDict[str, PurgeJob]" = OrderedDict()
+_jobs_lock = threading.Lock()
+
+
+def get_job(job_id: str) -> Optional[PurgeJob]:
+    with _jobs_lock:
+        return _jobs.get(job_id)
+
+
+def list_jobs() -> List[PurgeJob]:
+    with _jobs_lock:
+        return list(reversed(_jobs.values()))
+
+
+def start_job(kind: str, owner_id: int, params: Dict, target: Callable[[Session, PurgeJob], None]) -> PurgeJob:
+    """Запускает target(db, job) в фоновом потоке со своей сессией БД."""
+    job = PurgeJob(kind, owner_id, params)
+    with _jobs_lock:
+        _jobs[job.id] = job
+        while len(_jobs) > PURGE_JOB_HISTORY:
+            _jobs.popitem(last=False)
+
+    def run() -> None:
+        job.status = "running"
+        db = SessionLocal()
+        try:
+            target(db, job)
+            job.status = "completed"
+        except Exception as e:
+            logger.error(f"❌ Задача удаления {job.id} ({kind}) завершилась ошибкой: {e}", exc_info=True)
+            job.status = "failed"
+            job.error = str(e)
+        finally:
+            job.finished_at = datetime.utcnow()
+            db.close()
+        logger.info(f"Задача удаления {job.id} ({kind}): {job.status}, удалено {job.deleted}")
+
+    threading.Thread(target=run, name=f"purge-{kind}", daemon=True).start()
+    return job
+
+
+class PurgeService:
+
+    @staticmethod
+    def delete_matching(db: Session, query: Query, job: Optional[PurgeJob] = None) -> int:
+        """
+        Удаляет все изображения запроса порциями. Возвращает число удалённых записей.
+        Записи, объекты S3 которых удалить не удалось, остаются в БД для повтора.
+        """
+        id_query = query.with_entities(
+            ImageModel.id, ImageModel.filename, ImageModel.s3_key, ImageModel.user_id,
+            ImageModel.created_at, ImageModel.processed, ImageModel.detected_count,
+            ImageModel.file_size, ImageModel.processing_ms,
+        )
+        if job is not None:
+            job.total += query.order_by(None).count()
+
+        deleted_total = 0
+        last_id = 0
+        while True:
+            rows = (
+                id_query.filter(ImageModel.id > last_id)
+                .order_by(ImageModel.id)
+                .limit(PURGE_CHUNK_SIZE)
+                .all()
+            )
+            if not rows:
+                break
+            last_id = rows[-1].id
+
+            failed_keys = set(StorageService.delete_files(row.s3_key for row in rows))
+            removed = []
+            for row in rows:
+                if row.s3_key in failed_keys:
+                    continue
+                remove_local_files(row.filename)
+                removed.append(row)
+            ids = [row.id for row in removed]
+
+            if ids:
+                db.execute(delete(ImageModel).where(ImageModel.id.in_(ids)))
+                StatsRepository(db).record_images(removed, sign=-1)
+                db.commit()
+            deleted_total += len(ids)
+            if job is not None:
+                job.deleted += len(ids)
+                job.failed += len(rows) - len(ids)
+
+        return deleted_total
+
+    @staticmethod
+    def delete_by_ids(db: Session, current_user, ids: List[int]) -> int:
+        """Удаление по списку id (admin — любые, пользователь — только свои)."""
+        query = db.query(ImageModel).filter(ImageModel.id.in_(ids))
+        if getattr(current_user, "role", "user") != "admin":
+            query = query.filter(ImageModel.user_id == current_user.id)
+        return PurgeService.delete_matching(db, query)
+
+    @staticmethod
+    def retention_query(db: Session, role: str, days: int) -> Query:
+        """Изображения пользователей роли, загруженные раньше чем days дней назад."""
+        cutoff = datetime.utcnow() - timedelta(days=days)
+        role_users = select(User.id).where(User.role == role)
+        return db.query(ImageModel).filter(
+            ImageModel.user_id.in_(role_users),
+            ImageModel.created_at < cutoff,
+        )
+
+    @staticmethod
+    def purge_retention(db: Session, policy: Dict[str, int], job: Optional[PurgeJob] = None) -> int:
+        """Применяет политику хранения {роль: дней}. Возвращает число удалённых записей."""
+        deleted = 0
+        for role, days in policy.items():
+            if days <= 0:
+                continue
+            count = PurgeService.delete_matching(db, PurgeService.retention_query(db, role, days), job)
+            logger.info(f"🧹 Retention {role} > {days} дн.: удалено {count}")
+            deleted += count
+        return deleted
+
+    @staticmethod
+    def delete_user(db: Session, user_id: int, job: Optional[PurgeJob] = None) -> None:
+        """
+        Каскадное удаление пользователя: изображения, объекты S3, refresh tokens,
+        сессии загрузки, ключи идемпотентности, сводка, запись.
+        """
+        PurgeService.delete_matching(db, db.query(ImageModel).filter(ImageModel.user_id == user_id), job)
+        if job is not None and job.failed:
+            raise RuntimeError(f"Не удалось удалить {job.failed} объектов S3, пользователь сохранён")
+
+        # Объекты под префиксом пользователя без записи в БД (например, после сбоя загрузки)
+        try:
+            StorageService.delete_prefix(f"{user_id}/")
+        except Exception as e:
+            logger.warning(f"Не удалось очистить префикс S3 пользователя {user_id}: {e}")
+
+        from .upload_session_service import part_path
+
+        role = db.query(User.role).filter(User.id == user_id).scalar()
+        session_ids = [row.id for row in db.query(UploadSession.id).filter(UploadSession.user_id == user_id)]
+        db.execute(delete(RefreshToken).where(RefreshToken.user_id == user_id))
+        db.execute(delete(UploadSession).where(UploadSession.user_id == user_id))
+        db.execute(delete(IdempotencyKey).where(IdempotencyKey.user_id == user_id))
+        db.execute(delete(UsageDaily).where(UsageDaily.user_id == user_id))
+        if db.execute(delete(User).where(User.id == user_id)).rowcount:
+            StatsRepository(db).record_user(role, sign=-1)
+        db.commit()
+        for session_id in session_ids:
+            part_path(session_id).unlink(missing_ok=True)
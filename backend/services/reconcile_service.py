@@ -0,0 +1,128 @@
+"""
+Сверка UPLOADS_DIR, бакета S3 и таблицы images после сбоев загрузки
+(python manage.py reconcile, для cron):
+
+  - объекты S3 без записи — удаляются пакетами DeleteObjects;
+  - локальные файлы без записи (оригиналы, результаты, недописанные .tmp) —
+    удаляются; оригинал processed_{stem} считается используемым записью;
+  - запись, объекта S3 которой нет, но локальный файл сохранился, — файл
+    загружается в S3 заново под тем же ключом;
+  - запись без объекта S3 и без локального файла — удаляется вместе со
+    счётчиками статистики (через PurgeService);
+  - просроченные ключи идемпотентности и брошенные сессии загрузки.
+
+Бакет читается постранично ListObjectsV2 (1000 ключей за запрос), а не HEAD
+на каждую запись. Трогается только то, что старше RECONCILE_GRACE_MINUTES:
+загрузка, идущая прямо сейчас, ещё не успела записать строку в БД.
+Если S3 недоступен, сверяются только локальные файлы и записи без s3_key.
+"""
+import logging
+import os
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Dict, Optional
+
+from sqlalchemy.orm import Session
+
+from core import UPLOADS_DIR
+from models.image import Image as ImageModel
+from .encoder_service import content_type_for
+from .idempotency import IdempotencyService
+from .purge_service import PurgeService
+from .storage_service import StorageService
+from .upload_session_service import UploadSessionService
+
+logger = logging.getLogger(__name__)
+
+RECONCILE_GRACE_MINUTES = int(os.getenv("RECONCILE_GRACE_MINUTES", "60"))
+
+
+def _file_stem(filename: str) -> str:
+    """Общая часть имён оригинала и результата: {stem}.png и processed_{stem}.jpg."""
+    return Path(filename).stem.replace("processed_", "", 1)
+
+
+class ReconcileService:
+
+    @staticmethod
+    def run(db: Session, dry_run: bool = False, grace_minutes: Optional[int] = None) -> Dict[str, int]:
+        """Находит и (без dry_run) исправляет расхождения. Возвращает счётчики по видам."""
+        now = datetime.utcnow()
+        grace = timedelta(minutes=RECONCILE_GRACE_MINUTES if grace_minutes is None else grace_minutes)
+        cutoff = now - grace
+        report = {
+            "s3_listed": 0,
+            "s3_orphans": 0,
+            "local_orphans": 0,
+            "reuploaded": 0,
+            "dangling_rows": 0,
+            "expired_upload_sessions": 0,
+            "expired_idempotency_keys": 0,
+        }
+
+        rows = db.query(
+            ImageModel.id, ImageModel.filename, ImageModel.s3_key, ImageModel.updated_at,
+        ).all()
+        referenced_keys = {row.s3_key for row in rows if row.s3_key}
+        referenced_stems = {_file_stem(row.filename) for row in rows}
+
+        try:
+            s3_objects = {key: modified for key, modified, _ in StorageService.list_objects()}
+            report["s3_listed"] = len(s3_objects)
+        except Exception as e:
+            logger.warning(f"S3 недоступен, сверка бакета пропущена: {e}")
+            s3_objects = None
+
+        # Объекты S3 без записи
+        if s3_objects is not None:
+            cutoff_aware = cutoff.replace(tzinfo=timezone.utc)
+            orphan_keys = [
+                key for key, modified in s3_objects.items()
+                if key not in referenced_keys and modified < cutoff_aware
+            ]
+            failed = [] if dry_run else StorageService.delete_files(orphan_keys)
+            report["s3_orphans"] = len(orphan_keys) - len(failed)
+
+        # Записи, указывающие на отсутствующие объекты
+        dangling = []
+        for row in rows:
+            if row.updated_at and row.updated_at >= cutoff:
+                continue
+            local_path = UPLOADS_DIR / row.filename
+            if not row.s3_key:
+                if not local_path.exists():
+                    dangling.append(row.id)
+                continue
+            if s3_objects is None or row.s3_key in s3_objects:
+                continue
+            if not local_path.exists():
+                dangling.append(row.id)
+                continue
+            if not dry_run:
+                try:
+                    StorageService.upload_file(str(local_path), row.s3_key, content_type_for(row.filename))
+                except Exception as e:
+                    logger.error(f"Не удалось восстановить объект S3 {row.s3_key}: {e}")
+                    continue
+            report["reuploaded"] += 1
+
+        if dangling:
+            report["dangling_rows"] = len(dangling) if dry_run else PurgeService.delete_matching(
+                db, db.query(ImageModel).filter(ImageModel.id.in_(dangling))
+            )
+
+        # Локальные файлы без записи; служебные (.partial, кольцо кадров) начинаются с точки
+        stale_before = cutoff.replace(tzinfo=timezone.utc).timestamp()
+        for path in UPLOADS_DIR.iterdir():
+            if path.name.startswith(".") or not path.is_file():
+                continue
+            if _file_stem(path.name) in referenced_stems or path.stat().st_mtime >= stale_before:
+                continue
+            if not dry_run:
+                path.unlink(missing_ok=True)
+            report["local_orphans"] += 1
+
+        report["expired_upload_sessions"] = UploadSessionService.expire(db, now, dry_run)
+        report["expired_idempotency_keys"] = IdempotencyService.purge_expired(db, now, dry_run)
+        logger.info(f"Сверка хранилища{' (dry run)' if dry_run else ''}: {report}")
+        return report
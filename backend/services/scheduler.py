@@ -0,0 +1,248 @@
+"""
+Планировщик обработки изображений.
+
+Обработка выполняется не более чем в SCHEDULER_CONCURRENCY слотах
+(по умолчанию — число процессов пула инференса или ядер). Свободный слот
+выдаётся так:
+  - между классами (ролями) — взвешенная справедливая очередь (stride
+    scheduling): класс с весом 4 получает вчетверо больше слотов, чем класс
+    с весом 1, пока оба имеют очередь; простаивающий класс не копит кредит;
+  - внутри класса — по кругу между пользователями: пакет из 500 загрузок
+    одного пользователя обрабатывается по одной задаче за оборот, остальные
+    пользователи класса не ждут его окончания.
+
+Ожидающие задачи периодически проверяют, подключён ли клиент. Для
+отключившихся SCHEDULER_DISCONNECT_POLICY=drop снимает задачу с очереди,
+defer — переносит в фоновый класс, обслуживаемый только при отсутствии
+другой работы (запись об изображении будет создана позже). Задачи, ждущие
+дольше SCHEDULER_MAX_WAIT секунд, снимаются с ошибкой.
+
+Состояние планировщика — на процесс (HTTP-воркер).
+"""
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from typing import Callable, Deque, Dict, Iterator, Optional
+
+from core import metrics
+
+logger = logging.getLogger(__name__)
+
+SCHEDULER_ENABLED = os.getenv("SCHEDULER_ENABLED", "true").lower() == "true"
+SCHEDULER_CONCURRENCY = int(os.getenv("SCHEDULER_CONCURRENCY", "0"))
+SCHEDULER_WEIGHTS = os.getenv("SCHEDULER_WEIGHTS", "admin:8,pro_user:4,free_user:1")
+SCHEDULER_MAX_WAIT = float(os.getenv("SCHEDULER_MAX_WAIT", "120"))  # 0 — без ограничения
+SCHEDULER_DISCONNECT_POLICY = os.getenv("SCHEDULER_DISCONNECT_POLICY", "drop").lower()  # drop | defer
+SCHEDULER_POLL_INTERVAL = float(os.getenv("SCHEDULER_POLL_INTERVAL", "0.5"))
+
+# Класс для задач отключившихся клиентов (политика defer)
+DEFERRED = "deferred"
+# Вес класса для ролей, отсутствующих в SCHEDULER_WEIGHTS
+DEFAULT_WEIGHT = 1.0
+
+
+def parse_weights(value: str) -> Dict[str, float]:
+    """'admin:8,pro_user:4' -> {'admin': 8.0, 'pro_user': 4.0}"""
+    weights = {}
+    for item in value.split(","):
+        name, _, weight = item.strip().partition(":")
+        if name:
+            weights[name] = max(float(weight or DEFAULT_WEIGHT), 0.001)
+    return weights
+
+
+class SchedulingError(Exception):
+    """Задача снята с очереди: reason = disconnected | timeout."""
+
+    def __init__(self, reason: str, waited: float):
+        super().__init__(f"Задача снята с очереди обработки ({reason}) через {waited:.1f} с")
+        self.reason = reason
+        self.waited = waited
+
+
+class _Ticket:
+    __slots__ = ("user_id", "priority_class", "enqueued_at", "event", "granted")
+
+    def __init__(self, user_id: int, priority_class: str):
+        self.user_id = user_id
+        self.priority_class = priority_class
+        self.enqueued_at = time.monotonic()
+        self.event = threading.Event()
+        self.granted = False
+
+
+class ProcessingScheduler:
+    """Слоты обработки с WFQ между ролями и round robin между пользователями."""
+
+    def __init__(
+            self,
+            concurrency: int = SCHEDULER_CONCURRENCY,
+            weights: Optional[Dict[str, float]] = None,
+            max_wait: float = SCHEDULER_MAX_WAIT,
+            disconnect_policy: str = SCHEDULER_DISCONNECT_POLICY,
+    ):
+        self._concurrency = concurrency
+        self.weights = weights if weights is not None else parse_weights(SCHEDULER_WEIGHTS)
+        self.max_wait = max_wait
+        self.disconnect_policy = disconnect_policy
+        self.running = 0
+        # класс -> пользователь -> очередь задач; порядок пользователей — круг обхода
+        self._queues: Dict[str, "OrderedDict[int, Deque[_Ticket]]"] = {}
+        self._queued: Dict[str, int] = {}
+        # Виртуальное время классов (stride scheduling)
+        self._pass: Dict[str, float] = {}
+        self._virtual_time = 0.0
+        self._lock = threading.Lock()
+
+        for priority_class in list(self.weights) + [DEFERRED]:
+            self._register_class(priority_class)
+
+    @property
+    def concurrency(self) -> int:
+        """Число слотов; по умолчанию — размер пула инференса этого воркера или число ядер."""
+        if self._concurrency > 0:
+            return self._concurrency
+        from services.inference_pool import inference_pool
+        return inference_pool.workers if inference_pool.enabled else (os.cpu_count() or 1)
+
+    def _register_class(self, priority_class: str) -> None:
+        self._queues[priority_class] = OrderedDict()
+        self._queued[priority_class] = 0
+        self._pass[priority_class] = 0.0
+        metrics.SCHEDULER_QUEUE_DEPTH.set_function(
+            lambda c=priority_class: self._queued[c], priority_class=priority_class
+        )
+
+    def queued(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._queued)
+
+    @contextmanager
+    def slot(
+            self,
+            user_id: int,
+            role: str,
+            is_cancelled: Optional[Callable[[], bool]] = None,
+    ) -> Iterator[None]:
+        """Ожидание слота обработки. Бросает SchedulingError, если задача снята с очереди."""
+        if not SCHEDULER_ENABLED:
+            yield
+            return
+        self._acquire(user_id, role, is_cancelled)
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.running -= 1
+                self._dispatch()
+
+    def _acquire(self, user_id: int, role: str, is_cancelled: Optional[Callable[[], bool]]) -> None:
+        with self._lock:
+            if role not in self._queues:
+                self._register_class(role)
+            # Свободный слот и пустая очередь — без ожидания
+            if self.running < self.concurrency and not any(self._queued.values()):
+                self.running += 1
+                metrics.SCHEDULER_WAIT_SECONDS.observe(0.0, priority_class=role)
+                return
+            ticket = _Ticket(user_id, role)
+            self._enqueue(ticket)
+            self._dispatch()
+
+        while not ticket.event.wait(SCHEDULER_POLL_INTERVAL):
+            waited = time.monotonic() - ticket.enqueued_at
+            if ticket.priority_class != DEFERRED and is_cancelled is not None and _safe_call(is_cancelled):
+                if self.disconnect_policy == "defer":
+                    self._defer(ticket)
+                    continue
+                self._drop(ticket, "disconnected", waited)
+            if self.max_wait and waited > self.max_wait and ticket.priority_class != DEFERRED:
+                self._drop(ticket, "timeout", waited)
+
+        metrics.SCHEDULER_WAIT_SECONDS.observe(
+            time.monotonic() - ticket.enqueued_at, priority_class=role
+        )
+
+    def _enqueue(self, ticket: _Ticket) -> None:
+        users = self._queues[ticket.priority_class]
+        if not users:
+            # Класс вернулся из простоя: начинает с текущего виртуального времени
+            self._pass[ticket.priority_class] = max(self._pass[ticket.priority_class], self._virtual_time)
+        users.setdefault(ticket.user_id, deque()).append(ticket)
+        self._queued[ticket.priority_class] += 1
+
+    def _remove(self, ticket: _Ticket) -> bool:
+        users = self._queues[ticket.priority_class]
+        queue = users.get(ticket.user_id)
+        if queue is None or ticket not in queue:
+            return False
+        queue.remove(ticket)
+        if not queue:
+            del users[ticket.user_id]
+        self._queued[ticket.priority_class] -= 1
+        return True
+
+    def _defer(self, ticket: _Ticket) -> None:
+        with self._lock:
+            if ticket.granted or not self._remove(ticket):
+                return
+            metrics.SCHEDULER_DROPPED.inc(priority_class=ticket.priority_class, reason="deferred")
+            ticket.priority_class = DEFERRED
+            self._enqueue(ticket)
+
+    def _drop(self, ticket: _Ticket, reason: str, waited: float) -> None:
+        with self._lock:
+            if ticket.granted:
+                # Слот выдан одновременно с отменой — возвращаем его следующей задаче
+                self.running -= 1
+                self._dispatch()
+            else:
+                self._remove(ticket)
+        metrics.SCHEDULER_DROPPED.inc(priority_class=ticket.priority_class, reason=reason)
+        logger.info(f"Задача пользователя {ticket.user_id} снята с очереди: {reason}, ожидание {waited:.1f} с")
+        raise SchedulingError(reason, waited)
+
+    def _dispatch(self) -> None:
+        """Выдаёт свободные слоты ожидающим задачам (вызывается под блокировкой)."""
+        while self.running < self.concurrency:
+            ticket = self._next_ticket()
+            if ticket is None:
+                return
+            self.running += 1
+            ticket.granted = True
+            ticket.event.set()
+
+    def _next_ticket(self) -> Optional[_Ticket]:
+        active = [c for c, users in self._queues.items() if users and c != DEFERRED]
+        if active:
+            priority_class = min(active, key=lambda c: self._pass[c])
+            self._virtual_time = self._pass[priority_class]
+            self._pass[priority_class] += 1.0 / self.weights.get(priority_class, DEFAULT_WEIGHT)
+        elif self._queues[DEFERRED]:
+            priority_class = DEFERRED
+        else:
+            return None
+
+        users = self._queues[priority_class]
+        user_id, queue = next(iter(users.items()))
+        ticket = queue.popleft()
+        # Пользователь уходит в конец круга (или из очереди, если задач больше нет)
+        del users[user_id]
+        if queue:
+            users[user_id] = queue
+        self._queued[priority_class] -= 1
+        return ticket
+
+
+def _safe_call(check: Callable[[], bool]) -> bool:
+    try:
+        return bool(check())
+    except Exception:
+        return False
+
+
+# Глобальный экземпляр
+processing_scheduler = ProcessingScheduler()
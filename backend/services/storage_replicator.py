@@ -0,0 +1,181 @@
+"""
+Фоновая репликация локальных файлов в объектное хранилище.
+
+Пока хранилище недоступно, загрузки сохраняются только локально (s3_key =
+None, ссылка /uploads/). Репликатор раз в STORAGE_REPLICATION_INTERVAL
+секунд:
+
+  1. если цепь хранилища разомкнута — проверяет его одним пробным вызовом
+     (восстановление обнаруживается в фоне, а не первым запросом пользователя);
+  2. загружает файлы записей без s3_key порциями по STORAGE_REPLICATION_BATCH
+     под ключом "<user_id>/<filename>";
+  3. проставляет s3_key условным UPDATE — только если запись не изменилась
+     за время загрузки (повторная обработка, удаление).
+
+Проход прерывается, как только хранилище снова перестаёт отвечать. Ошибка
+загрузки при рабочем хранилище увеличивает replication_attempts записи;
+после STORAGE_REPLICATION_MAX_ATTEMPTS запись больше не выбирается. Запись,
+локальный файл которой пропал, помечается сразу — её удаляет
+python manage.py reconcile. Новый файл при повторной обработке сбрасывает
+счётчик. При WEB_WORKERS > 1 репликатор работает в каждом
+воркере: одна запись может быть загружена дважды под тем же ключом, что
+безопасно.
+"""
+import logging
+import os
+import threading
+from datetime import datetime
+from typing import Dict, Optional
+
+from sqlalchemy import func, update
+
+from core import UPLOADS_DIR, SessionLocal, metrics
+from models.image import Image as ImageModel
+from .encoder_service import content_type_for
+from .storage_service import StorageService, StorageUnavailable
+
+logger = logging.getLogger(__name__)
+
+STORAGE_REPLICATOR_ENABLED = os.getenv("STORAGE_REPLICATOR_ENABLED", "true").lower() == "true"
+STORAGE_REPLICATION_INTERVAL = float(os.getenv("STORAGE_REPLICATION_INTERVAL", "30"))
+STORAGE_REPLICATION_BATCH = int(os.getenv("STORAGE_REPLICATION_BATCH", "100"))
+# Неудачных загрузок записи, после которых репликатор её пропускает
+STORAGE_REPLICATION_MAX_ATTEMPTS = int(os.getenv("STORAGE_REPLICATION_MAX_ATTEMPTS", "5"))
+
+
+class StorageReplicator:
+
+    def __init__(self, interval: float = STORAGE_REPLICATION_INTERVAL,
+                 batch_size: int = STORAGE_REPLICATION_BATCH,
+                 enabled: bool = STORAGE_REPLICATOR_ENABLED):
+        self.interval = interval
+        self.batch_size = batch_size
+        self.enabled = enabled
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        """Запускает фоновый поток (только для сетевого бэкенда: у локального нечего догружать)."""
+        if not self.enabled or not StorageService.backend.remote or self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name="storage-replicator", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def pending(self) -> Dict[str, int]:
+        """Записи, хранящиеся только локально: в очереди репликации и исчерпавшие попытки."""
+        db = SessionLocal()
+        try:
+            given_up = ImageModel.replication_attempts >= STORAGE_REPLICATION_MAX_ATTEMPTS
+            counts = dict(
+                db.query(given_up, func.count(ImageModel.id))
+                .filter(ImageModel.s3_key.is_(None))
+                .group_by(given_up)
+                .all()
+            )
+            return {"queued": counts.get(False, 0), "failed": counts.get(True, 0)}
+        finally:
+            db.close()
+
+    def run_once(self) -> Dict[str, int]:
+        """
+        Один проход репликации. Возвращает счётчики: replicated, skipped (запись
+        изменилась за время загрузки), missing (нет локального файла), failed.
+        """
+        result = {"replicated": 0, "skipped": 0, "missing": 0, "failed": 0}
+        if not StorageService.healthy() and not StorageService.is_available():
+            return result
+
+        db = SessionLocal()
+        try:
+            last_id = 0
+            while not self._stop.is_set():
+                rows = (
+                    db.query(
+                        ImageModel.id, ImageModel.user_id, ImageModel.filename, ImageModel.replication_attempts,
+                    )
+                    .filter(
+                        ImageModel.s3_key.is_(None),
+                        ImageModel.replication_attempts < STORAGE_REPLICATION_MAX_ATTEMPTS,
+                        ImageModel.id > last_id,
+                    )
+                    .order_by(ImageModel.id)
+                    .limit(self.batch_size)
+                    .all()
+                )
+                if not rows:
+                    break
+                last_id = rows[-1].id
+                for row in rows:
+                    outcome = self._replicate(db, row)
+                    if outcome is None:
+                        return result
+                    if outcome in ("missing", "failed"):
+                        self._record_failure(db, row, outcome)
+                    result[outcome] += 1
+                    metrics.STORAGE_REPLICATED.inc(result=outcome)
+        finally:
+            db.close()
+            if result["replicated"] or result["failed"]:
+                logger.info(f"Репликация в {StorageService.backend.name}: {result}")
+        return result
+
+    def _replicate(self, db, row) -> Optional[str]:
+        """Загружает файл записи; None — хранилище недоступно, проход прерывается."""
+        local_path = UPLOADS_DIR / row.filename
+        if not local_path.exists():
+            return "missing"
+        key = f"{row.user_id}/{row.filename}"
+        try:
+            StorageService.upload_file(str(local_path), key, content_type_for(row.filename))
+        except StorageUnavailable:
+            return None
+        except Exception as e:
+            logger.warning(f"Репликация {row.filename} не удалась: {e}")
+            return "failed" if StorageService.healthy() else None
+
+        updated = db.execute(
+            update(ImageModel)
+            .where(ImageModel.id == row.id, ImageModel.s3_key.is_(None), ImageModel.filename == row.filename)
+            .values(s3_key=key, updated_at=datetime.utcnow())
+        ).rowcount
+        db.commit()
+        # Объект изменившейся записи остаётся без ссылки — его удалит reconcile
+        return "replicated" if updated else "skipped"
+
+    @staticmethod
+    def _record_failure(db, row, outcome: str) -> None:
+        """Считает неудачную попытку; запись без локального файла исключается сразу."""
+        attempts = (
+            STORAGE_REPLICATION_MAX_ATTEMPTS if outcome == "missing"
+            else ImageModel.replication_attempts + 1
+        )
+        db.execute(
+            update(ImageModel)
+            .where(ImageModel.id == row.id, ImageModel.filename == row.filename)
+            .values(replication_attempts=attempts)
+        )
+        db.commit()
+        if outcome == "missing":
+            logger.warning(f"Репликация {row.filename} пропущена: нет локального файла (удалит reconcile)")
+        elif row.replication_attempts + 1 >= STORAGE_REPLICATION_MAX_ATTEMPTS:
+            logger.warning(
+                f"Репликация {row.filename} прекращена после {STORAGE_REPLICATION_MAX_ATTEMPTS} попыток"
+            )
+
+    def _loop(self) -> None:
+        while not self._stop.wait(self.interval):
+            try:
+                self.run_once()
+            except Exception as e:
+                logger.error(f"Ошибка репликации хранилища: {e}", exc_info=True)
+
+
+# Глобальный экземпляр (поток запускается в lifespan приложения)
+storage_replicator = StorageReplicator()
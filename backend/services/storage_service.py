@@ -1,15 +1,36 @@
+"""
+Объектное хранилище изображений. StorageService — фасад, через который
+работают сервисы; сами операции выполняет бэкенд, выбранный STORAGE_BACKEND:
+
+  - s3     — S3-совместимое хранилище (MinIO), по умолчанию;
+  - local  — каталог STORAGE_LOCAL_DIR, раздаётся как /uploads/objects/ —
+             для развёртываний без S3;
+  - memory — словарь в памяти процесса (бенчмарки, отладка).
+
+Вызовы сетевого бэкенда идут через circuit breaker: после нескольких сбоев
+подряд хранилище считается недоступным, и операции завершаются сразу
+(StorageUnavailable), без попытки соединения с повторами boto3. Загрузка при
+этом сохраняет изображение локально (s3_key = None), ссылки ведут на
+/uploads/, а StorageReplicator догружает такие файлы, когда хранилище
+снова отвечает.
+"""
 import logging
 import os
-from typing import Optional
+import shutil
+import threading
+from abc import ABC, abstractmethod
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import BinaryIO, Dict, Iterable, Iterator, List, Tuple
 
-import boto3
-from botocore.config import Config
-from botocore.exceptions import ClientError
-
-from core import S3_ENDPOINT, S3_PUBLIC_ENDPOINT, S3_ACCESS_KEY, S3_SECRET_KEY, S3_BUCKET
+from core import (UPLOADS_DIR, S3_ENDPOINT, S3_PUBLIC_ENDPOINT, S3_ACCESS_KEY, S3_SECRET_KEY, S3_BUCKET,
+                  metrics)
+from core.circuit_breaker import CLOSED, STATE_CODES, CircuitBreaker
 
 logger = logging.getLogger(__name__)
 
+# boto3/botocore импортируются при создании клиента, а не при старте приложения
+
 PRESIGNED_URL_EXPIRE = 3600  # 1 час
 
 # Допустимые типы файлов и максимальный размер
@@ -19,51 +40,110 @@ ALLOWED_CONTENT_TYPES = {
 }
 MAX_FILE_SIZE = 10 * 1024 * 1024  # 10 МБ
 
+# Максимум ключей в одном запросе DeleteObjects (ограничение S3 API)
+DELETE_BATCH_SIZE = 1000
 
-class StorageService:
-    """Сервис для работы с S3-совместимым объектным хранилищем (MinIO)."""
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "s3").lower()
+STORAGE_LOCAL_DIR = Path(os.getenv("STORAGE_LOCAL_DIR", str(UPLOADS_DIR / "objects")))
+# URL, под которым раздаётся STORAGE_LOCAL_DIR (по умолчанию — через /uploads)
+STORAGE_LOCAL_URL = os.getenv("STORAGE_LOCAL_URL", "/uploads/objects").rstrip("/")
+# Таймауты и попытки boto3: недоступный S3 обнаруживается за секунды, а не десятки секунд
+S3_CONNECT_TIMEOUT = float(os.getenv("S3_CONNECT_TIMEOUT", "2"))
+S3_READ_TIMEOUT = float(os.getenv("S3_READ_TIMEOUT", "30"))
+S3_MAX_ATTEMPTS = int(os.getenv("S3_MAX_ATTEMPTS", "2"))
 
-    _internal_client: Optional[boto3.client] = None
-    _public_client: Optional[boto3.client] = None
 
-    @classmethod
-    def _get_internal_client(cls):
+class StorageUnavailable(Exception):
+    """Хранилище недоступно (цепь разомкнута) — операция не выполнялась."""
+
+
+class StorageBackend(ABC):
+    """Операции хранилища; ключ — "<user_id>/<filename>"."""
+
+    name = "base"
+    # Сетевой бэкенд: вызовы идут через circuit breaker
+    remote = False
+
+    @abstractmethod
+    def put_file(self, local_path: str, key: str, content_type: str) -> None: ...
+
+    @abstractmethod
+    def put_fileobj(self, fileobj: BinaryIO, key: str, content_type: str) -> None: ...
+
+    @abstractmethod
+    def url(self, key: str, expire: int) -> str:
+        """Ссылка на объект для браузера (без обращения к хранилищу)."""
+
+    @abstractmethod
+    def delete_many(self, keys: List[str]) -> List[str]:
+        """Удаляет объекты; возвращает ключи, которые удалить не удалось."""
+
+    @abstractmethod
+    def list(self, prefix: str) -> Iterator[Tuple[str, datetime, int]]:
+        """Объекты с префиксом: (ключ, время изменения UTC, размер)."""
+
+    @abstractmethod
+    def ping(self) -> None:
+        """Проверка доступности; исключение — хранилище недоступно."""
+
+    def is_outage(self, error: Exception) -> bool:
+        """Ошибка означает недоступность хранилища (а не, например, отсутствие ключа)."""
+        return True
+
+
+class S3Backend(StorageBackend):
+    """S3-совместимое хранилище (MinIO) через boto3."""
+
+    name = "s3"
+    remote = True
+
+    def __init__(self):
+        self._internal_client = None
+        self._public_client = None
+        # head_bucket выполняется один раз, а не перед каждой загрузкой
+        self._bucket_ready = False
+        self._lock = threading.Lock()
+
+    def _client(self, endpoint: str):
+        import boto3
+        from botocore.config import Config
+
+        return boto3.client(
+            "s3",
+            endpoint_url=endpoint,
+            aws_access_key_id=S3_ACCESS_KEY,
+            aws_secret_access_key=S3_SECRET_KEY,
+            region_name="us-east-1",
+            config=Config(
+                signature_version="s3v4",
+                s3={"addressing_style": "path"},  # MinIO требует path-style
+                connect_timeout=S3_CONNECT_TIMEOUT,
+                read_timeout=S3_READ_TIMEOUT,
+                retries={"max_attempts": S3_MAX_ATTEMPTS, "mode": "standard"},
+            ),
+        )
+
+    def internal_client(self):
         """Клиент для внутренних операций (upload, delete) через Docker-сеть."""
-        if cls._internal_client is None:
-            cls._internal_client = boto3.client(
-                "s3",
-                endpoint_url=S3_ENDPOINT,
-                aws_access_key_id=S3_ACCESS_KEY,
-                aws_secret_access_key=S3_SECRET_KEY,
-                region_name="us-east-1",
-                config=Config(
-                    signature_version="s3v4",
-                    s3={"addressing_style": "path"},  # MinIO требует path-style
-                ),
-            )
-        return cls._internal_client
+        with self._lock:
+            if self._internal_client is None:
+                self._internal_client = self._client(S3_ENDPOINT)
+            return self._internal_client
 
-    @classmethod
-    def _get_public_client(cls):
+    def public_client(self):
         """Клиент для генерации pre-signed URL с публичным endpoint (доступен из браузера)."""
-        if cls._public_client is None:
-            cls._public_client = boto3.client(
-                "s3",
-                endpoint_url=S3_PUBLIC_ENDPOINT,
-                aws_access_key_id=S3_ACCESS_KEY,
-                aws_secret_access_key=S3_SECRET_KEY,
-                region_name="us-east-1",
-                config=Config(
-                    signature_version="s3v4",
-                    s3={"addressing_style": "path"},  # MinIO требует path-style
-                ),
-            )
-        return cls._public_client
+        with self._lock:
+            if self._public_client is None:
+                self._public_client = self._client(S3_PUBLIC_ENDPOINT)
+            return self._public_client
 
-    @classmethod
-    def ensure_bucket(cls) -> None:
+    def ensure_bucket(self) -> None:
         """Создаёт бакет, если он не существует."""
-        client = cls._get_internal_client()
+        if self._bucket_ready:
+            return
+        from botocore.exceptions import ClientError
+
+        client = self.internal_client()
         try:
             client.head_bucket(Bucket=S3_BUCKET)
         except ClientError as e:
@@ -76,56 +156,308 @@ class StorageService:
                 raise
         except Exception as e:
             logger.error(f"Не удалось подключиться к S3 ({S3_ENDPOINT}): {e}")
-            # Сбрасываем кеш клиента чтобы пересоздать при следующем вызове
-            cls._internal_client = None
             raise
+        self._bucket_ready = True
+
+    def put_file(self, local_path: str, key: str, content_type: str) -> None:
+        self.ensure_bucket()
+        self.internal_client().upload_file(local_path, S3_BUCKET, key, ExtraArgs={"ContentType": content_type})
+
+    def put_fileobj(self, fileobj: BinaryIO, key: str, content_type: str) -> None:
+        self.ensure_bucket()
+        fileobj.seek(0)
+        self.internal_client().upload_fileobj(fileobj, S3_BUCKET, key, ExtraArgs={"ContentType": content_type})
+
+    def url(self, key: str, expire: int) -> str:
+        return self.public_client().generate_presigned_url(
+            "get_object",
+            Params={"Bucket": S3_BUCKET, "Key": key},
+            ExpiresIn=expire,
+        )
+
+    def delete_many(self, keys: List[str]) -> List[str]:
+        """Один запрос DeleteObjects на каждые 1000 ключей."""
+        client = self.internal_client()
+        failed: List[str] = []
+        for start in range(0, len(keys), DELETE_BATCH_SIZE):
+            batch = keys[start:start + DELETE_BATCH_SIZE]
+            response = client.delete_objects(
+                Bucket=S3_BUCKET,
+                Delete={"Objects": [{"Key": key} for key in batch], "Quiet": True},
+            )
+            errors = response.get("Errors", [])
+            if errors:
+                metrics.S3_ERRORS.inc(len(errors), operation="delete")
+                failed.extend(error["Key"] for error in errors)
+        return failed
+
+    def list(self, prefix: str) -> Iterator[Tuple[str, datetime, int]]:
+        """Страницы ListObjectsV2 по 1000 ключей — один запрос на тысячу объектов."""
+        paginator = self.internal_client().get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=S3_BUCKET, Prefix=prefix):
+            for item in page.get("Contents", []):
+                yield item["Key"], item["LastModified"], item["Size"]
+
+    def ping(self) -> None:
+        self._bucket_ready = False
+        self.ensure_bucket()
+
+    def is_outage(self, error: Exception) -> bool:
+        from botocore.exceptions import BotoCoreError, ClientError
+
+        if isinstance(error, ClientError):
+            # 4xx (нет ключа, нет прав) — хранилище отвечает; 5xx — недоступно
+            status = error.response.get("ResponseMetadata", {}).get("HTTPStatusCode", 500)
+            return status >= 500
+        return isinstance(error, (BotoCoreError, OSError))
+
+
+class LocalBackend(StorageBackend):
+    """Каталог на диске; объекты раздаются StaticFiles (/uploads)."""
+
+    name = "local"
+
+    def __init__(self, root: Path = STORAGE_LOCAL_DIR, base_url: str = STORAGE_LOCAL_URL):
+        self.root = root
+        self.base_url = base_url
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    def _path(self, key: str) -> Path:
+        path = (self.root / key).resolve()
+        if self.root.resolve() not in path.parents:
+            raise ValueError(f"Недопустимый ключ объекта: {key}")
+        return path
+
+    def put_file(self, local_path: str, key: str, content_type: str) -> None:
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        if path.exists() and path.samefile(local_path):
+            # Объект — жёсткая ссылка на этот же файл (rename между ссылками на один inode ничего не делает)
+            return
+        partial = path.with_name(f".{path.name}.tmp")
+        partial.unlink(missing_ok=True)
+        try:
+            # Жёсткая ссылка вместо копии, если файл на той же файловой системе
+            os.link(local_path, partial)
+        except OSError:
+            shutil.copyfile(local_path, partial)
+        os.replace(partial, path)
+
+    def put_fileobj(self, fileobj: BinaryIO, key: str, content_type: str) -> None:
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        partial = path.with_name(f".{path.name}.tmp")
+        fileobj.seek(0)
+        with open(partial, "wb") as f:
+            shutil.copyfileobj(fileobj, f)
+        os.replace(partial, path)
+
+    def url(self, key: str, expire: int) -> str:
+        return f"{self.base_url}/{key}"
+
+    def delete_many(self, keys: List[str]) -> List[str]:
+        failed = []
+        for key in keys:
+            try:
+                self._path(key).unlink(missing_ok=True)
+            except (OSError, ValueError) as e:
+                logger.error(f"Ошибка удаления объекта {key}: {e}")
+                failed.append(key)
+        return failed
+
+    def list(self, prefix: str) -> Iterator[Tuple[str, datetime, int]]:
+        for path in self.root.rglob("*"):
+            if not path.is_file() or path.name.startswith("."):
+                continue
+            key = path.relative_to(self.root).as_posix()
+            if key.startswith(prefix):
+                stat = path.stat()
+                yield key, datetime.fromtimestamp(stat.st_mtime, timezone.utc), stat.st_size
+
+    def ping(self) -> None:
+        if not os.access(self.root, os.W_OK):
+            raise OSError(f"Каталог хранилища недоступен для записи: {self.root}")
+
+
+class MemoryBackend(StorageBackend):
+    """Объекты в памяти процесса: бенчмарки и отладка без S3 и диска."""
+
+    name = "memory"
+
+    def __init__(self):
+        self.objects: Dict[str, Tuple[bytes, str, datetime]] = {}
+        self._lock = threading.Lock()
+
+    def put_file(self, local_path: str, key: str, content_type: str) -> None:
+        with open(local_path, "rb") as f:
+            self.put_fileobj(f, key, content_type)
+
+    def put_fileobj(self, fileobj: BinaryIO, key: str, content_type: str) -> None:
+        fileobj.seek(0)
+        data = fileobj.read()
+        with self._lock:
+            self.objects[key] = (data, content_type, datetime.now(timezone.utc))
+
+    def url(self, key: str, expire: int) -> str:
+        return f"memory://{key}"
+
+    def delete_many(self, keys: List[str]) -> List[str]:
+        with self._lock:
+            for key in keys:
+                self.objects.pop(key, None)
+        return []
+
+    def list(self, prefix: str) -> Iterator[Tuple[str, datetime, int]]:
+        with self._lock:
+            items = [(key, modified, len(data)) for key, (data, _, modified) in self.objects.items()]
+        return iter([item for item in items if item[0].startswith(prefix)])
+
+    def ping(self) -> None:
+        return None
+
+
+BACKENDS = {"s3": S3Backend, "local": LocalBackend, "memory": MemoryBackend}
+
+
+def create_backend(name: str = STORAGE_BACKEND) -> StorageBackend:
+    if name not in BACKENDS:
+        raise ValueError(f"STORAGE_BACKEND должен быть одним из: {', '.join(BACKENDS)}")
+    return BACKENDS[name]()
+
+
+class StorageService:
+    """Фасад хранилища: выбранный бэкенд, circuit breaker и метрики ошибок."""
+
+    backend: StorageBackend = create_backend()
+    breaker = CircuitBreaker("storage")
+
+    @classmethod
+    def use_backend(cls, backend: StorageBackend) -> StorageBackend:
+        """Подменяет бэкенд (бенчмарки, отладка); возвращает прежний. Цепь сбрасывается."""
+        previous, cls.backend = cls.backend, backend
+        cls.breaker = CircuitBreaker("storage")
+        return previous
+
+    @classmethod
+    def healthy(cls) -> bool:
+        """Хранилище считается доступным (цепь не разомкнута); без обращения к нему."""
+        return not cls.backend.remote or cls.breaker.state == CLOSED
+
+    @classmethod
+    def _call(cls, operation: str, fn, *args):
+        """Вызов бэкенда через circuit breaker (для сетевого бэкенда)."""
+        if cls.backend.remote and not cls.breaker.allow():
+            metrics.STORAGE_SHORT_CIRCUITED.inc(operation=operation)
+            raise StorageUnavailable(f"Хранилище {cls.backend.name} недоступно, повтор через "
+                                     f"{cls.breaker.snapshot()['retry_in_seconds']} с")
+        try:
+            result = fn(*args)
+        except Exception as e:
+            metrics.S3_ERRORS.inc(operation=operation)
+            if cls.backend.remote:
+                if cls.backend.is_outage(e):
+                    cls.breaker.record_failure()
+                else:
+                    cls.breaker.record_success()
+            raise
+        if cls.backend.remote:
+            cls.breaker.record_success()
+        return result
+
+    @classmethod
+    def ensure_bucket(cls) -> None:
+        """Проверяет доступность хранилища (для S3 — создаёт бакет, если его нет)."""
+        cls._call("ping", cls.backend.ping)
 
     @classmethod
     def upload_file(cls, local_path: str, s3_key: str, content_type: str = "image/jpeg") -> str:
         """
-        Загружает локальный файл в S3.
+        Загружает локальный файл в хранилище.
         Возвращает s3_key.
         """
-        cls.ensure_bucket()
-        client = cls._get_internal_client()
-        client.upload_file(
-            local_path,
-            S3_BUCKET,
-            s3_key,
-            ExtraArgs={"ContentType": content_type},
-        )
-        logger.info(f"Файл загружен в S3: {s3_key}")
+        cls._call("upload", cls.backend.put_file, local_path, s3_key, content_type)
+        logger.info(f"Файл загружен в {cls.backend.name}: {s3_key}")
+        return s3_key
+
+    @classmethod
+    def upload_fileobj(cls, fileobj: BinaryIO, s3_key: str, content_type: str = "image/jpeg") -> str:
+        """
+        Загружает данные из открытого файлового объекта (например, буфера
+        UploadFile) без промежуточного чтения с диска. Возвращает s3_key.
+        """
+        cls._call("upload", cls.backend.put_fileobj, fileobj, s3_key, content_type)
+        logger.info(f"Файл загружен в {cls.backend.name}: {s3_key}")
         return s3_key
 
     @classmethod
     def get_presigned_url(cls, s3_key: str, expire: int = PRESIGNED_URL_EXPIRE) -> str:
         """
-        Генерирует временный URL для скачивания файла из S3.
-        URL доступен через публичный endpoint (localhost:9000).
+        Временный URL для скачивания файла (для S3 — подпись с публичным
+        endpoint, доступным из браузера). Подпись вычисляется локально.
         """
-        client = cls._get_public_client()
-        url = client.generate_presigned_url(
-            "get_object",
-            Params={"Bucket": S3_BUCKET, "Key": s3_key},
-            ExpiresIn=expire,
-        )
-        return url
+        try:
+            return cls.backend.url(s3_key, expire)
+        except Exception:
+            metrics.S3_ERRORS.inc(operation="presign")
+            raise
 
     @classmethod
     def delete_file(cls, s3_key: str) -> None:
-        """Удаляет файл из S3."""
-        client = cls._get_internal_client()
+        """Удаляет объект; ошибка логируется (объект без записи удалит reconcile)."""
+        failed = cls.delete_files([s3_key])
+        if not failed:
+            logger.info(f"Файл удалён из {cls.backend.name}: {s3_key}")
+
+    @classmethod
+    def delete_files(cls, s3_keys: Iterable[str]) -> List[str]:
+        """
+        Пакетное удаление (S3 — один запрос DeleteObjects на каждые 1000 ключей).
+        Возвращает ключи, которые удалить не удалось.
+        """
+        keys = [key for key in s3_keys if key]
+        if not keys:
+            return []
         try:
-            client.delete_object(Bucket=S3_BUCKET, Key=s3_key)
-            logger.info(f"Файл удалён из S3: {s3_key}")
-        except ClientError as e:
-            logger.error(f"Ошибка удаления файла из S3 ({s3_key}): {e}")
+            failed = cls._call("delete", cls.backend.delete_many, keys)
+        except Exception as e:
+            logger.error(f"Ошибка пакетного удаления из {cls.backend.name} ({len(keys)} ключей): {e}")
+            return keys
+        logger.info(f"Удалено из {cls.backend.name}: {len(keys) - len(failed)} из {len(keys)}")
+        return failed
+
+    @classmethod
+    def delete_prefix(cls, prefix: str) -> int:
+        """Удаляет все объекты с префиксом (например, "<user_id>/"). Возвращает число удалённых."""
+        keys = [key for key, _, _ in cls.list_objects(prefix)]
+        deleted = 0
+        for start in range(0, len(keys), DELETE_BATCH_SIZE):
+            batch = keys[start:start + DELETE_BATCH_SIZE]
+            deleted += len(batch) - len(cls.delete_files(batch))
+        return deleted
+
+    @classmethod
+    def list_objects(cls, prefix: str = "") -> Iterator[Tuple[str, datetime, int]]:
+        """
+        Все объекты с префиксом: (ключ, LastModified, размер). Для S3 — страницы
+        ListObjectsV2 по 1000 ключей, а не HEAD на каждую запись.
+        """
+        return iter(cls._call("list", lambda: list(cls.backend.list(prefix))))
 
     @classmethod
     def is_available(cls) -> bool:
-        """Проверяет доступность S3 хранилища."""
+        """Проверяет доступность хранилища (с обращением к нему, если цепь позволяет)."""
         try:
-            cls._get_internal_client().list_buckets()
+            cls.ensure_bucket()
             return True
         except Exception:
             return False
+
+    @classmethod
+    def status(cls) -> Dict:
+        return {"backend": cls.backend.name, **(cls.breaker.snapshot() if cls.backend.remote else {"state": CLOSED})}
+
+
+metrics.STORAGE_CIRCUIT_STATE.set_function(
+    lambda: STATE_CODES[StorageService.breaker.state] if StorageService.backend.remote else 0,
+    backend=STORAGE_BACKEND,
+)
@@ -0,0 +1,234 @@
+"""
+Возобновляемая загрузка больших файлов частями:
+
+    POST /image/uploads                    — сессия: имя, размер, тип, метод обработки
+    PUT  /image/uploads/{id}?offset=N      — очередная часть (тело запроса — байты)
+    GET  /image/uploads/{id}               — сколько байт уже принято (после обрыва)
+    POST /image/uploads/{id}/complete      — обработка и сохранение, как POST /image/
+
+  - Части пишутся в UPLOADS_DIR/.partial/{id}.part по смещению и сбрасываются
+    на диск (fsync) до того, как received в БД сдвинется: принятые байты
+    переживают перезапуск. Источник истины — received, байты файла за его
+    пределами (часть, не успевшая зафиксироваться) перезаписываются.
+  - Часть с offset != received отклоняется 409 с текущим смещением в
+    заголовке Upload-Offset — клиент продолжает с него.
+  - Завершение идемпотентно: сессия занимает Idempotency-Key
+    "upload-session:{id}", повтор complete возвращает то же изображение.
+  - Брошенные сессии старше UPLOAD_SESSION_TTL_HOURS удаляет
+    python manage.py reconcile.
+"""
+import logging
+import os
+import time
+import uuid
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Callable, Optional, Tuple
+
+from fastapi import HTTPException, UploadFile, status
+from sqlalchemy import update
+from sqlalchemy.orm import Session
+from starlette.datastructures import Headers
+
+from core import UPLOADS_DIR, MAX_FILE_SIZE, FREE_USER_UPLOAD_LIMIT
+from models.upload_session import UploadSession
+from models.user import User
+from .idempotency import IdempotencyService
+from .image_service import ALLOWED_CONTENT_TYPES, ImageService, _validate_process_type
+
+logger = logging.getLogger(__name__)
+
+UPLOAD_SESSIONS_DIR = UPLOADS_DIR / ".partial"
+UPLOAD_SESSIONS_DIR.mkdir(exist_ok=True)
+# Максимальный размер одной части (тело PUT), байт
+UPLOAD_CHUNK_MAX_BYTES = int(os.getenv("UPLOAD_CHUNK_MAX_BYTES", str(8 * 1024 * 1024)))
+UPLOAD_SESSION_TTL_HOURS = int(os.getenv("UPLOAD_SESSION_TTL_HOURS", "24"))
+
+OFFSET_HEADER = "Upload-Offset"
+
+
+def part_path(session_id: str) -> Path:
+    return UPLOAD_SESSIONS_DIR / f"{session_id}.part"
+
+
+def _session_response(session: UploadSession) -> dict:
+    return {
+        "id": session.id,
+        "filename": session.filename,
+        "size": session.size,
+        "offset": session.received,
+        "process_type": session.process_type,
+        "complete": session.received == session.size,
+        "expires_at": (session.updated_at + timedelta(hours=UPLOAD_SESSION_TTL_HOURS)).isoformat(),
+    }
+
+
+class UploadSessionService:
+
+    @staticmethod
+    def create(
+            db: Session,
+            current_user,
+            filename: str,
+            size: int,
+            content_type: str,
+            process_type: str = "blur",
+    ) -> dict:
+        """Новая сессия; тип, размер и квота проверяются сразу, а не после передачи файла."""
+        _validate_process_type(process_type)
+        if content_type not in ALLOWED_CONTENT_TYPES and not content_type.startswith("image/"):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Допустимы только изображения. Получен тип: {content_type}"
+            )
+        if not 0 < size <= MAX_FILE_SIZE:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Размер файла должен быть от 1 байта до {MAX_FILE_SIZE // 1024 // 1024} МБ"
+            )
+        if current_user.role == "free_user":
+            upload_count = db.query(User.upload_count).filter(User.id == current_user.id).scalar() or 0
+            if upload_count >= FREE_USER_UPLOAD_LIMIT:
+                raise HTTPException(
+                    status_code=status.HTTP_403_FORBIDDEN,
+                    detail="Лимит загрузок исчерпан. Перейдите на Pro."
+                )
+
+        session = UploadSession(
+            id=uuid.uuid4().hex,
+            user_id=current_user.id,
+            filename=filename,
+            content_type=content_type,
+            process_type=process_type,
+            size=size,
+            received=0,
+        )
+        part_path(session.id).touch()
+        db.add(session)
+        db.commit()
+        return _session_response(session)
+
+    @staticmethod
+    def status(db: Session, session_id: str, current_user) -> dict:
+        return _session_response(UploadSessionService._get(db, session_id, current_user))
+
+    @staticmethod
+    def append(db: Session, session_id: str, current_user, offset: int, chunk: bytes) -> dict:
+        """Записывает часть по смещению offset; смещение должно совпадать с принятым."""
+        session = UploadSessionService._get(db, session_id, current_user)
+        if offset != session.received:
+            raise UploadSessionService._offset_conflict(session.received)
+        if offset + len(chunk) > session.size:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Данные выходят за объявленный размер файла ({session.size} байт)",
+            )
+
+        with open(part_path(session_id), "r+b") as f:
+            f.seek(offset)
+            f.write(chunk)
+            f.truncate()
+            f.flush()
+            os.fsync(f.fileno())
+
+        # Смещение сдвигается, только если его не сдвинул параллельный запрос
+        moved = db.execute(
+            update(UploadSession)
+            .where(UploadSession.id == session_id, UploadSession.received == offset)
+            .values(received=offset + len(chunk), updated_at=datetime.utcnow())
+        ).rowcount
+        db.commit()
+        db.refresh(session)
+        if not moved:
+            raise UploadSessionService._offset_conflict(session.received)
+        return _session_response(session)
+
+    @staticmethod
+    def complete(
+            db: Session,
+            session_id: str,
+            current_user,
+            is_cancelled: Optional[Callable[[], bool]] = None,
+            upload_id: Optional[str] = None,
+    ) -> Tuple[dict, bool]:
+        """Обработка собранного файла. Возвращает (ответ, повтор ли это завершённой сессии)."""
+        claim, replay = IdempotencyService.begin(db, current_user.id, f"upload-session:{session_id}", session_id)
+        if replay is not None:
+            return replay, True
+
+        try:
+            session = UploadSessionService._get(db, session_id, current_user)
+            if session.received != session.size:
+                raise HTTPException(
+                    status_code=status.HTTP_409_CONFLICT,
+                    detail=f"Загружено {session.received} из {session.size} байт",
+                    headers={OFFSET_HEADER: str(session.received)},
+                )
+            # Поля читаются до обработки: upload_image фиксирует транзакции и сбрасывает объект
+            filename, content_type, process_type, size = (
+                session.filename, session.content_type, session.process_type, session.size
+            )
+        except BaseException:
+            IdempotencyService.abandon(db, claim)
+            raise
+
+        path = part_path(session_id)
+        with open(path, "rb") as f:
+            file = UploadFile(
+                file=f, size=size, filename=filename,
+                headers=Headers({"content-type": content_type}),
+            )
+            result = ImageService.upload_image(
+                file=file,
+                current_user=current_user,
+                db=db,
+                process_type=process_type,
+                is_cancelled=is_cancelled,
+                upload_id=upload_id,
+                idempotency=claim,
+            )
+
+        # Изображение уже записано; сбой здесь оставит сессию до очистки reconcile
+        db.query(UploadSession).filter(UploadSession.id == session_id).delete()
+        db.commit()
+        path.unlink(missing_ok=True)
+        return result, False
+
+    @staticmethod
+    def expire(db: Session, now: Optional[datetime] = None, dry_run: bool = False) -> int:
+        """
+        Удаляет сессии без новых частей дольше UPLOAD_SESSION_TTL_HOURS и файлы
+        .part без сессии. Возвращает число удалённых сессий.
+        """
+        cutoff = (now or datetime.utcnow()) - timedelta(hours=UPLOAD_SESSION_TTL_HOURS)
+        expired = [row.id for row in db.query(UploadSession.id).filter(UploadSession.updated_at < cutoff)]
+        if dry_run:
+            return len(expired)
+
+        if expired:
+            db.query(UploadSession).filter(UploadSession.id.in_(expired)).delete(synchronize_session=False)
+            db.commit()
+        # Файл создаётся до фиксации сессии — свежие файлы без записи не трогаем
+        alive = {row.id for row in db.query(UploadSession.id)}
+        stale_before = time.time() - UPLOAD_SESSION_TTL_HOURS * 3600
+        for path in UPLOAD_SESSIONS_DIR.glob("*.part"):
+            if path.stem not in alive and path.stat().st_mtime < stale_before:
+                path.unlink(missing_ok=True)
+        return len(expired)
+
+    @staticmethod
+    def _get(db: Session, session_id: str, current_user) -> UploadSession:
+        session = db.query(UploadSession).filter(
+            UploadSession.id == session_id, UploadSession.user_id == current_user.id
+        ).first()
+        if session is None:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Сессия загрузки не найдена")
+        return session
+
+    @staticmethod
+    def _offset_conflict(received: int) -> HTTPException:
+        return HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"Ожидается часть со смещения {received}",
+            headers={OFFSET_HEADER: str(received)},
+        )
@@ -1,36 +1,83 @@
-import React, { useState, useEffect } from 'react';
+import React, { useState, useEffect, useCallback } from 'react';
 import axios from 'axios';
 import api from '../api';
-import { AdminUser } from '../types';
+import { AdminUser, AdminUserPage, AdminDashboard } from '../types';
 import './AdminPanel.css';
 
+const PAGE_SIZE = 50;
+
+const formatBytes = (bytes: number): string => {
+  if (bytes < 1024) return `${bytes} Б`;
+  if (bytes < 1024 * 1024) return `${(bytes / 1024).toFixed(1)} КБ`;
+  if (bytes < 1024 * 1024 * 1024) return `${(bytes / 1024 / 1024).toFixed(1)} МБ`;
+  return `${(bytes / 1024 / 1024 / 1024).toFixed(2)} ГБ`;
+};
+
 const AdminPanel: React.FC = () => {
   const [users, setUsers] = useState<AdminUser[]>([]);
+  const [dashboard, setDashboard] = useState<AdminDashboard | null>(null);
+  const [nextCursor, setNextCursor] = useState<number | null>(null);
+  const [search, setSearch] = useState<string>('');
   const [loading, setLoading] = useState<boolean>(true);
+  const [loadingMore, setLoadingMore] = useState<boolean>(false);
   const [message, setMessage] = useState<string>('');
 
+  const handleLoadError = (err: unknown) => {
+    if (axios.isAxiosError(err)) {
+      setMessage(
+        err.response?.status === 403
+          ? 'Доступ запрещён. Недостаточно прав.'
+          : 'Ошибка загрузки пользователей'
+      );
+    } else {
+      setMessage('Ошибка загрузки пользователей');
+    }
+  };
+
+  // Keyset-пагинация: следующая страница запрашивается по id последнего пользователя
+  const fetchUsers = useCallback(async (afterId: number | null, query: string) => {
+    const params: Record<string, string | number> = { limit: PAGE_SIZE };
+    if (afterId !== null) params.after_id = afterId;
+    if (query.trim()) params.search = query.trim();
+    const response = await api.get<AdminUserPage>('/admin/users', { params });
+    return response.data;
+  }, []);
+
+  useEffect(() => {
+    api.get<AdminDashboard>('/admin/dashboard')
+      .then(response => setDashboard(response.data))
+      .catch(() => setDashboard(null));
+  }, []);
+
+  // Поиск с задержкой, чтобы не отправлять запрос на каждый символ
   useEffect(() => {
-    const fetchUsers = async () => {
+    const timer = setTimeout(async () => {
       try {
-        const response = await api.get<AdminUser[]>('/admin/users');
-        setUsers(response.data);
+        const page = await fetchUsers(null, search);
+        setUsers(page.items);
+        setNextCursor(page.next_cursor);
       } catch (err) {
-        if (axios.isAxiosError(err)) {
-          setMessage(
-            err.response?.status === 403
-              ? 'Доступ запрещён. Недостаточно прав.'
-              : 'Ошибка загрузки пользователей'
-          );
-        } else {
-          setMessage('Ошибка загрузки пользователей');
-        }
+        handleLoadError(err);
       } finally {
         setLoading(false);
       }
-    };
+    }, 300);
+    return () => clearTimeout(timer);
+  }, [search, fetchUsers]);
 
-    fetchUsers();
-  }, []);
+  const handleLoadMore = async () => {
+    if (nextCursor === null) return;
+    setLoadingMore(true);
+    try {
+      const page = await fetchUsers(nextCursor, search);
+      setUsers(prev => [...prev, ...page.items]);
+      setNextCursor(page.next_cursor);
+    } catch (err) {
+      handleLoadError(err);
+    } finally {
+      setLoadingMore(false);
+    }
+  };
 
   const handleRoleChange = async (userId: number, newRole: string) => {
     try {
@@ -58,6 +105,35 @@ const AdminPanel: React.FC = () => {
         Список всех пользователей системы. Изменение ролей доступно только администратору.
       </p>
 
+      {dashboard && (
+        <div className="admin-dashboard">
+          <div className="admin-stat">
+            <span className="admin-stat-value">{dashboard.users_total}</span>
+            <span className="admin-stat-label">Пользователей</span>
+          </div>
+          <div className="admin-stat">
+            <span className="admin-stat-value">{dashboard.images_total}</span>
+            <span className="admin-stat-label">Изображений</span>
+          </div>
+          <div className="admin-stat">
+            <span className="admin-stat-value">{dashboard.detections_total}</span>
+            <span className="admin-stat-label">Найдено объектов</span>
+          </div>
+          <div className="admin-stat">
+            <span className="admin-stat-value">{formatBytes(dashboard.storage_bytes)}</span>
+            <span className="admin-stat-label">Хранилище</span>
+          </div>
+        </div>
+      )}
+
+      <input
+        type="search"
+        className="admin-search"
+        placeholder="Поиск по email или username"
+        value={search}
+        onChange={e => setSearch(e.target.value)}
+      />
+
       {message && (
         <div className={`admin-message ${message.startsWith('Ошибка') || message.startsWith('Доступ') ? 'error' : 'success'}`}>
           {message}
@@ -73,6 +149,9 @@ const AdminPanel: React.FC = () => {
               <th>Email</th>
               <th>Username</th>
               <th>Роль</th>
+              <th>Изображений</th>
+              <th>Объектов</th>
+              <th>Объём</th>
               <th>Дата регистрации</th>
               <th>Действие</th>
             </tr>
@@ -87,6 +166,9 @@ const AdminPanel: React.FC = () => {
                 <td>
                   <span className={`role-badge role-${user.role}`}>{user.role}</span>
                 </td>
+                <td>{user.image_count}</td>
+                <td>{user.detections_total}</td>
+                <td>{formatBytes(user.storage_bytes)}</td>
                 <td>{new Date(user.created_at).toLocaleString('ru-RU')}</td>
                 <td>
                   <select
@@ -105,7 +187,16 @@ const AdminPanel: React.FC = () => {
         </table>
       </div>
 
-      <p className="admin-total">Всего пользователей: {users.length}</p>
+      {nextCursor !== null && (
+        <button className="admin-load-more" onClick={handleLoadMore} disabled={loadingMore}>
+          {loadingMore ? 'Загрузка...' : 'Показать ещё'}
+        </button>
+      )}
+
+      <p className="admin-total">
+        Показано: {users.length}
+        {dashboard && !search && ` из ${dashboard.users_total}`}
+      </p>
     </div>
   );
 };
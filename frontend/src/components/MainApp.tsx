@@ -13,7 +13,10 @@ import React, { useState, useEffect, useCallback, lazy, Suspense } from 'react';
 import { useNavigate, useLocation, useSearchParams } from 'react-router-dom';
 import axios, { AxiosError } from 'axios';
 import api, { API_BASE } from '../api';
-import { MainAppProps, ImageData, PaginatedImageResponse, ImageFilters } from '../types';
+import {
+  MainAppProps, ImageData, PaginatedImageResponse, ImageFilters,
+  ProcessingStage, ProcessingProgressEvent, StreamTokenResponse,
+} from '../types';
 import SEOHead from './SEOHead';
 import SecurityWidget from './SecurityWidget';
 import './MainApp.css';
@@ -23,6 +26,16 @@ const AdminPanel = lazy(() => import('./AdminPanel'));
 
 const FREE_USER_LIMIT = 3;
 
+// Подписи этапов обработки из GET /image/events
+const STAGE_LABELS: Record<ProcessingStage, string> = {
+  stored: 'Файл получен',
+  detecting: 'Поиск лиц...',
+  blurring: 'Размытие...',
+  uploaded: 'Сохранение...',
+  done: 'Готово',
+  failed: 'Ошибка',
+};
+
 const DEFAULT_FILTERS: ImageFilters = {
   search: '',
   processed: 'all',
@@ -77,6 +90,7 @@ const MainApp: React.FC<MainAppProps> = ({ user, onLogout }) => {
   const [uploading, setUploading] = useState<boolean>(false);
   const [uploadProgress, setUploadProgress] = useState<number>(0);
   const [uploadMessage, setUploadMessage] = useState<string | null>(null);
+  const [processingStage, setProcessingStage] = useState<ProcessingStage | null>(null);
   const [processingType, setProcessingType] = useState<'blur' | 'pixelate' | 'none'>('blur');
 
   // History state
@@ -178,10 +192,33 @@ const MainApp: React.FC<MainAppProps> = ({ user, onLogout }) => {
     setUploading(true);
     setUploadMessage(null);
     setUploadProgress(0);
+    setProcessingStage(null);
+
+    // Этапы обработки приходят по SSE, пока POST ждёт ответа
+    const uploadId = `${Date.now().toString(36)}-${Math.random().toString(36).slice(2, 10)}`;
+    // В ?token= передаётся короткоживущий токен подписки, а не access token
+    let events: EventSource | null = null;
+    try {
+      const { data: streamToken } = await api.post<StreamTokenResponse>('/image/events/token');
+      const source = new EventSource(
+        `${API_BASE}/image/events?token=${encodeURIComponent(streamToken.token)}`
+      );
+      source.addEventListener('progress', (evt) => {
+        const data: ProcessingProgressEvent = JSON.parse((evt as MessageEvent).data);
+        if (data.upload_id === uploadId) {
+          setProcessingStage(data.stage);
+        }
+      });
+      // Соединение открыто в другой вкладке — не переподключаемся
+      source.addEventListener('replaced', () => source.close());
+      events = source;
+    } catch {
+      // Без подписки загрузка работает, только без этапов обработки
+    }
 
     try {
       const response = await api.post<ImageData>(
-        `/image/?process_type=${processingType}`,
+        `/image/?process_type=${processingType}&upload_id=${uploadId}`,
         formData,
         {
           headers: { 'Content-Type': 'multipart/form-data' },
@@ -234,7 +271,9 @@ const MainApp: React.FC<MainAppProps> = ({ user, onLogout }) => {
       }
       setUploadMessage(msg);
     } finally {
+      events?.close();
       setUploading(false);
+      setProcessingStage(null);
     }
   };
 
@@ -420,7 +459,11 @@ const MainApp: React.FC<MainAppProps> = ({ user, onLogout }) => {
                 aria-label="Прогресс загрузки"
               >
                 <div className="upload-progress-bar" style={{ width: `${uploadProgress}%` }} />
-                <span className="upload-progress-label">{uploadProgress}%</span>
+                <span className="upload-progress-label">
+                  {uploadProgress < 100 || !processingStage
+                    ? `${uploadProgress}%`
+                    : STAGE_LABELS[processingStage]}
+                </span>
               </div>
             )}
 
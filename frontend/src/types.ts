@@ -43,7 +43,27 @@ export interface AdminUser {
   username: string;
   name: string;
   role: string;
+  upload_count: number;
   created_at: string;
+  image_count: number;
+  detections_total: number;
+  storage_bytes: number;
+}
+
+export interface AdminUserPage {
+  items: AdminUser[];
+  limit: number;
+  next_cursor: number | null;
+}
+
+export interface AdminDashboard {
+  users_total: number;
+  users_by_role: Record<string, number>;
+  images_total: number;
+  images_processed: number;
+  detections_total: number;
+  storage_bytes: number;
+  updated_at: string | null;
 }
 
 export interface AuthProps {
@@ -71,6 +91,24 @@ export interface ImageData {
   detected_objects?: DetectedObject[];
   detected_count: number;
   s3_key?: string | null;
+  method?: 'blur' | 'pixelate' | 'none';
+}
+
+export type ProcessingStage = 'stored' | 'detecting' | 'blurring' | 'uploaded' | 'done' | 'failed';
+
+// POST /image/events/token — токен для GET /image/events?token=
+export interface StreamTokenResponse {
+  token: string;
+  expires_in: number;
+}
+
+// Событие progress из GET /image/events (SSE)
+export interface ProcessingProgressEvent {
+  upload_id: string;
+  image_id: number | null;
+  stage: ProcessingStage;
+  elapsed_ms: number;
+  detail?: string;
 }
 
 export interface PaginatedImageResponse {